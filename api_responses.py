@@ -0,0 +1,91 @@
+import json
+
+# orjson is optional; it decodes large history payloads several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Poster fields that can pick up stray quoting from the mapping templates
+URL_FIELDS = ("poster_url", "thumbnail_url", "preview_url")
+
+# Status of the handler errors callers tell apart, for results that arrive without one
+ERROR_STATUS = {"User not found": 404, "Invalid password": 401}
+
+
+def loads(data):
+    """Decodes JSON text or bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _decode_items(items):
+    # Some mapping templates return each list element as its own JSON string
+    decoded = []
+    for item in items:
+        if isinstance(item, (str, bytes)):
+            try:
+                item = loads(item)
+            except ValueError:
+                continue
+        decoded.append(item)
+    return decoded
+
+
+def unwrap(data, status_code=200):
+    """Unwraps a Lambda result into (status_code, payload).
+
+    Non-proxy API Gateway integrations return the handler's whole result, i.e.
+    {"statusCode": 200, "body": "<json text>"}; the inner status replaces the
+    HTTP one and the body is decoded. Plain payloads pass through unchanged.
+    """
+    if isinstance(data, dict) and "body" in data and ("statusCode" in data or isinstance(data["body"], str)):
+        status_code = data.get("statusCode", status_code)
+        data = data["body"]
+        if isinstance(data, (str, bytes)):
+            try:
+                data = loads(data) if data else None
+            except ValueError:
+                data = None
+
+    if isinstance(data, list):
+        data = _decode_items(data)
+    elif isinstance(data, dict) and isinstance(data.get("posters"), list):
+        data["posters"] = _decode_items(data["posters"])
+
+    return status_code, data
+
+
+def decode(response):
+    """Decodes a requests.Response from the User/Poster APIs into (status_code, payload)."""
+    # Embedded (in-process) responses carry the handler's result as it is
+    if hasattr(response, "result"):
+        status_code, data = unwrap(response.result, response.status_code)
+    else:
+        try:
+            data = loads(response.content) if response.content else None
+        except ValueError:
+            return response.status_code, None
+        status_code, data = unwrap(data, response.status_code)
+    if status_code == 200:
+        # Plain JSON results (PLAIN_JSON_RESPONSES=on) have no status of their own
+        status_code = ERROR_STATUS.get(error_message(data), status_code)
+    return status_code, data
+
+
+def error_message(payload):
+    """The API's error text, or None when the payload is not an error."""
+    if isinstance(payload, dict):
+        return payload.get("errorMessage") or payload.get("error")
+    return None
+
+
+def clean_poster_urls(posters):
+    """Strips stray backslashes/quotes that the mapping templates leave around URLs."""
+    for poster in posters:
+        if isinstance(poster, dict):
+            for field in URL_FIELDS:
+                if poster.get(field):
+                    poster[field] = poster[field].strip('\\').strip('"')
+    return posters
@@ -1,22 +1,213 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, make_response
-import requests
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, make_response,
+                   jsonify, stream_with_context, abort, send_file)
+import json
+import mimetypes
 import os
 import hashlib
-import json
+import tempfile
+import time
 from dotenv import load_dotenv
+import requests
+from werkzeug.exceptions import NotFound
+
+import api_responses
+import assets
+import auth
+import backend_client
+import caching
+import embedded
+import export
+import image_cache
+import instrumentation
+import jobs
+import metrics
+import rate_limit
+import sessions
+from instrumentation import log_payload, logger
+from lambda_functions import prompt_policy
 
 load_dotenv()
 
 from datetime import timedelta
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
-app.permanent_session_lifetime = timedelta(hours=1)
+# Every worker and node must sign cookies with the same key, or a user whose next request
+# lands on another worker is logged out
+app.secret_key = os.getenv("SECRET_KEY")
+if not app.secret_key:
+    logger.warning("SECRET_KEY is not set; sessions only work within this process")
+    app.secret_key = os.urandom(24)
+app.permanent_session_lifetime = timedelta(seconds=int(os.getenv("SESSION_LIFETIME", "3600")))
+# SESSION_STORE_URL=sqlite:///path or redis://... keeps session data server-side, shared by
+# all workers; by default it stays in the signed cookie
+session_store = sessions.create_store(os.getenv("SESSION_STORE_URL"))
+if session_store is not None:
+    app.session_interface = sessions.StoreSessionInterface(session_store)
+instrumentation.init_app(app)
 
 # API URLs
 USER_API_URL = os.getenv("USER_API_URL", "https://bgwp6whvle.execute-api.us-east-1.amazonaws.com/dev/user")
 # Base URL for the poster/history API (from user screenshot/info)
 POSTER_API_BASE = os.getenv("POSTER_API_BASE", "https://kiqi41dlld.execute-api.us-east-1.amazonaws.com/dev")
+# Posters shown per dashboard page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "24"))
+# Posters per history request when exporting (the API's maximum page size)
+EXPORT_PAGE_SIZE = 100
+# Public bucket the poster images are served from; exports fetch images from here
+POSTER_BUCKET_URL = os.getenv("POSTER_BUCKET_URL", "https://movie-poster-design-caa900.s3.amazonaws.com")
+# Most variations the designer API generates from one prompt
+MAX_VARIATIONS = 4
+# Image generation takes tens of seconds, so it gets a longer read timeout
+GENERATE_READ_TIMEOUT = float(os.getenv("GENERATE_READ_TIMEOUT", "60"))
+# Generation admission control: a token bucket per user, and a cap on generations queued
+# or running across all users (RATE_LIMIT_URL=sqlite:///path shares both between workers)
+generation_limiter = rate_limit.create_limiter(
+    os.getenv("RATE_LIMIT_URL"),
+    rate_per_minute=float(os.getenv("GENERATE_RATE_PER_MINUTE", "6")),
+    burst=int(os.getenv("GENERATE_BURST", "3")),
+    max_in_flight=int(os.getenv("GENERATE_MAX_IN_FLIGHT", "32")),
+    lease_seconds=int(os.getenv("GENERATE_LEASE_SECONDS", "900")),
+)
+
+# "http" calls the APIs through API Gateway; "embedded" runs their Lambda handlers in this
+# process (co-located deployments with AWS credentials; see embedded.py)
+BACKEND_TRANSPORT = os.getenv("BACKEND_TRANSPORT", "http")
+
+# Pooled keep-alive clients, one per upstream API
+if BACKEND_TRANSPORT == "embedded":
+    user_api = backend_client.get_client("user_api", "/user", client_class=embedded.EmbeddedClient)
+    poster_api = backend_client.get_client("poster_api", "", client_class=embedded.EmbeddedClient)
+else:
+    user_api = backend_client.get_client("user_api", USER_API_URL)
+    poster_api = backend_client.get_client("poster_api", POSTER_API_BASE,
+                                           no_retry_paths=["movie-poster-api-design", "pay"])
+poster_images = backend_client.get_client("poster_images", POSTER_BUCKET_URL)
+
+# Poster images are served by /posters/<key> from a bounded disk cache (IMAGE_PROXY=off links
+# straight to the bucket). IMAGE_ORIGIN=presigned reads the bucket with short-lived presigned
+# URLs, so its objects no longer need to be public.
+IMAGE_PROXY = os.getenv("IMAGE_PROXY", "on") == "on"
+IMAGE_ORIGIN = os.getenv("IMAGE_ORIGIN", "public")
+POSTER_BUCKET = os.getenv("POSTER_BUCKET", "movie-poster-design-caa900")
+poster_image_cache = image_cache.DiskLRUCache(
+    os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "poster-image-cache")),
+    int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
+presigner = (image_cache.Presigner(POSTER_BUCKET, int(os.getenv("IMAGE_PRESIGN_TTL", "60")),
+                                   os.getenv("S3_ENDPOINT_URL") or None)
+             if IMAGE_ORIGIN == "presigned" else None)
+
+# Per-user history cache; generate/unlock invalidate or patch it. Each user has two entries:
+# the version of their history and the pages cached under it
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", "300"))
+history_cache = caching.create_cache(os.getenv("HISTORY_CACHE_URL"),
+                                     maxsize=2 * int(os.getenv("HISTORY_CACHE_SIZE", "1024")),
+                                     ttl=HISTORY_CACHE_TTL, prefix="history:")
+dashboard_latency = metrics.LatencyWindow()
+
+# LOGIN_VERIFY=on checks logins with the User API's verify endpoint, which returns a signed
+# session token; by default the stored hash is fetched with GET /user and compared here
+LOGIN_VERIFY = os.getenv("LOGIN_VERIFY", "off") == "on"
+AUTH_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET")
+if LOGIN_VERIFY and not AUTH_TOKEN_SECRET:
+    logger.warning("LOGIN_VERIFY=on without AUTH_TOKEN_SECRET; logins will be refused")
+# Verification results are cached briefly so repeated logins skip the backend
+LOGIN_CACHE_TTL = int(os.getenv("LOGIN_CACHE_TTL", "60"))
+LOGIN_NEGATIVE_CACHE_TTL = int(os.getenv("LOGIN_NEGATIVE_CACHE_TTL", "10"))
+login_cache = caching.create_cache(os.getenv("LOGIN_CACHE_URL"),
+                                   maxsize=int(os.getenv("LOGIN_CACHE_SIZE", "4096")),
+                                   ttl=LOGIN_CACHE_TTL, prefix="login:")
+login_flights = caching.SingleFlight()
+
+# Content-hashed static files built by `python assets.py`; empty until it has been run
+asset_manifest = assets.load_manifest()
+
+@app.template_global()
+def asset_url(filename):
+    """url_for('static', filename=...) for templates, pointing at the hashed build when there is one."""
+    hashed = asset_manifest.get(filename)
+    if hashed:
+        return url_for('hashed_asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+def asset_headers(response, path, encoding):
+    """Long-lived caching for a hashed file; precompressed copies get their own ETag."""
+    response.set_etag(os.path.basename(path))
+    response.headers.pop('Content-Disposition', None)
+    response.headers.pop('Expires', None)
+    response.headers['Cache-Control'] = assets.IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    path, encoding = assets.precompressed(filename, request.headers.get('Accept-Encoding'))
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], etag=False, max_age=None)
+    asset_headers(response, path, encoding)
+    return response.make_conditional(request)
+
+def proxied_image_key(url):
+    """Bucket key of a poster image URL when it is served by /posters, else None."""
+    prefix = POSTER_BUCKET_URL.rstrip('/') + '/'
+    if IMAGE_PROXY and url and url.startswith(prefix) and image_cache.valid_key(url[len(prefix):]):
+        return url[len(prefix):]
+    return None
+
+@app.template_global()
+def image_url(url, download=False):
+    """Link for a poster image: the cached /posters route, or the bucket URL itself."""
+    key = proxied_image_key(url)
+    if key is None or 'user_id' not in session:
+        return url
+    return url_for('poster_image', key=key, t=image_cache.access_token(app.secret_key, session['user_id'], key),
+                   download=1 if download else None)
+
+def origin_response(key):
+    """Streaming GET of an object in the poster bucket, presigned when IMAGE_ORIGIN=presigned."""
+    return poster_images.get(presigner.url(key) if presigner else key, stream=True)
+
+def origin_chunks(key):
+    """Body of a bucket object in chunks; NotFound if it does not exist."""
+    response = origin_response(key)
+    with response:
+        # Without ListBucket permission S3 answers 403 for a missing key
+        if response.status_code in (403, 404):
+            raise NotFound()
+        response.raise_for_status()
+        yield from response.iter_content(64 * 1024)
+
+def poster_image_headers(response):
+    """Caching headers for /posters; counts the bytes sent to the browser."""
+    response.headers['Cache-Control'] = image_cache.CACHE_CONTROL
+    if response.status_code in (200, 206):
+        poster_image_cache.served(response.content_length or 0)
+    return response
+
+@app.route('/posters/<path:key>')
+def poster_image(key):
+    """A poster image from the disk cache, fetched from the bucket on a miss.
+
+    Only keys linked for the session's user (image_url signs them) are served; anything else is a
+    404. ETag and Last-Modified requests get a 304, and Range requests a partial response.
+    """
+    if 'user_id' not in session:
+        abort(401)
+    if not image_cache.valid_key(key) or not image_cache.valid_token(app.secret_key, session['user_id'], key,
+                                                                     request.args.get('t')):
+        abort(404)
+    try:
+        path, etag = poster_image_cache.fetch(key, lambda: origin_chunks(key))
+    except requests.RequestException:
+        logger.exception("Fetching poster image %s failed", key)
+        abort(502)
+    response = send_file(path, mimetype=image_cache.IMAGE_TYPES[os.path.splitext(key)[1].lower()],
+                         as_attachment=bool(request.args.get('download')), download_name=os.path.basename(key),
+                         etag=etag, max_age=None)
+    return poster_image_headers(response)
 
 # Helper to hash password
 def hash_password(password):
@@ -28,6 +219,83 @@ def index():
         return redirect(url_for('dashboard'))
     return render_template('index.html')
 
+def stored_hash_result(response, password_hash):
+    """Login result from a GET /user response (LOGIN_VERIFY=off)."""
+    # Lambda/API Gateway errors can come back as 200 OK with the error in the body
+    status_code, user_data = api_responses.decode(response)
+    error_msg = api_responses.error_message(user_data)
+    if status_code == 404:
+        return {"status": "unknown"}
+    if status_code != 200 or error_msg or not isinstance(user_data, dict):
+        return {"status": "error",
+                "message": error_msg or (f"User lookup failed with status {status_code}" if status_code != 200
+                                         else "Unexpected response")}
+    if user_data.get('password') == password_hash:
+        return {"status": "ok", "token": None}
+    return {"status": "invalid"}
+
+def verify_result(response, user_id):
+    """Login result from a POST /user/verify response."""
+    status_code, data = api_responses.decode(response)
+    error_msg = api_responses.error_message(data)
+
+    if status_code == 200 and not error_msg and isinstance(data, dict) and data.get('token'):
+        # A token that cannot be checked is not accepted
+        if not AUTH_TOKEN_SECRET:
+            return {"status": "error", "message": "AUTH_TOKEN_SECRET is not configured"}
+        if not auth.verify_token(data['token'], AUTH_TOKEN_SECRET, user_id):
+            return {"status": "error", "message": "Invalid session token"}
+        return {"status": "ok", "token": data['token'], "expires_at": data.get('expires_at')}
+    if status_code == 401:
+        return {"status": "invalid"}
+    if status_code == 404:
+        return {"status": "unknown"}
+    return {"status": "error", "message": error_msg or f"Verify failed with status {status_code}"}
+
+def check_credentials(user_id, password_hash):
+    """Asks the User API whether the credentials are valid.
+
+    Returns {"status": "ok" | "invalid" | "unknown" | "error", ...}; "ok" results carry
+    the session token when the verify endpoint is used.
+    """
+    if not LOGIN_VERIFY:
+        return stored_hash_result(user_api.get(params={'user_id': user_id}), password_hash)
+    # POST /user/verify compares the hash in the backend and answers with a token only
+    response = user_api.post("verify", json={"user_id": user_id, "password": password_hash})
+    return verify_result(response, user_id)
+
+def login_cache_key(user_id, password_hash):
+    return f"{user_id}:{auth.credential_fingerprint(user_id, password_hash)}"
+
+def cached_login(user_id, password_hash):
+    """A still-valid cached verification result, or None."""
+    # Unknown users are cached per user, everything else per (user, credentials). The
+    # unknown-user entry is rarely there, so its lookup is only counted when it hits
+    if login_cache.peek(user_id):
+        return login_cache.get(user_id)
+    cached = login_cache.get(login_cache_key(user_id, password_hash))
+    if cached and (cached.get('expires_at') or float('inf')) > time.time():
+        return cached
+    return None
+
+def remember_login(user_id, password_hash, result):
+    if result['status'] == 'ok':
+        login_cache.set(login_cache_key(user_id, password_hash), result)
+    elif result['status'] == 'invalid':
+        login_cache.set(login_cache_key(user_id, password_hash), result, ttl=LOGIN_NEGATIVE_CACHE_TTL)
+    elif result['status'] == 'unknown':
+        login_cache.set(user_id, result, ttl=LOGIN_NEGATIVE_CACHE_TTL)
+    return result
+
+def verify_login(user_id, password_hash):
+    """check_credentials behind the login cache; concurrent identical attempts share one call."""
+    cached = cached_login(user_id, password_hash)
+    if cached:
+        return cached
+    return login_flights.do(login_cache_key(user_id, password_hash),
+                            lambda: remember_login(user_id, password_hash,
+                                                   check_credentials(user_id, password_hash)))
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -36,49 +304,29 @@ def login():
         
         # Verify user against API
         try:
-            print(f"Attempting login for {user_id}")
-            response = requests.get(f"{USER_API_URL}", params={'user_id': user_id})
-            print(f"API Response Status: {response.status_code}")
-            print(f"API Response Body: {response.text}")
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                
-                # Check for Lambda/API Gateway errors that return 200 OK
-                # The API returns a structure like {"statusCode": 200, "body": "{\"key\": \"value\"}"}
-                # We need to parse the inner 'body' string if it exists.
-                if 'body' in user_data and isinstance(user_data['body'], str):
-                    try:
-                        inner_body = json.loads(user_data['body'])
-                        user_data = inner_body
-                    except json.JSONDecodeError:
-                        print("Failed to parse inner JSON body")
-
-                if 'errorMessage' in user_data or 'error' in user_data:
-                    error_msg = user_data.get('errorMessage') or user_data.get('error')
-                    flash(f'Login failed: {error_msg}')
-                    print(f"API Error: {error_msg}")
-                else:
-                    stored_hash = user_data.get('password')
-                    computed_hash = hash_password(password)
-                    print(f"Stored Hash: {stored_hash}")
-                    print(f"Computed Hash: {computed_hash}")
-                    
-                    if stored_hash == computed_hash:
-                        session['user_id'] = user_id
-                        session.permanent = True
-                        response = redirect(url_for('dashboard'))
-                        response.set_cookie('was_logged_in', 'true', max_age=3600)
-                        return response
-                    else:
-                        flash('Invalid password')
-                        print("Password mismatch")
-            else:
+            result = verify_login(user_id, hash_password(password))
+            logger.info("Login for %s: %s", user_id, result['status'])
+
+            if result['status'] == 'ok':
+                # A session ID planted before login must not carry the login
+                sessions.rotate_session(session)
+                session['user_id'] = user_id
+                if result.get('token'):
+                    session['auth_token'] = result['token']
+                session.permanent = True
+                response = redirect(url_for('dashboard'))
+                response.set_cookie('was_logged_in', 'true', max_age=3600)
+                return response
+            elif result['status'] == 'invalid':
+                flash('Invalid password')
+            elif result['status'] == 'unknown':
                 flash('User not found')
-                print("User not found in API")
+            else:
+                flash(f"Login failed: {result['message']}")
+                logger.warning("Login API error: %s", result['message'])
         except Exception as e:
             flash(f'Error logging in: {str(e)}')
-            print(f"Login Exception: {e}")
+            logger.exception("Login failed")
             
     # Check if session expired (cookie exists but session is empty)
     if 'user_id' not in session and request.cookies.get('was_logged_in'):
@@ -101,147 +349,435 @@ def signup():
             # DEBUG: Try sending raw password if server hashes it, or hashed if it doesn't.
             # Currently sending HASHED password.
             payload = {"user_id": user_id, "password": hashed_pw}
-            print(f"Signing up user: {user_id} with payload: {payload}")
+            logger.info("Signing up user %s", user_id)
             
-            response = requests.post(USER_API_URL, json=payload)
-            print(f"Signup Response: {response.status_code} - {response.text}")
+            response = user_api.post(json=payload)
+            log_payload("Signup API body", response.text)
             
             if response.status_code == 200:
-                resp_json = response.json()
-                if 'errorMessage' in resp_json or 'error' in resp_json:
-                    error_msg = resp_json.get('errorMessage') or resp_json.get('error')
+                _, resp_json = api_responses.decode(response)
+                error_msg = api_responses.error_message(resp_json)
+                if error_msg:
                     flash(f'Signup failed: {error_msg}')
                 else:
+                    # Drop a cached "user not found" from an earlier login attempt
+                    login_cache.delete(user_id)
                     flash('Signup successful! Please login.')
                     return redirect(url_for('login'))
             else:
                 flash('Error creating account')
         except Exception as e:
             flash(f'Error signing up: {str(e)}')
-            print(f"Signup Exception: {e}")
+            logger.exception("Signup failed")
 
     return render_template('signup.html')
 
+def history_params(user_id, page=None, limit=HISTORY_PAGE_SIZE):
+    # GET /history?user_id=<id>&limit=<n>&next_token=<cursor>
+    params = {'user_id': user_id, 'limit': limit}
+    if page:
+        params['next_token'] = page
+    return params
+
+def parse_history_page(response):
+    """Normalizes one history page response; returns None if the API call failed."""
+    log_payload("History API body", response.text)
+
+    status_code, data = api_responses.decode(response)
+    if response.status_code != 200 or status_code != 200 or api_responses.error_message(data):
+        return None
+
+    # Paginated responses wrap the list as {"posters": [...], "next_token": ...}
+    next_token = None
+    if isinstance(data, dict):
+        next_token = data.get('next_token')
+        data = data.get('posters')
+    posters = data if isinstance(data, list) else []
+
+    return {"posters": api_responses.clean_poster_urls(posters), "next_token": next_token}
+
+def fetch_history_page(user_id, page=None, limit=HISTORY_PAGE_SIZE):
+    """Fetches and normalizes one history page; returns None if the API call failed."""
+    return parse_history_page(poster_api.get("history", params=history_params(user_id, page, limit)))
+
+def history_version(user_id):
+    """Version of the user's cached history pages; invalidate_history replaces it.
+
+    A page fetched before an invalidation is stored under the version read before the fetch,
+    which nothing reads any more, so it cannot bring back the history the invalidation dropped.
+    """
+    # Bookkeeping, not a cached result: only dashboard page lookups count towards the hit ratio
+    version = history_cache.peek(f"{user_id}:v")
+    if version is None:
+        version = invalidate_history(user_id)
+    return version
+
+def invalidate_history(user_id):
+    """Drops the user's cached history by moving it to a new version; returns that version."""
+    previous = history_cache.peek(f"{user_id}:v")
+    version = os.urandom(8).hex()
+    history_cache.set(f"{user_id}:v", version)
+    if previous is not None:
+        # Nothing reads the old pages any more; free their slot for live entries
+        history_cache.delete(f"{user_id}:{previous}")
+    return version
+
+def cached_history_page(user_id, version, page=None):
+    return (history_cache.get(f"{user_id}:{version}") or {}).get(page or "")
+
+def store_history_page(user_id, version, page, result):
+    if result is not None:
+        pages = history_cache.peek(f"{user_id}:{version}") or {}
+        pages[page or ""] = result
+        history_cache.set(f"{user_id}:{version}", pages)
+    return result
+
+def get_history_page(user_id, page=None, refresh=False):
+    """History page from the per-user cache, fetching (and caching) it on a miss."""
+    version = history_version(user_id)
+    cached = None if refresh else cached_history_page(user_id, version, page)
+    if cached is not None:
+        return cached
+    return store_history_page(user_id, version, page, fetch_history_page(user_id, page))
+
+def patch_cached_posters(user_id, updates):
+    """Updates posters ({timestamp: fields}) in every cached page of a user's history in place."""
+    # Written back under the version that was read, so a concurrent invalidation still wins
+    key = f"{user_id}:{history_version(user_id)}"
+    pages = history_cache.peek(key)
+    if not pages:
+        return
+    for result in pages.values():
+        for poster in result['posters']:
+            if poster.get('timestamp') in updates:
+                poster.update(updates[poster['timestamp']])
+    history_cache.set(key, pages)
+
+def patch_cached_poster(user_id, timestamp, fields):
+    """Updates one poster in every cached page of a user's history in place."""
+    patch_cached_posters(user_id, {timestamp: fields})
+
 @app.route('/dashboard')
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
+    started = time.perf_counter()
     user_id = session['user_id']
+    page = request.args.get('page')
     posters = []
+    next_token = None
     
     try:
-        # GET /history?user_id=<id>
-        history_endpoint = f"{POSTER_API_BASE}/history"
-        print(f"Fetching history from: {history_endpoint}")
-        response = requests.get(history_endpoint, params={'user_id': user_id})
-        print(f"History API Status: {response.status_code}")
-        print(f"History API Body: {response.text}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Handle nested body if present (API Gateway/Lambda common pattern)
-            if isinstance(data, dict) and 'body' in data:
-                try:
-                    if isinstance(data['body'], str):
-                        posters = json.loads(data['body'])
-                    else:
-                        posters = data['body']
-                except json.JSONDecodeError:
-                    print("Failed to parse history body")
-                    posters = []
-            else:
-                posters = data
-                
-            # Handle case where posters is a list of strings (stringified JSONs)
-            if isinstance(posters, list):
-                parsed_posters = []
-                for p in posters:
-                    if isinstance(p, str):
-                        try:
-                            parsed_posters.append(json.loads(p))
-                        except:
-                            pass
-                    else:
-                        parsed_posters.append(p)
-                posters = parsed_posters
-                
-            # Clean URLs (Fix for trailing backslash issue)
-            if isinstance(posters, list):
-                for p in posters:
-                    if isinstance(p, dict) and 'poster_url' in p and p['poster_url']:
-                        p['poster_url'] = p['poster_url'].strip('\\')
-                        # Also fix if it's double quoted or has other artifacts
-                        p['poster_url'] = p['poster_url'].strip('"')
+        # ?fresh=1 (sent after a generation finishes) bypasses the cache
+        result = get_history_page(user_id, page, refresh=bool(request.args.get('fresh')))
+        if result is not None:
+            posters = result['posters']
+            next_token = result['next_token']
                 
     except Exception as e:
         flash(f"Error fetching history: {str(e)}")
-        print(f"Dashboard Exception: {e}")
+        logger.exception("Dashboard failed to load history")
         
-    return render_template('dashboard.html', posters=posters)
+    response = render_template('dashboard.html', posters=posters, next_token=next_token, page=page)
+    dashboard_latency.observe(time.perf_counter() - started)
+    return response
+
+def fetch_poster_image(poster):
+    """Image bytes of a paid poster, read from the bucket."""
+    response = origin_response(export.object_path(poster))
+    response.raise_for_status()
+    return response.content
+
+def export_stream(user_id, fmt):
+    """Generator of the export body; history pages and images are fetched as it is consumed."""
+    posters = export.iter_posters(lambda page: fetch_history_page(user_id, page, EXPORT_PAGE_SIZE))
+    if fmt == 'zip':
+        return export.zip_chunks(posters, fetch_poster_image)
+    return export.ndjson_lines(posters)
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'poster-history.ndjson'),
+    'zip': ('application/zip', 'poster-history.zip'),
+}
+
+@app.route('/export')
+def export_history():
+    """Whole history as NDJSON (default) or as a ZIP of the paid posters' images."""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be ndjson or zip"}), 400
+
+    mimetype, filename = EXPORT_FORMATS[fmt]
+    body = stream_with_context(export_stream(session['user_id'], fmt))
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store'})
+
+def generation_params(job):
+    # GET /movie-poster-api-design (User confirmed it's GET)
+    params = {"user_id": job['user_id'], "prompt": job['prompt']}
+    params.update(job.get('options') or {})
+    # Runs outside any request; the job ID ties its log lines together
+    instrumentation.bind_request_id(f"job-{job['id']}")
+    logger.debug("Generation params: %s", params)
+    return params
+
+def parse_generation(response):
+    """Summary of the designer API's result; raises if the generation failed.
+
+    The new posters are unpaid, so their URLs stay out of the job; the dashboard reads them
+    from the history, which hides them until the poster is unlocked.
+    """
+    log_payload("Generate API body", response.text)
+
+    if response.status_code != 200:
+        raise RuntimeError(f"Generation failed: {response.text}")
+
+    status_code, data = api_responses.decode(response)
+    error_msg = api_responses.error_message(data)
+    if error_msg or status_code != 200:
+        raise RuntimeError(error_msg or f"Generation failed with status {status_code}")
+    posters = data.get('posters') if isinstance(data, dict) else None
+    return {"posters": len(posters) if isinstance(posters, list) else 1}
+
+def run_generation(job):
+    """Job runner: calls the poster designer API and returns a summary of its result."""
+    response = poster_api.get("movie-poster-api-design", params=generation_params(job),
+                              timeout=(backend_client.CONNECT_TIMEOUT, GENERATE_READ_TIMEOUT))
+    data = parse_generation(response)
+
+    # The new poster(s) belong at the top of the user's history
+    invalidate_history(job['user_id'])
+    return data
+
+def release_generation(job):
+    """Frees a finished job's in-flight slot.
+
+    Called once the job is stored as done or failed, so a resubmit of the prompt either
+    joins the running job under its lease or starts a new job that takes a new one.
+    """
+    generation_limiter.release(generation_lease(job['user_id'], job['prompt'], job['options']))
+
+generation_jobs = jobs.create_queue(run_generation, on_finish=release_generation)
+# A sqlite job may run in another worker, which releases the lease in its own limiter; an
+# in-process limiter would keep the submitting worker's slot until GENERATE_LEASE_SECONDS
+if isinstance(generation_jobs, jobs.SQLiteJobQueue) and isinstance(generation_limiter, rate_limit.MemoryRateLimiter):
+    raise RuntimeError("JOB_QUEUE_BACKEND=sqlite needs a shared limiter: set RATE_LIMIT_URL=sqlite:///path")
+
+def generation_options(form):
+    """Designer API options from the generate form."""
+    try:
+        variations = min(max(int(form.get('variations') or 1), 1), MAX_VARIATIONS)
+    except ValueError:
+        variations = 1
+    return {"variations": variations} if variations > 1 else {}
+
+def generation_dedup_key(prompt, options):
+    """Jobs with the same key for a user are duplicates while one of them is in flight."""
+    return json.dumps([prompt_policy.normalize_prompt(prompt), options], sort_keys=True)
+
+def generation_lease(user_id, prompt, options):
+    """The in-flight slot a generation holds in generation_limiter; duplicates share it."""
+    return f"{user_id}:{generation_dedup_key(prompt, options)}"
+
+def admission_error(admission):
+    if admission.reason == "busy":
+        return "The poster generator is busy. Please try again shortly."
+    return f"Too many generation requests. Please try again in {admission.retry_after} s."
+
+def rate_limited_response(admission):
+    """429 JSON response with Retry-After for a generation that was not admitted."""
+    response = jsonify({"error": admission_error(admission), "retry_after": admission.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(admission.retry_after)
+    return response
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
 
 @app.route('/generate', methods=['POST'])
 def generate():
     if 'user_id' not in session:
+        if wants_json():
+            return jsonify({"error": "Not logged in"}), 401
         return redirect(url_for('login'))
     
     prompt = request.form.get('prompt')
     user_id = session['user_id']
-    
+
+    # Same rules as the designer Lambda, checked before anything is queued
+    error_msg = prompt_policy.check_prompt(prompt)
+    if error_msg:
+        if wants_json():
+            return jsonify({"error": error_msg}), 400
+        flash(f"Generation failed: {error_msg}")
+        return redirect(url_for('dashboard'))
+
+    options = generation_options(request.form)
+
+    lease = generation_lease(user_id, prompt, options)
+    admission = generation_limiter.acquire(user_id, lease)
+    if not admission.allowed:
+        logger.info("Generation for %s not admitted (%s)", user_id, admission.reason)
+        if wants_json():
+            return rate_limited_response(admission)
+        flash(f"Generation failed: {admission_error(admission)}")
+        return redirect(url_for('dashboard'))
+
+    # Enqueue and return right away; the dashboard polls /jobs/<id> for the result.
+    # A double submit of the same prompt gets the job that is already in flight
     try:
-        # GET /movie-poster-api-design (User confirmed it's GET)
-        generate_endpoint = f"{POSTER_API_BASE}/movie-poster-api-design"
-        params = {"user_id": user_id, "prompt": prompt}
-        print(f"Generating poster at: {generate_endpoint}")
-        print(f"Params: {params}")
-        
-        response = requests.get(generate_endpoint, params=params)
-        print(f"Generate API Status: {response.status_code}")
-        print(f"Generate API Body: {response.text}")
-        
-        if response.status_code != 200:
-             flash(f"Generation failed: {response.text}")
-        
-        # We don't necessarily need to do anything with the response if we just reload the dashboard
-        # The dashboard will fetch the new history.
-    except Exception as e:
-        flash(f"Error generating poster: {str(e)}")
-        print(f"Generate Exception: {e}")
-        
-    return redirect(url_for('dashboard'))
+        job_id, created = generation_jobs.submit(user_id, prompt, options,
+                                                 dedup_key=generation_dedup_key(prompt, options))
+    except Exception:
+        generation_limiter.release(lease)
+        raise
+    if not created and admission.reason == "ok":
+        # Joined a job whose lease had expired: the slot just taken is not held by any job
+        generation_limiter.release(lease)
+    logger.info("Queued generation job %s for %s", job_id, user_id)
+
+    if wants_json():
+        return jsonify({"job_id": job_id, "status_url": url_for('job_status', job_id=job_id)}), 202
+
+    flash("Poster generation started. It will appear in your history shortly.")
+    return redirect(url_for('dashboard', job=job_id))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    job = generation_jobs.get(job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({
+        "job_id": job['id'],
+        "status": job['status'],
+        "error": job['error'],
+    })
+
+def unlock_payload(user_id, form):
+    """/pay body for a checkout form: one poster, or several in a single transactional request."""
+    timestamps = [timestamp for timestamp in form.getlist('timestamp') if timestamp]
+    if len(timestamps) > 1:
+        return {"user_id": user_id, "timestamps": timestamps}
+    # The (user_id, timestamp) primary key identifies the poster
+    return {"user_id": user_id, "timestamp": timestamps[0] if timestamps else None,
+            "prompt_used": form.get('prompt_used')}
+
+def apply_unlock(user_id, response):
+    """Updates the cached history from a /pay response.
+
+    Returns (revealed posters, error message or None).
+    """
+    log_payload("Unlock API body", response.text)
+    if response.status_code != 200:
+        return [], response.text
+
+    _, data = api_responses.decode(response)
+    if not isinstance(data, dict):
+        data = {}
+    if api_responses.error_message(data):
+        return [], api_responses.error_message(data)
+    posters = data.get('posters') if isinstance(data.get('posters'), list) else [data.get('poster')]
+    posters = [dict(poster, paid=True, locked=False) for poster in posters
+               if isinstance(poster, dict) and poster.get('timestamp')]
+    if posters:
+        # Reveal the posters in the cached history instead of refetching it
+        patch_cached_posters(user_id, {poster['timestamp']: poster for poster in posters})
+    else:
+        invalidate_history(user_id)
+    return posters, None
+
+def unlock_result(payload, posters, error_msg):
+    """(JSON body, status) replying to a scripted checkout."""
+    revealed = {poster['timestamp'] for poster in posters}
+    not_found = [timestamp for timestamp in payload.get('timestamps', ()) if timestamp not in revealed]
+    body = {"unlocked": posters, "not_found": not_found, "error": error_msg}
+    return body, 200 if posters or not error_msg else 502
 
 @app.route('/unlock', methods=['POST'])
 def unlock():
     if 'user_id' not in session:
+        if wants_json():
+            return jsonify({"error": "Not logged in"}), 401
         return redirect(url_for('login'))
     
-    prompt_used = request.form.get('prompt_used')
     user_id = session['user_id']
     
     try:
-        # POST /pay
-        set_paid_endpoint = f"{POSTER_API_BASE}/pay"
-        payload = {"user_id": user_id, "prompt_used": prompt_used}
-        print(f"Unlocking poster at: {set_paid_endpoint}")
-        print(f"Payload: {payload}")
-        
-        response = requests.post(set_paid_endpoint, json=payload)
-        print(f"Unlock API Status: {response.status_code}")
-        print(f"Unlock API Body: {response.text}")
+        payload = unlock_payload(user_id, request.form)
+        logger.debug("Unlock payload: %s", payload)
         
-        if response.status_code != 200:
-            flash(f"Unlock failed: {response.text}")
-            
+        response = poster_api.post("pay", json=payload)
+        posters, error_msg = apply_unlock(user_id, response)
     except Exception as e:
+        logger.exception("Unlock failed")
+        if wants_json():
+            body, status = unlock_result({}, [], f"Error unlocking poster: {str(e)}")
+            return jsonify(body), status
         flash(f"Error unlocking poster: {str(e)}")
-        print(f"Unlock Exception: {e}")
-        
+        return redirect(url_for('dashboard'))
+
+    if wants_json():
+        body, status = unlock_result(payload, posters, error_msg)
+        return jsonify(body), status
+    if error_msg:
+        flash(f"Unlock failed: {error_msg}")
     return redirect(url_for('dashboard'))
 
+@app.route('/internal/stats')
+def internal_stats():
+    """Upstream, cache and dashboard latency counters for this worker."""
+    return jsonify({
+        "backends": backend_client.stats(),
+        "history_cache": history_cache.stats(),
+        "login_cache": dict(login_cache.stats(), shared_in_flight=login_flights.shared),
+        "generation_limiter": generation_limiter.stats(),
+        "dashboard_latency_ms": dashboard_latency.stats(),
+        "image_cache": poster_image_cache.stats(),
+    })
+
+def collect_app_metrics():
+    """Upstream and cache counters for /metrics, read from the objects that keep them."""
+    backends = backend_client.stats()
+    caches = {"history": history_cache.stats(), "login": login_cache.stats(),
+              "poster_image": poster_image_cache.stats()}
+    yield ("poster_upstream_requests_total", "counter", "Requests sent to each upstream API.",
+           [({"upstream": name}, s["requests"]) for name, s in backends.items()])
+    yield ("poster_upstream_errors_total", "counter", "Upstream requests that failed or returned 5xx.",
+           [({"upstream": name}, s["errors"]) for name, s in backends.items()])
+    yield ("poster_upstream_connections_opened_total", "counter", "Connections opened to each upstream API.",
+           [({"upstream": name}, s["connections_opened"]) for name, s in backends.items()])
+    yield ("poster_cache_hits_total", "counter", "Cache lookups that found an entry.",
+           [({"cache": name}, s["hits"]) for name, s in caches.items()])
+    yield ("poster_cache_misses_total", "counter", "Cache lookups that found nothing.",
+           [({"cache": name}, s["misses"]) for name, s in caches.items()])
+    images = poster_image_cache.stats()
+    yield ("poster_image_cache_bytes_total", "counter", "Poster image bytes by direction.",
+           [({"direction": "origin"}, images["origin_bytes"]), ({"direction": "served"}, images["served_bytes"])])
+    limiter = generation_limiter.stats()
+    yield ("poster_generation_admissions_total", "counter", "Generation admission decisions by outcome.",
+           [({"outcome": outcome}, limiter[outcome]) for outcome in ("admitted", "duplicates", "limited", "busy")])
+    yield ("poster_generations_in_flight", "gauge", "Generations holding an in-flight slot.",
+           [({}, limiter["in_flight"])])
+
+metrics.REGISTRY.add_collector(collect_app_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, span, upstream and cache metrics in Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/logout')
 def logout():
     session.clear()
+    sessions.rotate_session(session)
     response = redirect(url_for('login'))
     response.delete_cookie('was_logged_in')
     return response
@@ -0,0 +1,453 @@
+"""ASGI (Quart) version of the web app for async serving.
+
+Same routes, templates, caches and configuration as app.py, but the upstream calls use
+httpx and do not block, so one process can serve many concurrent users while they wait
+on the APIs. Run it with an ASGI server, e.g. `uvicorn asgi_app:app`.
+"""
+import asyncio
+import mimetypes
+import os
+import time
+
+import requests
+from quart import (Quart, Response, render_template, request, redirect, url_for, session, flash, make_response,
+                   jsonify, abort, send_file)
+from quart.sessions import SecureCookieSession, SessionInterface
+from quart.utils import run_sync, run_sync_iterable
+
+import app as sync_app
+import api_responses
+import assets
+import backend_client
+import caching
+import embedded
+import image_cache
+import instrumentation
+import jobs
+import metrics
+import sessions
+from app import (LOGIN_VERIFY, GENERATE_READ_TIMEOUT, history_cache, login_cache,
+                 dashboard_latency, hash_password, stored_hash_result, verify_result, cached_login,
+                 login_cache_key, remember_login, history_params, parse_history_page, history_version,
+                 invalidate_history, cached_history_page, store_history_page, generation_params, parse_generation,
+                 generation_options, generation_dedup_key, generation_limiter, generation_lease, admission_error,
+                 apply_unlock, unlock_payload, unlock_result,
+                 EXPORT_FORMATS, export_stream, session_store, asset_manifest, asset_headers,
+                 proxied_image_key, origin_chunks, poster_image_cache, poster_image_headers)
+from instrumentation import logger
+from lambda_functions import prompt_policy
+
+app = Quart(__name__)
+app.secret_key = sync_app.app.secret_key
+app.permanent_session_lifetime = sync_app.app.permanent_session_lifetime
+
+class StoreSessionInterface(SessionInterface):
+    """sessions.StoreSessionInterface for Quart; store calls run in worker threads."""
+
+    session_class = SecureCookieSession
+
+    def __init__(self, store):
+        self.store = store
+
+    async def open_session(self, app, request):
+        return await run_sync(sessions.open_stored_session)(self, app, request, self.store)
+
+    async def save_session(self, app, session, response):
+        if response is not None:
+            await run_sync(sessions.save_stored_session)(self, app, session, response, self.store)
+
+if session_store is not None:
+    app.session_interface = StoreSessionInterface(session_store)
+instrumentation.init_asgi_app(app)
+
+# Non-blocking clients for the same upstreams
+if sync_app.BACKEND_TRANSPORT == "embedded":
+    user_api = backend_client.get_client("user_api_async", "/user", client_class=embedded.AsyncEmbeddedClient)
+    poster_api = backend_client.get_client("poster_api_async", "", client_class=embedded.AsyncEmbeddedClient)
+else:
+    user_api = backend_client.get_async_client("user_api_async", sync_app.USER_API_URL)
+    poster_api = backend_client.get_async_client("poster_api_async", sync_app.POSTER_API_BASE,
+                                                 no_retry_paths=["movie-poster-api-design", "pay"])
+login_flights = caching.AsyncSingleFlight()
+
+# History refreshes started when a generation finishes: user_id -> task.
+# Finished ones are kept briefly so the dashboard reload that follows can use them.
+history_refreshes = {}
+HISTORY_REFRESH_KEEP_SECONDS = 30
+
+@app.template_global()
+def asset_url(filename):
+    """asset_url from app.py, built with Quart's url_for."""
+    hashed = asset_manifest.get(filename)
+    if hashed:
+        return url_for('hashed_asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+@app.route('/assets/<path:filename>')
+async def hashed_asset(filename):
+    path, encoding = assets.precompressed(filename, request.headers.get('Accept-Encoding'))
+    if path is None:
+        abort(404)
+    response = await send_file(path, mimetype=mimetypes.guess_type(filename)[0], add_etags=False)
+    asset_headers(response, path, encoding)
+    return await response.make_conditional(request)
+
+@app.template_global()
+def image_url(url, download=False):
+    """image_url from app.py, built with Quart's url_for."""
+    key = proxied_image_key(url)
+    if key is None or 'user_id' not in session:
+        return url
+    return url_for('poster_image', key=key, t=image_cache.access_token(app.secret_key, session['user_id'], key),
+                   download=1 if download else None)
+
+@app.route('/posters/<path:key>')
+async def poster_image(key):
+    """poster_image from app.py; the cache and origin fetch run in a worker thread."""
+    if 'user_id' not in session:
+        abort(401)
+    if not image_cache.valid_key(key) or not image_cache.valid_token(app.secret_key, session['user_id'], key,
+                                                                     request.args.get('t')):
+        abort(404)
+    try:
+        path, etag = await run_sync(poster_image_cache.fetch)(key, lambda: origin_chunks(key))
+    except requests.RequestException:
+        logger.exception("Fetching poster image %s failed", key)
+        abort(502)
+    response = await send_file(path, mimetype=image_cache.IMAGE_TYPES[os.path.splitext(key)[1].lower()],
+                               as_attachment=bool(request.args.get('download')),
+                               attachment_filename=os.path.basename(key), add_etags=False)
+    response.set_etag(etag)
+    await response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
+    return poster_image_headers(response)
+
+@app.after_serving
+async def close_clients():
+    await user_api.aclose()
+    await poster_api.aclose()
+
+@app.route('/')
+async def index():
+    if 'user_id' in session:
+        return redirect(url_for('dashboard'))
+    return await render_template('index.html')
+
+async def check_credentials(user_id, password_hash):
+    """Async check_credentials from app.py."""
+    if not LOGIN_VERIFY:
+        return stored_hash_result(await user_api.get(params={'user_id': user_id}), password_hash)
+    response = await user_api.post("verify", json={"user_id": user_id, "password": password_hash})
+    return verify_result(response, user_id)
+
+async def verify_login(user_id, password_hash):
+    # The login cache may be Redis; its calls run in worker threads
+    cached = await run_sync(cached_login)(user_id, password_hash)
+    if cached:
+        return cached
+
+    async def check():
+        return await run_sync(remember_login)(user_id, password_hash,
+                                              await check_credentials(user_id, password_hash))
+
+    return await login_flights.do(login_cache_key(user_id, password_hash), check)
+
+@app.route('/login', methods=['GET', 'POST'])
+async def login():
+    if request.method == 'POST':
+        form = await request.form
+        user_id = form.get('email')
+        password = form.get('password')
+
+        try:
+            result = await verify_login(user_id, hash_password(password))
+            logger.info("Login for %s: %s", user_id, result['status'])
+
+            if result['status'] == 'ok':
+                # A session ID planted before login must not carry the login
+                sessions.rotate_session(session)
+                session['user_id'] = user_id
+                if result.get('token'):
+                    session['auth_token'] = result['token']
+                session.permanent = True
+                response = redirect(url_for('dashboard'))
+                response.set_cookie('was_logged_in', 'true', max_age=3600)
+                return response
+            elif result['status'] == 'invalid':
+                await flash('Invalid password')
+            elif result['status'] == 'unknown':
+                await flash('User not found')
+            else:
+                await flash(f"Login failed: {result['message']}")
+                logger.warning("Login API error: %s", result['message'])
+        except Exception as e:
+            await flash(f'Error logging in: {str(e)}')
+            logger.exception("Login failed")
+
+    # Check if session expired (cookie exists but session is empty)
+    if 'user_id' not in session and request.cookies.get('was_logged_in'):
+        await flash('Session expired. Please login again.')
+        response = await make_response(await render_template('login.html'))
+        response.delete_cookie('was_logged_in')
+        return response
+
+    return await render_template('login.html')
+
+@app.route('/signup', methods=['GET', 'POST'])
+async def signup():
+    if request.method == 'POST':
+        form = await request.form
+        user_id = form.get('email')
+        password = form.get('password')
+
+        try:
+            logger.info("Signing up user %s", user_id)
+            response = await user_api.post(json={"user_id": user_id, "password": hash_password(password)})
+            instrumentation.log_payload("Signup API body", response.text)
+
+            if response.status_code == 200:
+                _, resp_json = api_responses.decode(response)
+                error_msg = api_responses.error_message(resp_json)
+                if error_msg:
+                    await flash(f'Signup failed: {error_msg}')
+                else:
+                    await run_sync(login_cache.delete)(user_id)
+                    await flash('Signup successful! Please login.')
+                    return redirect(url_for('login'))
+            else:
+                await flash('Error creating account')
+        except Exception as e:
+            await flash(f'Error signing up: {str(e)}')
+            logger.exception("Signup failed")
+
+    return await render_template('signup.html')
+
+async def fetch_history_page(user_id, page=None):
+    response = await poster_api.get("history", params=history_params(user_id, page))
+    return parse_history_page(response)
+
+async def get_history_page(user_id, page=None, refresh=False):
+    """Async get_history_page from app.py.
+
+    A refresh of the first page reuses the one started when the user's last generation
+    finished, so the reload after a generation usually finds it already done.
+    """
+    if refresh and not page and user_id in history_refreshes:
+        try:
+            result = await asyncio.shield(history_refreshes.pop(user_id))
+        except Exception:
+            result = None
+        if result is not None:
+            return result
+
+    # The history cache may be Redis; its calls run in worker threads
+    version = await run_sync(history_version)(user_id)
+    cached = None if refresh else await run_sync(cached_history_page)(user_id, version, page)
+    if cached is not None:
+        return cached
+    return await run_sync(store_history_page)(user_id, version, page, await fetch_history_page(user_id, page))
+
+async def refresh_history(user_id):
+    version = await run_sync(invalidate_history)(user_id)
+    return await run_sync(store_history_page)(user_id, version, None, await fetch_history_page(user_id))
+
+@app.route('/dashboard')
+async def dashboard():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    started = time.perf_counter()
+    user_id = session['user_id']
+    page = request.args.get('page')
+    posters = []
+    next_token = None
+
+    try:
+        # ?fresh=1 (sent after a generation finishes) bypasses the cache
+        result = await get_history_page(user_id, page, refresh=bool(request.args.get('fresh')))
+        if result is not None:
+            posters = result['posters']
+            next_token = result['next_token']
+
+    except Exception as e:
+        await flash(f"Error fetching history: {str(e)}")
+        logger.exception("Dashboard failed to load history")
+
+    response = await render_template('dashboard.html', posters=posters, next_token=next_token, page=page)
+    dashboard_latency.observe(time.perf_counter() - started)
+    return response
+
+async def run_generation(job):
+    """Job runner: calls the designer API, then refreshes the user's history in the background."""
+    response = await poster_api.get("movie-poster-api-design", params=generation_params(job),
+                                    timeout=(backend_client.CONNECT_TIMEOUT, GENERATE_READ_TIMEOUT))
+    data = parse_generation(response)
+
+    # The job is reported done right away; the history refresh overlaps the browser's
+    # next poll and reload instead of happening after it
+    user_id = job['user_id']
+    task = history_refreshes[user_id] = asyncio.ensure_future(refresh_history(user_id))
+
+    def forget(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("History refresh for %s failed: %s", user_id, task.exception())
+        asyncio.get_running_loop().call_later(
+            HISTORY_REFRESH_KEEP_SECONDS,
+            lambda: history_refreshes.pop(user_id, None) if history_refreshes.get(user_id) is task else None)
+
+    task.add_done_callback(forget)
+    return data
+
+# The in-process queue runs generations as tasks on the event loop; the shared
+# SQLite queue keeps app.py's thread-based runner
+if os.getenv("JOB_QUEUE_BACKEND", "memory") == "memory":
+    async def release_generation(job):
+        await run_sync(sync_app.release_generation)(job)
+
+    generation_jobs = jobs.AsyncJobQueue(run_generation, workers=int(os.getenv("JOB_WORKERS", "4")),
+                                         on_finish=release_generation)
+else:
+    generation_jobs = sync_app.generation_jobs
+
+async def queue_call(method, *args, **kwargs):
+    """Calls a generation_jobs method; the SQLite queue's run in a worker thread."""
+    if isinstance(generation_jobs, jobs.AsyncJobQueue):
+        return method(*args, **kwargs)
+    return await run_sync(method)(*args, **kwargs)
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+def rate_limited_response(admission):
+    response = jsonify({"error": admission_error(admission), "retry_after": admission.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(admission.retry_after)
+    return response
+
+@app.route('/generate', methods=['POST'])
+async def generate():
+    if 'user_id' not in session:
+        if wants_json():
+            return jsonify({"error": "Not logged in"}), 401
+        return redirect(url_for('login'))
+
+    form = await request.form
+    prompt = form.get('prompt')
+    user_id = session['user_id']
+
+    error_msg = prompt_policy.check_prompt(prompt)
+    if error_msg:
+        if wants_json():
+            return jsonify({"error": error_msg}), 400
+        await flash(f"Generation failed: {error_msg}")
+        return redirect(url_for('dashboard'))
+
+    options = generation_options(form)
+    lease = generation_lease(user_id, prompt, options)
+    # A SQLite limiter blocks on its file lock, so it is called from a worker thread
+    admission = await run_sync(generation_limiter.acquire)(user_id, lease)
+    if not admission.allowed:
+        logger.info("Generation for %s not admitted (%s)", user_id, admission.reason)
+        if wants_json():
+            return rate_limited_response(admission)
+        await flash(f"Generation failed: {admission_error(admission)}")
+        return redirect(url_for('dashboard'))
+
+    try:
+        job_id, created = await queue_call(generation_jobs.submit, user_id, prompt, options,
+                                           dedup_key=generation_dedup_key(prompt, options))
+    except Exception:
+        await run_sync(generation_limiter.release)(lease)
+        raise
+    if not created and admission.reason == "ok":
+        # Joined a job whose lease had expired: the slot just taken is not held by any job
+        await run_sync(generation_limiter.release)(lease)
+    logger.info("Queued generation job %s for %s", job_id, user_id)
+
+    if wants_json():
+        return jsonify({"job_id": job_id, "status_url": url_for('job_status', job_id=job_id)}), 202
+
+    await flash("Poster generation started. It will appear in your history shortly.")
+    return redirect(url_for('dashboard', job=job_id))
+
+@app.route('/jobs/<job_id>')
+async def job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    job = await queue_call(generation_jobs.get, job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({
+        "job_id": job['id'],
+        "status": job['status'],
+        "error": job['error'],
+    })
+
+@app.route('/unlock', methods=['POST'])
+async def unlock():
+    if 'user_id' not in session:
+        if wants_json():
+            return jsonify({"error": "Not logged in"}), 401
+        return redirect(url_for('login'))
+
+    form = await request.form
+    user_id = session['user_id']
+
+    try:
+        payload = unlock_payload(user_id, form)
+        logger.debug("Unlock payload: %s", payload)
+        posters, error_msg = await run_sync(apply_unlock)(user_id, await poster_api.post("pay", json=payload))
+    except Exception as e:
+        logger.exception("Unlock failed")
+        if wants_json():
+            body, status = unlock_result({}, [], f"Error unlocking poster: {str(e)}")
+            return jsonify(body), status
+        await flash(f"Error unlocking poster: {str(e)}")
+        return redirect(url_for('dashboard'))
+
+    if wants_json():
+        body, status = unlock_result(payload, posters, error_msg)
+        return jsonify(body), status
+    if error_msg:
+        await flash(f"Unlock failed: {error_msg}")
+    return redirect(url_for('dashboard'))
+
+@app.route('/export')
+async def export_history():
+    """Export from app.py; its blocking generator is stepped in worker threads."""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be ndjson or zip"}), 400
+
+    mimetype, filename = EXPORT_FORMATS[fmt]
+    return Response(run_sync_iterable(export_stream(session['user_id'], fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store'})
+
+@app.route('/internal/stats')
+async def internal_stats():
+    """Upstream, cache and dashboard latency counters for this worker."""
+    return jsonify({
+        "backends": backend_client.stats(),
+        "history_cache": history_cache.stats(),
+        "login_cache": dict(login_cache.stats(), shared_in_flight=login_flights.shared),
+        "generation_limiter": await run_sync(generation_limiter.stats)(),
+        "dashboard_latency_ms": dashboard_latency.stats(),
+        "image_cache": poster_image_cache.stats(),
+    })
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    """Request, span, upstream and cache metrics in Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/logout')
+async def logout():
+    session.clear()
+    sessions.rotate_session(session)
+    response = redirect(url_for('login'))
+    response.delete_cookie('was_logged_in')
+    return response
@@ -0,0 +1,193 @@
+"""Static asset build: content-hashed copies of static/ in static/dist, served by /assets.
+
+    python assets.py
+
+Writes every file under static/ to static/dist with a hash of its content in the name,
+gzip (and, with the `brotli` package, brotli) copies of text assets, and WebP/AVIF versions
+of raster images. CSS is rewritten to point at the hashed files, and background images get
+an image-set() with the modern formats first and the original as the fallback.
+static/dist/manifest.json maps each source path to its hashed name.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_NAME = "manifest.json"
+
+# Hashed files never change, so browsers and CDNs may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Only these are worth compressing; images and fonts already are
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".html", ".txt")
+RASTER = (".png", ".jpg", ".jpeg")
+# Modern formats tried before the original, best first: (extension, Pillow format, options)
+IMAGE_VARIANTS = ((".avif", "AVIF", {"quality": 60}), (".webp", "WEBP", {"quality": 80, "method": 6}))
+
+# Content-Encoding -> suffix of the precompressed copy, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Older mime.types files predate these
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+_URL = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+_BACKGROUND = re.compile(r"""background-image\s*:\s*url\((['"]?)([^'")]+)\1\)\s*;""")
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(path, data):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _compress(path, data):
+    """Writes .gz/.br copies next to `path` when they are smaller than the original."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    compressed = {".gz": gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        compressed[".br"] = brotli.compress(data, quality=11)
+    for suffix, payload in compressed.items():
+        if len(payload) < len(data):
+            _write(path + suffix, payload)
+
+
+def _image_variants(data):
+    """(extension, bytes) for each modern format Pillow can write; skipped when larger."""
+    import io
+
+    from PIL import Image, features
+
+    image = Image.open(io.BytesIO(data))
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    for ext, fmt, options in IMAGE_VARIANTS:
+        if not features.check(fmt.lower()):
+            continue
+        out = io.BytesIO()
+        image.save(out, fmt, **options)
+        if out.tell() < len(data):
+            yield ext, out.getvalue()
+
+
+def _rewrite_css(css, css_path, manifest):
+    """Points url()s at hashed files; background-image gets an image-set() of the variants."""
+    base = posixpath.dirname(css_path)
+
+    def resolve(ref):
+        if ref.startswith(("data:", "http:", "https:", "//", "/")):
+            return None
+        return posixpath.normpath(posixpath.join(base, ref))
+
+    def relative(source):
+        return posixpath.relpath(manifest[source], base)
+
+    def background(match):
+        source = resolve(match.group(2))
+        if source not in manifest:
+            return match.group(0)
+        stem = posixpath.splitext(source)[0]
+        options = [f"url('{relative(stem + ext)}') type('{mimetypes.guess_type(stem + ext)[0]}')"
+                   for ext, _, _ in IMAGE_VARIANTS if stem + ext in manifest]
+        fallback = f"background-image: url('{relative(source)}');"
+        if not options:
+            return fallback
+        mime = mimetypes.guess_type(source)[0]
+        options.append(f"url('{relative(source)}') type('{mime}')")
+        # Browsers without image-set() keep the first declaration
+        return f"{fallback}\n    background-image: image-set({', '.join(options)});"
+
+    def url(match):
+        source = resolve(match.group(2))
+        return f"url('{relative(source)}')" if source in manifest else match.group(0)
+
+    return _URL.sub(url, _BACKGROUND.sub(background, css))
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Rebuilds dist_dir from static_dir; returns the manifest."""
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    sources = []
+    for folder, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(folder, d) != dist_dir]
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(folder, name), static_dir).replace(os.sep, "/"))
+
+    manifest = {}
+
+    def emit(source, data):
+        manifest[source] = hashed_name(source, data)
+        target = os.path.join(dist_dir, manifest[source])
+        _write(target, data)
+        if source.endswith(COMPRESSIBLE):
+            _compress(target, data)
+
+    # CSS last: its content (and so its hash) depends on the names of what it references
+    for source in sorted(sources, key=lambda s: (s.endswith(".css"), s)):
+        with open(os.path.join(static_dir, source), "rb") as f:
+            data = f.read()
+        if source.endswith(".css"):
+            data = _rewrite_css(data.decode(), source, manifest).encode()
+        emit(source, data)
+        if source.lower().endswith(RASTER):
+            stem = posixpath.splitext(source)[0]
+            for ext, variant in _image_variants(data):
+                emit(stem + ext, variant)
+
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(dist_dir=DIST_DIR):
+    """Source path -> hashed name, or {} if the assets have not been built."""
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def precompressed(filename, accept_encoding, dist_dir=None):
+    """Picks the best precompressed copy of a built file the client accepts.
+
+    Returns (path, content encoding or None); the path is None if the file does not exist.
+    """
+    dist_dir = dist_dir or DIST_DIR
+    path = os.path.normpath(os.path.join(dist_dir, filename))
+    if not path.startswith(os.path.join(dist_dir, "")) or not os.path.isfile(path):
+        return None, None
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip())
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+if __name__ == "__main__":
+    built = build()
+    for source, target in sorted(built.items()):
+        size = os.path.getsize(os.path.join(DIST_DIR, target))
+        print(f"{source:<30} -> {target} ({size / 1024:.1f} KB)")
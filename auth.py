@@ -0,0 +1,32 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def verify_token(token, secret, user_id=None):
+    """Checks a session token signed by the verify_user Lambda; returns its claims or None."""
+    try:
+        payload, signature = token.split(".")
+        expected = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _unb64(signature)):
+            return None
+        claims = json.loads(_unb64(payload))
+    except (AttributeError, ValueError):
+        return None
+
+    if not isinstance(claims, dict) or claims.get("exp", 0) <= time.time():
+        return None
+    if user_id is not None and claims.get("sub") != user_id:
+        return None
+    return claims
+
+
+def credential_fingerprint(user_id, password_hash):
+    """Cache key material for a login attempt, so the hash itself is never used as a key."""
+    return hashlib.sha256(f"{user_id}:{password_hash}".encode()).hexdigest()
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+
+# Pool / timeout settings shared by every upstream client
+POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("BACKEND_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("BACKEND_RETRY_BACKOFF", "0.3"))
+
+# Gateway errors that are safe to retry for idempotent calls
+RETRY_STATUSES = (502, 503, 504)
+
+
+def _make_adapter(pool_size, max_retries, backoff, retry_status):
+    """Builds a pooled adapter with bounded retries and exponential backoff."""
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=max_retries if retry_status else 0,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES if retry_status else (),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+
+class BackendClient:
+    """Keep-alive HTTP client for one upstream API (pooled session + counters).
+
+    Paths listed in `no_retry_paths` trigger side effects (e.g. poster generation),
+    so they only retry failed connects, never gateway errors after the request
+    has been sent.
+    """
+
+    def __init__(self, name, base_url, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                 no_retry_paths=()):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        self.adapters = [_make_adapter(pool_size, max_retries, backoff, True)]
+        self.session.mount(self.base_url, self.adapters[0])
+        for path in no_retry_paths:
+            adapter = _make_adapter(pool_size, max_retries, backoff, False)
+            self.adapters.append(adapter)
+            self.session.mount(self.url(path), adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def url(self, path=""):
+        if not path:
+            return self.base_url
+        # Absolute URLs (e.g. presigned S3 links) are used as they are
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path="", timeout=None, **kwargs):
+        # Pass the request ID on so upstream logs can be matched with ours
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.setdefault("X-Request-ID", instrumentation.request_id())
+
+        started = time.perf_counter()
+        failed = True
+        status = "error"
+        try:
+            with instrumentation.span(f"upstream.{self.name}"):
+                response = self.session.request(method, self.url(path), timeout=timeout or self.timeout,
+                                                headers=headers, **kwargs)
+            failed = response.status_code >= 500
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            instrumentation.logger.info("upstream %s %s /%s %s %.1f ms",
+                                        self.name, method, path.lstrip("/"), status, elapsed * 1000)
+            with self._lock:
+                self._requests += 1
+                self._errors += failed
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+
+    def get(self, path="", **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path="", **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def _connection_counts(self):
+        """Sums connections opened vs requests sent over every urllib3 pool."""
+        opened = sent = 0
+        for adapter in self.adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        return opened, sent
+
+    def stats(self):
+        opened, sent = self._connection_counts()
+        with self._lock:
+            count = self._requests
+            return {
+                "requests": count,
+                "errors": self._errors,
+                "latency_avg_ms": round(self._total_seconds / count * 1000, 2) if count else 0.0,
+                "latency_max_ms": round(self._max_seconds * 1000, 2),
+                "connections_opened": opened,
+                "connections_reused": max(sent - opened, 0),
+            }
+
+
+class AsyncBackendClient:
+    """httpx-based async counterpart of BackendClient, used by the ASGI app (asgi_app.py).
+
+    Same timeouts, retry rules and counters. The connection pool is created on first
+    use, inside the event loop that serves requests.
+    """
+
+    def __init__(self, name, base_url, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                 no_retry_paths=()):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.no_retry_paths = tuple(path.strip("/") for path in no_retry_paths)
+        self._client = None
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._connections_opened = 0
+
+    def url(self, path=""):
+        if not path:
+            return self.base_url
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return self._client
+
+    async def _trace(self, event, info):
+        # httpcore reports each new TCP connection; everything else reused a pooled one
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self._connections_opened += 1
+
+    async def request(self, method, path="", timeout=None, **kwargs):
+        import httpx
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.setdefault("X-Request-ID", instrumentation.request_id())
+        timeout = timeout or self.timeout
+        # A single number is both timeouts, as with requests
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        # Same rules as the sync adapters: connect failures always retry, gateway
+        # errors only for idempotent calls to paths without side effects
+        retry_status = method in ("GET", "HEAD") and path.strip("/") not in self.no_retry_paths
+
+        started = time.perf_counter()
+        failed = True
+        status = "error"
+        try:
+            with instrumentation.span(f"upstream.{self.name}"):
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = await self._http().request(
+                            method, self.url(path), headers=headers,
+                            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                            extensions={"trace": self._trace}, **kwargs)
+                    except httpx.ConnectError:
+                        if attempt == self.max_retries:
+                            raise
+                    else:
+                        if not (retry_status and response.status_code in RETRY_STATUSES) \
+                                or attempt == self.max_retries:
+                            break
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+            failed = response.status_code >= 500
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            instrumentation.logger.info("upstream %s %s /%s %s %.1f ms",
+                                        self.name, method, path.lstrip("/"), status, elapsed * 1000)
+            with self._lock:
+                self._requests += 1
+                self._errors += failed
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+
+    async def get(self, path="", **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path="", **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        with self._lock:
+            count = self._requests
+            return {
+                "requests": count,
+                "errors": self._errors,
+                "latency_avg_ms": round(self._total_seconds / count * 1000, 2) if count else 0.0,
+                "latency_max_ms": round(self._max_seconds * 1000, 2),
+                "connections_opened": self._connections_opened,
+                "connections_reused": max(count - self._connections_opened, 0),
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, base_url, client_class=BackendClient, **kwargs):
+    """Returns the process-wide client for an upstream, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = client_class(name, base_url, **kwargs)
+        return client
+
+
+def get_async_client(name, base_url, **kwargs):
+    """Like get_client, for AsyncBackendClient."""
+    return get_client(name, base_url, client_class=AsyncBackendClient, **kwargs)
+
+
+def stats():
+    """Per-upstream latency and connection-reuse counters."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.stats() for client in clients}
@@ -0,0 +1,183 @@
+"""Concurrent dashboard users per process: the sync Flask app (gunicorn gthread) vs the ASGI app (uvicorn).
+
+Both serve /dashboard from one process against the same stand-in Poster API. The stand-in
+answers with a canned history page after --api-latency seconds. The history cache is
+disabled, so every page view waits on the API. Each level runs that many logged-in users
+reloading the dashboard back to back. A level is sustained while p95 stays under --slo and
+nothing fails.
+
+Usage: python benchmarks/bench_async_dashboard.py [--users 8 32 128] [--duration 10] [--sync-threads 8]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import local_aws
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def canned_history(count=24):
+    posters = [{
+        "timestamp": f"2024-01-01T00:00:{i:02d}",
+        "prompt_used": f"poster prompt {i}",
+        "paid": i % 2 == 0,
+        "locked": i % 2 == 1,
+        "poster_url": f"https://{local_aws.BUCKET_NAME}.s3.amazonaws.com/poster-{i}.png" if i % 2 == 0 else None,
+    } for i in range(count)]
+    return {"statusCode": 200, "body": json.dumps({"posters": posters, "next_token": None})}
+
+
+def run_upstream(port, latency):
+    """Child process: the stand-in User/Poster API."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    history = json.dumps(canned_history()).encode()
+    # Logins fetch the stored hash (LOGIN_VERIFY=off); every user's password is "pw"
+    user = json.dumps({"statusCode": 200, "body": json.dumps(
+        {"user_id": "bench@example.com", "password": hashlib.sha256(b"pw").hexdigest()})}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, data):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._reply(user if self.path.startswith("/user") else history)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024  # listen backlog; the default 5 resets bursts of new connections
+
+    Server(("127.0.0.1", port), Handler).serve_forever()
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port}")
+
+
+def start_app(mode, port, upstream_url, sync_threads):
+    env = dict(os.environ, USER_API_URL=f"{upstream_url}/user", POSTER_API_BASE=upstream_url,
+               HISTORY_CACHE_SIZE="0", LOG_LEVEL="WARNING", BACKEND_POOL_SIZE="256")
+    if mode == "sync":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", "1", "-k", "gthread", "--threads", str(sync_threads),
+               "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--workers", "1", "--no-access-log",
+               "--log-level", "warning", "--host", "127.0.0.1", "--port", str(port)]
+    proc = subprocess.Popen(cmd, cwd=local_aws.ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return proc
+
+
+async def load(base_url, users, duration):
+    """`users` logged-in browsers reload /dashboard for `duration` seconds; returns (latencies, errors)."""
+    import httpx
+
+    latencies = []
+    errors = 0
+
+    async def user(i):
+        nonlocal errors
+        limits = httpx.Limits(max_connections=1)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await client.post("/login", data={"email": f"user{i}@example.com", "password": "pw"})
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get("/dashboard")
+                    ok = response.status_code == 200 and "poster prompt" in response.text
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return latencies, errors
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * p / 100), len(samples) - 1)] * 1000 if samples else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--api-latency", type=float, default=0.1, help="seconds per Poster API call")
+    parser.add_argument("--sync-threads", type=int, default=8, help="gunicorn gthread threads for the sync app")
+    parser.add_argument("--slo", type=float, default=1.0, help="p95 budget in seconds")
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = subprocess.Popen([sys.executable, __file__, "--upstream", str(upstream_port), str(args.api_latency)])
+    try:
+        wait_for_port(upstream_port)
+        upstream_url = f"http://127.0.0.1:{upstream_port}"
+
+        print(f"{args.api_latency * 1000:.0f} ms API latency, {args.duration:.0f} s per level, "
+              f"sync app on {args.sync_threads} threads")
+        print(f"{'mode':<6} {'users':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        sustained = {}
+        for mode in ("sync", "async"):
+            port = free_port()
+            proc = start_app(mode, port, upstream_url, args.sync_threads)
+            try:
+                for users in args.users:
+                    latencies, errors = asyncio.run(load(f"http://127.0.0.1:{port}", users, args.duration))
+                    p95 = percentile(latencies, 95)
+                    print(f"{mode:<6} {users:>6} {len(latencies) / args.duration:>8.1f} "
+                          f"{percentile(latencies, 50):>8.1f} {p95:>8.1f} {errors:>7}")
+                    if not errors and latencies and p95 <= args.slo * 1000:
+                        sustained[mode] = users
+            finally:
+                proc.terminate()
+                proc.wait()
+
+        print(f"\nsustained users per process (p95 <= {args.slo * 1000:.0f} ms): "
+              + ", ".join(f"{mode} {sustained.get(mode, 0)}" for mode in ("sync", "async")))
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--upstream":
+        run_upstream(int(sys.argv[2]), float(sys.argv[3]))
+    else:
+        main()
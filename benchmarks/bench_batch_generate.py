@@ -0,0 +1,64 @@
+"""Poster throughput: N one-at-a-time generations vs one batch request with N variations.
+
+Bedrock and S3 latency are simulated on top of the moto stand-ins so the numbers
+reflect round trips rather than local CPU.
+
+Usage: python benchmarks/bench_batch_generate.py [--variations 4] [--bedrock-latency 2.0]
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import local_aws
+
+# Every request should reach the (fake) model
+os.environ["GENERATION_CACHE"] = "off"
+
+
+def with_latency(fn, seconds):
+    def wrapper(*args, **kwargs):
+        time.sleep(seconds)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def run(handler, events):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in events:
+            response = handler(event, None)
+            assert response["statusCode"] == 200, response
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variations", type=int, default=4)
+    parser.add_argument("--bedrock-latency", type=float, default=2.0, help="seconds per invoke_model call")
+    parser.add_argument("--per-image-latency", type=float, default=0.5, help="extra seconds per image")
+    parser.add_argument("--s3-latency", type=float, default=0.15, help="seconds per put_object")
+    args = parser.parse_args()
+
+    mock = local_aws.start()
+    try:
+        designer = local_aws.load_handler("poster_designer")
+        bedrock = local_aws.FakeBedrock(args.bedrock_latency, args.per_image_latency)
+        designer.bedrock = lambda: bedrock
+        s3 = designer.s3()
+        s3.put_object = with_latency(s3.put_object, args.s3_latency)
+
+        n = args.variations
+        single = run(designer.lambda_handler, [{"prompt": f"poster {i}", "user_id": "bench"} for i in range(n)])
+        batch = run(designer.lambda_handler, [{"prompt": "poster", "user_id": "bench", "variations": n}])
+
+        print(f"{'mode':<12} {'posters':>8} {'seconds':>8} {'posters/s':>10}")
+        print(f"{'one-by-one':<12} {n:>8} {single:>8.2f} {n / single:>10.2f}")
+        print(f"{'batch':<12} {n:>8} {batch:>8.2f} {n / batch:>10.2f}")
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Checkout of N posters: N single /unlock requests vs one multi-poster request.
+
+Runs the Flask app against the payment handler served over local HTTP. Each API call pays
+a simulated API Gateway + Lambda hop (--api-latency), so the numbers show round trips
+rather than moto's local CPU.
+
+Usage: python benchmarks/bench_batch_unlock.py [--posters 1 10 50 200] [--api-latency 0.05]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import boto3
+
+import local_aws
+
+USER_ID = "user0@example.com"
+
+
+def reset_paid(keys):
+    table = boto3.resource("dynamodb").Table("UserPosterHistory")
+    for user_id, timestamp in keys:
+        table.update_item(Key={"user_id": user_id, "timestamp": timestamp},
+                          UpdateExpression="SET paid = :paid", ExpressionAttributeValues={":paid": False})
+
+
+def paid_count(keys):
+    table = boto3.resource("dynamodb").Table("UserPosterHistory")
+    return sum(bool(table.get_item(Key={"user_id": u, "timestamp": t})["Item"]["paid"]) for u, t in keys)
+
+
+def checkout(client, timestamps, batch):
+    """Returns seconds to unlock every poster; one request per poster unless `batch`."""
+    started = time.perf_counter()
+    if batch:
+        response = client.post("/unlock", data={"timestamp": timestamps},
+                               headers={"Accept": "application/json"})
+        assert response.status_code == 200 and len(response.get_json()["unlocked"]) == len(timestamps), \
+            response.get_data(as_text=True)
+    else:
+        for timestamp in timestamps:
+            response = client.post("/unlock", data={"timestamp": timestamp},
+                                   headers={"Accept": "application/json"})
+            assert response.status_code == 200, response.get_data(as_text=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posters", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--api-latency", type=float, default=0.05, help="seconds per API call")
+    args = parser.parse_args()
+
+    mock = local_aws.start()
+    try:
+        keys = local_aws.seed_history(max(args.posters), users=1)
+        server = local_aws.serve({("POST", "/pay"): "payment"}, latency=args.api_latency)
+        app = local_aws.load_app(server).app
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = USER_ID
+
+        print(f"API latency {args.api_latency * 1000:.0f} ms per call")
+        print(f"{'posters':>8} {'mode':<8} {'API calls':>10} {'seconds':>8} {'posters/s':>10}")
+        for n in args.posters:
+            subset = keys[:n]
+            for batch in (False, True):
+                reset_paid(subset)
+                calls = server.calls
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seconds = checkout(client, [timestamp for _, timestamp in subset], batch)
+                assert paid_count(subset) == n
+                print(f"{n:>8} {'batch' if batch else 'single':<8} {server.calls - calls:>10} "
+                      f"{seconds:>8.2f} {n / seconds:>10.1f}")
+        server.shutdown()
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Cold start per Lambda handler: module import time, clients built at import, first invoke.
+
+Each handler runs in a fresh interpreter (a new Lambda container) against moto, so module
+state from one handler never warms another.
+
+Usage: python benchmarks/bench_cold_start.py [--runs 5] [--handlers get_user payment]
+"""
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+HANDLERS = ["create_user", "get_user", "update_user", "delete_user", "get_history", "payment", "poster_designer"]
+
+EVENTS = {
+    "create_user": {"user_id": "cold@example.com", "password": "x"},
+    "get_user": {"user_id": "cold@example.com"},
+    "update_user": {"user_id": "cold@example.com", "password": "y"},
+    "delete_user": {"user_id": "cold@example.com"},
+    "get_history": {"user_id": "user0@example.com"},
+    "payment": {"user_id": "user0@example.com", "timestamp": "2024-01-01T00:00:00.000000"},
+    "poster_designer": {"user_id": "cold@example.com", "prompt": "a lighthouse in a storm"},
+}
+
+
+def child(name):
+    """Runs in the subprocess: times the import and first invoke of one handler."""
+    import importlib
+
+    import boto3
+
+    import local_aws
+
+    mock = local_aws.start()
+    local_aws.seed_history(10)
+    boto3.resource("dynamodb").Table("UserLoginData").put_item(
+        Item={"user_id": "cold@example.com", "password": "x"})
+
+    # Count boto3 clients/resources the module builds while it is imported
+    created = []
+    for factory in ("client", "resource"):
+        original = getattr(boto3, factory)
+
+        def counting(*args, _original=original, **kwargs):
+            created.append(args[0] if args else kwargs.get("service_name"))
+            return _original(*args, **kwargs)
+
+        setattr(boto3, factory, counting)
+
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    import_ms = (time.perf_counter() - started) * 1000
+    at_import = list(created)
+
+    if name == "poster_designer":
+        bedrock = local_aws.FakeBedrock(latency=0)
+        module.bedrock = lambda: bedrock
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module.lambda_handler(dict(EVENTS[name]), None)
+    first_ms = (time.perf_counter() - started) * 1000
+
+    mock.stop()
+    print(json.dumps({
+        "import_ms": import_ms,
+        "first_invoke_ms": first_ms,
+        "clients_at_import": at_import,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--handlers", nargs="+", default=HANDLERS, choices=HANDLERS)
+    args = parser.parse_args()
+
+    print(f"{'handler':<16} {'import ms':>10} {'1st invoke ms':>14}  clients built at import")
+    for name in args.handlers:
+        results = []
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, __file__, "--child", name],
+                                 check=True, capture_output=True, text=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        import_ms = statistics.median(r["import_ms"] for r in results)
+        first_ms = statistics.median(r["first_invoke_ms"] for r in results)
+        clients = ", ".join(results[0]["clients_at_import"]) or "none"
+        print(f"{name:<16} {import_ms:>10.1f} {first_ms:>14.1f}  {clients}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        child(sys.argv[2])
+    else:
+        main()
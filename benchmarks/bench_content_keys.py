@@ -0,0 +1,70 @@
+"""Content-addressed poster storage: S3 objects, bytes and upload time vs unique content.
+
+Runs the designer Lambda against moto with the generation cache off. In one workload the
+fake model keeps returning the same image (regenerations, identical seeds); in the other,
+every image is new. S3 writes get a simulated round trip. Storage and PUT time should
+follow the number of unique images, not the number of generations.
+
+Usage: python benchmarks/bench_content_keys.py [--generations 12] [--s3-latency 0.15]
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import boto3
+
+import local_aws
+
+os.environ["GENERATION_CACHE"] = "off"
+os.environ.setdefault("POSTER_DERIVATIVES", "off")
+
+
+def counted(fn, seconds, counter):
+    def wrapper(*args, **kwargs):
+        counter["puts"] += 1
+        time.sleep(seconds)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def bucket_usage():
+    objects = boto3.client("s3").list_objects_v2(Bucket=local_aws.BUCKET_NAME).get("Contents", [])
+    return len(objects), sum(o["Size"] for o in objects)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--generations", type=int, default=12)
+    parser.add_argument("--s3-latency", type=float, default=0.15, help="seconds per S3 write")
+    args = parser.parse_args()
+
+    print(f"{'images':<10} {'generations':>11} {'objects':>8} {'stored MB':>10} {'PUTs':>5} {'upload s':>9}")
+    for unique in (False, True):
+        mock = local_aws.start()
+        try:
+            designer = local_aws.load_handler("poster_designer")
+            bedrock = local_aws.FakeBedrock(unique=unique)
+            designer.bedrock = lambda: bedrock
+            s3 = designer.s3()
+            counter = {"puts": 0}
+            # upload_fileobj sends small files with put_object as well
+            s3.put_object = counted(s3.put_object, args.s3_latency, counter)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(args.generations):
+                    response = designer.lambda_handler({"prompt": f"poster {i}", "user_id": "bench"}, None)
+                    assert response["statusCode"] == 200, response
+
+            rows = boto3.resource("dynamodb").Table("UserPosterHistory").scan()["Items"]
+            assert all(row["s3_key"] in row["poster_url"] for row in rows)
+            objects, size = bucket_usage()
+            print(f"{'unique' if unique else 'repeated':<10} {args.generations:>11} {objects:>8} "
+                  f"{size / 1024 / 1024:>10.1f} {counter['puts']:>5} {counter['puts'] * args.s3_latency:>9.2f}")
+        finally:
+            mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Image bytes per dashboard page: full-size PNGs vs the WebP previews/thumbnails.
+
+Usage: python benchmarks/bench_dashboard_bytes.py [--page-size 24]
+Requires Pillow.
+"""
+import argparse
+import io
+
+import local_aws
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=24, help="posters per dashboard page")
+    args = parser.parse_args()
+
+    designer = local_aws.load_handler("poster_designer")
+    if designer.Image is None:
+        raise SystemExit("Pillow is required for this benchmark")
+
+    original = local_aws.fake_png()
+    sizes = {"full PNG": len(original)}
+    for name, data in designer.make_derivatives(io.BytesIO(original)).items():
+        sizes[f"{name} WebP"] = len(data)
+
+    print(f"{'image':<16} {'bytes each':>12} {'per page (MB)':>14}")
+    for name, size in sizes.items():
+        print(f"{name:<16} {size:>12,} {size * args.page_size / 1024 / 1024:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Decoding a 1,000-poster /history response: legacy per-route parsing vs api_responses.
+
+Usage: python benchmarks/bench_decode.py [--posters 1000] [--runs 200]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_responses
+
+
+def legacy_decode(text):
+    """The dashboard's previous hand-rolled parsing."""
+    data = json.loads(text)
+    posters = json.loads(data["body"]) if isinstance(data.get("body"), str) else data
+    if isinstance(posters, dict):
+        posters = posters.get("posters") or []
+    parsed = []
+    for p in posters:
+        parsed.append(json.loads(p) if isinstance(p, str) else p)
+    for p in parsed:
+        if p.get("poster_url"):
+            p["poster_url"] = p["poster_url"].strip("\\").strip('"')
+    return parsed
+
+
+def new_decode(text):
+    _, data = api_responses.unwrap(api_responses.loads(text))
+    if isinstance(data, dict):
+        data = data["posters"]
+    return api_responses.clean_poster_urls(data)
+
+
+def make_posters(count):
+    return [{
+        "timestamp": f"2024-01-01T00:00:{i:06d}",
+        "prompt_used": f"A cyberpunk detective in a rainy neon city, take {i}",
+        "paid": i % 2 == 0,
+        "locked": i % 2 == 1,
+        "poster_url": f"https://movie-poster-design-caa900.s3.amazonaws.com/poster-{i}.png" if i % 2 == 0 else None,
+    } for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posters", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    posters = make_posters(args.posters)
+    payloads = {
+        # statusCode/body envelope with every poster as its own JSON string (three decodes each)
+        "envelope+strings": json.dumps({"statusCode": 200, "body": json.dumps([json.dumps(p) for p in posters])}),
+        # statusCode/body envelope around the paginated object
+        "envelope": json.dumps({"statusCode": 200, "body": json.dumps({"posters": posters, "next_token": None})}),
+        # PLAIN_JSON_RESPONSES=on
+        "plain": json.dumps({"posters": posters, "next_token": None}),
+    }
+
+    print(f"orjson: {'yes' if api_responses.orjson else 'no'}")
+    print(f"{'payload':<18} {'legacy ms':>10} {'new ms':>10}")
+    for name, text in payloads.items():
+        assert legacy_decode(text) == new_decode(text)
+        legacy = timeit.timeit(lambda: legacy_decode(text), number=args.runs) / args.runs * 1000
+        new = timeit.timeit(lambda: new_decode(text), number=args.runs) / args.runs * 1000
+        print(f"{name:<18} {legacy:>10.3f} {new:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
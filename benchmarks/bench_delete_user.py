@@ -0,0 +1,142 @@
+"""Cascading account deletion against moto: a user with --posters history rows and their S3 objects.
+
+Seeds the account with content-addressed posters (each with thumbnail and preview copies)
+and their ownership records. A second user owns --shared of the same objects, and
+--legacy rows predate ownership tracking. The DeleteUser handler then runs in invocations
+of at most --budget seconds each, like Lambda runs that are cut short and called again,
+until it reports done. The check at the end: the partition is empty, the other user's
+posters and every shared or legacy object are still there, and nothing else is left.
+
+Usage: python benchmarks/bench_delete_user.py [--posters 10000] [--shared 500] [--legacy 100] [--budget 15]
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+
+import boto3
+
+import local_aws
+
+os.environ.setdefault("DELETE_TIME_RESERVE_MS", "0")
+
+
+class Context:
+    """The part of the Lambda context the handler uses."""
+
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def seed(args, objects):
+    """Writes the history rows, S3 objects and owner sets; returns (keys, shared keys, legacy keys)."""
+    s3 = boto3.client("s3")
+    history = boto3.resource("dynamodb").Table("UserPosterHistory")
+    owners = boto3.resource("dynamodb").Table("PosterObjectOwners")
+    boto3.resource("dynamodb").Table("UserLoginData").put_item(Item={"user_id": "doomed@example.com"})
+
+    keys = []
+    for i in range(args.posters):
+        digest = hashlib.sha256(f"poster {i}".encode()).hexdigest()
+        keys.append(f"posters/{digest[:2]}/{digest[2:4]}/{digest}.png")
+    shared = set(keys[:args.shared])
+    legacy = [f"poster-legacy-{i}.png" for i in range(args.legacy)]
+
+    for key in keys:
+        for name in ("", "-thumbnail", "-preview"):
+            s3.put_object(Bucket=local_aws.BUCKET_NAME, Key=key if not name else objects.derivative_key(key, name[1:]),
+                          Body=b"x")
+    for key in legacy:
+        s3.put_object(Bucket=local_aws.BUCKET_NAME, Key=key, Body=b"x")
+
+    with history.batch_writer() as batch:
+        for i, key in enumerate(keys):
+            batch.put_item(Item={"user_id": "doomed@example.com", "timestamp": f"2024-01-01T00:00:00.{i:06d}",
+                                 "prompt_used": f"poster {i}", "paid": True, "s3_key": key,
+                                 "poster_url": objects_url(key)})
+            if key in shared:
+                batch.put_item(Item={"user_id": "other@example.com", "timestamp": f"2024-01-01T00:00:00.{i:06d}",
+                                     "prompt_used": f"poster {i}", "paid": False, "s3_key": key,
+                                     "poster_url": objects_url(key)})
+        for i, key in enumerate(legacy):
+            batch.put_item(Item={"user_id": "doomed@example.com", "timestamp": f"2023-01-01T00:00:00.{i:06d}",
+                                 "prompt_used": f"legacy {i}", "paid": True, "poster_url": objects_url(key)})
+    with owners.batch_writer() as batch:
+        for key in keys:
+            users = {"doomed@example.com", "other@example.com"} if key in shared else {"doomed@example.com"}
+            batch.put_item(Item={"object_key": key, "owners": users})
+    return keys, shared, legacy
+
+
+def objects_url(key):
+    return f"https://{local_aws.BUCKET_NAME}.s3.amazonaws.com/{key}"
+
+
+def bucket_keys():
+    keys = set()
+    for page in boto3.client("s3").get_paginator("list_objects_v2").paginate(Bucket=local_aws.BUCKET_NAME):
+        keys.update(o["Key"] for o in page.get("Contents", []))
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posters", type=int, default=10000)
+    parser.add_argument("--shared", type=int, default=500, help="posters another user also owns")
+    parser.add_argument("--legacy", type=int, default=100, help="rows from before ownership tracking")
+    parser.add_argument("--budget", type=float, default=15.0, help="seconds per invocation")
+    args = parser.parse_args()
+
+    mock = local_aws.start()
+    try:
+        objects = local_aws.load_handler("poster_objects")
+        started = time.perf_counter()
+        keys, shared, legacy = seed(args, objects)
+        print(f"seeded {args.posters} posters ({3 * args.posters + args.legacy} objects) "
+              f"in {time.perf_counter() - started:.1f} s")
+
+        handler = local_aws.load_handler("delete_user")
+        started = time.perf_counter()
+        invocations = 0
+        while True:
+            invocations += 1
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = handler.lambda_handler({"user_id": "doomed@example.com"}, Context(args.budget))
+            body = json.loads(result["body"])
+            print(f"invocation {invocations}: {result['statusCode']} {body.get('deleted_posters')} posters, "
+                  f"{body.get('deleted_objects')} objects removed, {body.get('kept_objects')} kept")
+            if body.get("done") or invocations >= 50:
+                break
+        seconds = time.perf_counter() - started
+
+        history = boto3.resource("dynamodb").Table("UserPosterHistory")
+        left = history.query(KeyConditionExpression="user_id = :u",
+                             ExpressionAttributeValues={":u": "doomed@example.com"})["Count"]
+        others = history.query(KeyConditionExpression="user_id = :u",
+                               ExpressionAttributeValues={":u": "other@example.com"})["Count"]
+        remaining = bucket_keys()
+        expected = set(legacy)
+        for key in shared:
+            expected.update([key] + [objects.derivative_key(key, name) for name in objects.DERIVATIVE_NAMES])
+        owner_items = boto3.resource("dynamodb").Table("PosterObjectOwners").scan()["Items"]
+
+        print(f"\n{args.posters + args.legacy} rows deleted in {seconds:.1f} s over {invocations} invocation(s) "
+              f"({(args.posters + args.legacy) / seconds:.0f} rows/s)")
+        print(f"rows left: {left}; other user's rows: {others}/{len(shared)}")
+        print(f"objects left: {len(remaining)} (expected {len(expected)}: shared + legacy); "
+              f"unexpected: {len(remaining - expected)}, missing: {len(expected - remaining)}")
+        print(f"owner records left: {len(owner_items)}, all owned by the other user: "
+              f"{all(item['owners'] == {'other@example.com'} for item in owner_items)}")
+        assert left == 0 and others == len(shared) and remaining == expected
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Upstream call latency: API Gateway over HTTP vs the handlers run in-process (BACKEND_TRANSPORT=embedded).
+
+Both transports drive the same Lambda handlers against the moto stand-ins, through the
+app's own login check, history fetch and unlock calls. The HTTP path goes through the
+local API stand-in; --api-latency adds the API Gateway + Lambda invoke hop on top
+(0 shows the pure HTTP and JSON envelope cost).
+
+Usage: python benchmarks/bench_embedded.py [--calls 200] [--api-latency 0 0.03]
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import statistics
+import time
+
+import local_aws
+
+# verify_user signs session tokens; the app checks them with the same secret
+os.environ.setdefault("AUTH_TOKEN_SECRET", "bench-secret")
+
+
+def timed(fn, calls):
+    samples = []
+    for i in range(calls):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def measure(app, calls, user_id, password, timestamps):
+    password_hash = hashlib.sha256(password.encode()).hexdigest()
+
+    def login(i):
+        assert app.check_credentials(user_id, password_hash)["status"] == "ok"
+
+    def history(i):
+        assert app.fetch_history_page(user_id)["posters"]
+
+    def unlock(i):
+        response = app.poster_api.post("pay", json={"user_id": user_id, "timestamp": timestamps[i % len(timestamps)]})
+        assert app.apply_unlock(user_id, response)[1] is None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {name: timed(fn, calls) for name, fn in
+                (("login", login), ("history", history), ("unlock", unlock))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200, help="calls per operation")
+    parser.add_argument("--history", type=int, default=24, help="posters in the user's history")
+    parser.add_argument("--api-latency", type=float, nargs="+", default=[0, 0.03],
+                        help="simulated API Gateway + invoke seconds per HTTP call")
+    args = parser.parse_args()
+
+    mock = local_aws.start()
+    try:
+        (user_id, password), = local_aws.seed_users(1)
+        timestamps = [timestamp for _, timestamp in local_aws.seed_history(args.history, users=1, paid=True)]
+        routes = {("GET", "/user"): "get_user", ("POST", "/user/verify"): "verify_user",
+                  ("POST", "/pay"): "payment", ("GET", "/history"): "get_history"}
+        servers = {latency: local_aws.serve(routes, latency=latency) for latency in args.api_latency}
+        app = local_aws.load_app(servers[args.api_latency[0]])
+
+        import backend_client
+        import embedded
+
+        transports = {}
+        for latency, server in servers.items():
+            transports[f"http +{latency * 1000:.0f}ms"] = (
+                backend_client.BackendClient(f"user_api_{latency}", f"{server.url}/user"),
+                backend_client.BackendClient(f"poster_api_{latency}", server.url))
+        transports["embedded"] = (embedded.EmbeddedClient("user_api", "/user"), embedded.EmbeddedClient("poster_api"))
+
+        print(f"{args.calls} calls per operation, p50 / p95 in ms")
+        print(f"{'transport':<14} {'login':>15} {'history':>15} {'unlock':>15}")
+        for name, (user_api, poster_api) in transports.items():
+            app.user_api, app.poster_api = user_api, poster_api
+            results = measure(app, args.calls, user_id, password, timestamps)
+            print(f"{name:<14} " + " ".join(f"{p50:>7.2f} /{p95:>6.2f}" for p50, p95 in results.values()))
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
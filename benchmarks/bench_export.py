@@ -0,0 +1,125 @@
+"""History export: throughput and memory of /export as the archive grows.
+
+The history Lambda serves a user's paid posters from moto; a local stand-in for the S3
+bucket returns a ~1.5 MB PNG per poster after a simulated round trip. Each run streams
+/export?format=zip (and NDJSON) through the Flask test client without keeping the body,
+and reports the Python heap peak (tracemalloc), which should stay flat as the archive grows,
+and the time taken for each image prefetch window.
+
+Usage: python benchmarks/bench_export.py [--posters 40 160] [--prefetch 1 4 8] [--s3-latency 0.05]
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+
+import local_aws
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def serve_images(images, latency):
+    """Stand-in for the public bucket: any path returns one of `images` after `latency`."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            data = images[hash(self.path) % len(images)]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stream_export(client, fmt, path=None):
+    """Streams one export; returns (bytes, seconds, heap peak MB). Writes it to `path` if given."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(f"/export?format={fmt}", buffered=False)
+    assert response.status_code == 200, response.status_code
+    size = 0
+    out = open(path, "wb") if path else None
+    try:
+        for chunk in response.response:
+            size += len(chunk)
+            if out:
+                out.write(chunk)
+    finally:
+        response.close()
+        if out:
+            out.close()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, seconds, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posters", type=int, nargs="+", default=[40, 160])
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--s3-latency", type=float, default=0.05, help="seconds per image GET")
+    args = parser.parse_args()
+
+    images = [local_aws.fake_png(seed=i) for i in range(4)]
+    bucket = serve_images(images, args.s3_latency)
+    os.environ["POSTER_BUCKET_URL"] = bucket.url
+
+    mock = local_aws.start()
+    try:
+        print(f"{'posters':>7} {'format':<7} {'prefetch':>8} {'MB out':>7} {'seconds':>8} {'MB/s':>6} {'heap peak MB':>13}")
+        app_module = None
+        for count in args.posters:
+            local_aws.seed_users(1)
+            local_aws.seed_history(count, paid=True)
+            if app_module is None:
+                server = local_aws.serve({("GET", "/history"): "get_history"}, serialize=True)
+                app_module = local_aws.load_app(server)
+            client = app_module.app.test_client()
+            with client.session_transaction() as session:
+                session["user_id"] = "user0@example.com"
+
+            size, seconds, peak = stream_export(client, "ndjson")
+            print(f"{count:>7} {'ndjson':<7} {'-':>8} {size / 1e6:>7.2f} {seconds:>8.2f} "
+                  f"{size / 1e6 / seconds:>6.1f} {peak:>13.2f}")
+
+            for prefetch in args.prefetch:
+                app_module.export.EXPORT_PREFETCH = prefetch
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = os.path.join(tmp, "export.zip")
+                    size, seconds, peak = stream_export(client, "zip", path)
+                    with zipfile.ZipFile(path) as archive:
+                        names = archive.namelist()
+                        lines = archive.read("history.ndjson").decode().splitlines()
+                    assert len(names) == count + 1 and len(lines) == count, (len(names), len(lines))
+                    assert not any("export_error" in json.loads(line) for line in lines)
+                print(f"{count:>7} {'zip':<7} {prefetch:>8} {size / 1e6:>7.2f} {seconds:>8.2f} "
+                      f"{size / 1e6 / seconds:>6.1f} {peak:>13.2f}")
+        server.shutdown()
+    finally:
+        mock.stop()
+        bucket.shutdown()
+
+
+if __name__ == "__main__":
+    main()
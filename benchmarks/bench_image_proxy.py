@@ -0,0 +1,159 @@
+"""Poster image delivery through /posters: disk-cache hit rate and bytes fetched from the bucket.
+
+A stand-in bucket serves the posters over HTTP, path-style, with --origin-latency per
+request. Like a private bucket, it refuses requests without a presigned signature. The app
+runs with IMAGE_ORIGIN=presigned and a --cache-mb disk cache. Browsers load dashboard grids
+whose posters follow a skewed popularity. Each browser keeps what it has loaded
+(the route sends immutable, private caching), so the proxy only sees each browser's first
+load of an image. The report covers:
+
+  - hit rate, origin bytes and served bytes;
+  - p50 latency of hits vs misses;
+  - a revalidation (expects 304) and a Range download (expects 206).
+
+Usage: python benchmarks/bench_image_proxy.py [--posters 200] [--browsers 40] [--cache-mb 32]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import local_aws
+
+BUCKET = "poster-bench"
+
+
+def start_bucket(objects, latency):
+    """HTTP stand-in for a private S3 bucket; counts the requests and bytes it serves."""
+    counts = {"requests": 0, "bytes": 0, "unsigned": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            key = url.path[len(f"/{BUCKET}/"):]
+            time.sleep(latency)
+            if "X-Amz-Signature" not in parse_qs(url.query):
+                status, body = 403, b"AccessDenied"
+                with lock:
+                    counts["unsigned"] += 1
+            elif key in objects:
+                status, body = 200, objects[key]
+            else:
+                status, body = 404, b"NoSuchKey"
+            with lock:
+                counts["requests"] += 1
+                counts["bytes"] += len(body) if status == 200 else 0
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posters", type=int, default=200)
+    parser.add_argument("--poster-kb", type=int, default=300)
+    parser.add_argument("--browsers", type=int, default=40)
+    parser.add_argument("--grids", type=int, default=5, help="dashboard grids each browser loads")
+    parser.add_argument("--grid-size", type=int, default=24)
+    parser.add_argument("--cache-mb", type=int, default=32)
+    parser.add_argument("--origin-latency", type=float, default=0.03, help="seconds per bucket request")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    keys = [f"posters/{i:02x}/{i:04d}.png" for i in range(args.posters)]
+    objects = {key: rng.randbytes(args.poster_kb * 1024) for key in keys}
+    bucket, origin_url, origin = start_bucket(objects, args.origin_latency)
+
+    cache_dir = tempfile.mkdtemp(prefix="bench-image-cache-")
+    os.environ.update(IMAGE_ORIGIN="presigned", S3_ENDPOINT_URL=origin_url, POSTER_BUCKET=BUCKET,
+                      POSTER_BUCKET_URL=f"{origin_url}/{BUCKET}", IMAGE_CACHE_DIR=cache_dir,
+                      IMAGE_CACHE_MAX_MB=str(args.cache_mb), LOG_LEVEL="WARNING",
+                      AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench", AWS_DEFAULT_REGION="us-east-1")
+    if local_aws.ROOT not in sys.path:
+        sys.path.insert(0, local_aws.ROOT)
+    import app as web
+
+    user_id = "bench@example.com"
+
+    def proxy_url(key, download=False):
+        # The link the dashboard template renders for the user's poster, signed for that user
+        with web.app.test_request_context():
+            web.session["user_id"] = user_id
+            return web.image_url(f"{origin_url}/{BUCKET}/{key}", download)
+
+    client = web.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+
+    # Popularity falls off with rank, as new and shared posters get most of the views
+    weights = [1 / (rank + 1) for rank in range(args.posters)]
+    latencies = {"hit": [], "miss": []}
+    first_loads = 0
+    for _ in range(args.browsers):
+        seen = set()
+        for _ in range(args.grids):
+            for key in rng.choices(keys, weights, k=args.grid_size):
+                if key in seen:
+                    continue  # immutable: the browser does not ask again
+                seen.add(key)
+                first_loads += 1
+                url = proxy_url(key)
+                before = web.poster_image_cache.stats()["hits"]
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+                assert response.status_code == 200 and response.data == objects[key], response.status_code
+                latencies["hit" if web.poster_image_cache.stats()["hits"] > before else "miss"].append(elapsed)
+
+    stats = web.poster_image_cache.stats()
+    print(f"{args.posters} posters x {args.poster_kb} KB, {args.browsers} browsers x {args.grids} grids "
+          f"of {args.grid_size}, {args.cache_mb} MB cache, bucket latency {args.origin_latency * 1000:.0f} ms")
+    print(f"browser first loads   {first_loads}")
+    print(f"cache hit ratio       {stats['hit_ratio']:.1%}  ({stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['evictions']} evictions)")
+    print(f"bytes served          {stats['served_bytes'] / 1e6:8.1f} MB")
+    print(f"bytes from bucket     {stats['origin_bytes'] / 1e6:8.1f} MB  ({origin['requests']} presigned GETs, "
+          f"{origin['unsigned']} unsigned)")
+    for kind, samples in latencies.items():
+        if samples:
+            print(f"p50 {kind:<4}              {statistics.median(samples):8.2f} ms")
+
+    # Revalidation and resumed download of the most popular poster
+    url = proxy_url(keys[0], download=True)
+    full = client.get(url)
+    revalidated = client.get(url, headers={"If-None-Match": full.headers["ETag"]})
+    partial = client.get(url, headers={"Range": "bytes=1000-1999"})
+    assert revalidated.status_code == 304, revalidated.status_code
+    assert partial.status_code == 206 and partial.data == objects[keys[0]][1000:2000], partial.status_code
+    unsigned = client.get(url.split("?")[0])
+    assert unsigned.status_code == 404, unsigned.status_code
+    print(f"If-None-Match         {revalidated.status_code} ({len(revalidated.data)} bytes)")
+    print(f"Range bytes=1000-1999 {partial.status_code} ({partial.headers['Content-Range']})")
+    print(f"Cache-Control         {full.headers['Cache-Control']}")
+    print(f"unsigned link         {unsigned.status_code}")
+    bucket.shutdown()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Login throughput: stored-hash fetch vs the verify endpoint, with and without the login cache.
+
+Runs the Flask app against the user Lambdas served over local HTTP (moto DynamoDB behind them).
+
+Usage: python benchmarks/bench_login.py [--logins 2000] [--users 50] [--threads 16] [--latency 0.02]
+"""
+import argparse
+import contextlib
+import io
+import os
+import threading
+import time
+
+import local_aws
+
+os.environ.setdefault("AUTH_TOKEN_SECRET", "bench-secret")
+
+
+class NoSharing:
+    """Stands in for caching.SingleFlight with in-flight sharing turned off."""
+
+    def do(self, key, fn):
+        return fn()
+
+
+def run(app_module, users, logins, threads):
+    """Logs in `logins` times spread over `users` accounts; returns logins/sec."""
+    per_thread = logins // threads
+    failures = []
+
+    def worker(offset):
+        client = app_module.app.test_client()
+        for i in range(per_thread):
+            user = (offset + i) % users
+            response = client.post("/login", data={"email": f"user{user}@example.com", "password": f"pw{user}"})
+            if response.status_code != 302:
+                failures.append(response.status_code)
+
+    pool = [threading.Thread(target=worker, args=(t * 7,)) for t in range(threads)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise RuntimeError(f"{len(failures)} logins failed")
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated API hop, seconds")
+    args = parser.parse_args()
+
+    mock = local_aws.start()
+    try:
+        local_aws.seed_users(args.users)
+        server = local_aws.serve({("GET", "/user"): "get_user", ("POST", "/user/verify"): "verify_user"},
+                                 latency=args.latency)
+        app = local_aws.load_app(server)
+        import caching
+
+        # "no cache" modes also disable in-flight sharing, like the app before the login cache
+        modes = [
+            ("fetch hash, no cache", False, 0),
+            ("verify, no cache", True, 0),
+            ("verify + login cache", True, app.LOGIN_CACHE_TTL),
+        ]
+        print(f"{args.logins} logins, {args.users} users, {args.threads} threads, {args.latency * 1000:.0f} ms API hop")
+        print(f"{'mode':<24} {'logins/s':>10} {'backend calls':>14}")
+        for label, verify, ttl in modes:
+            app.LOGIN_VERIFY = verify
+            app.login_cache = caching.LRUCache(maxsize=4096 if ttl else 0, ttl=ttl or 1)
+            app.login_flights = caching.SingleFlight() if ttl else NoSharing()
+            calls_before = server.calls
+            rate = run(app, args.users, args.logins, args.threads)
+            print(f"{label:<24} {rate:>10.0f} {server.calls - calls_before:>14}")
+        server.shutdown()
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Prompt pre-screening: how fast disallowed prompts and double submits are turned away.
+
+1. The compiled keyword matcher vs a per-keyword loop over the same prompts.
+2. A disallowed prompt rejected by the designer Lambda and by the Flask /generate route;
+   neither reaches Bedrock, S3 or the job queue.
+3. Rapid double submits of one prompt: how many generation jobs they create.
+
+Usage: python benchmarks/bench_prescreen.py [--prompts 20000] [--submits 20]
+"""
+import argparse
+import contextlib
+import io
+import random
+import threading
+import time
+
+import local_aws
+
+import prompt_policy
+
+WORDS = ("a noir detective story in a rainy city with neon lights and a lone saxophone "
+         "player under the bridge at midnight featuring a robot cat and golden sunset").split()
+
+
+def sample_prompts(count, disallowed_share=0.2):
+    rng = random.Random(7)
+    prompts = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(8, 60))
+        if rng.random() < disallowed_share:
+            words.insert(rng.randrange(len(words)), rng.choice(prompt_policy.DISALLOWED_KEYWORDS))
+        prompts.append(" ".join(words))
+    return prompts
+
+
+def loop_matcher(prompt):
+    """The straightforward version: one substring scan per keyword."""
+    text = " " + " ".join(prompt.lower().split()) + " "
+    for keyword in prompt_policy.DISALLOWED_KEYWORDS:
+        if f" {keyword} " in text:
+            return keyword
+    return None
+
+
+def per_call_us(fn, items):
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=20000)
+    parser.add_argument("--submits", type=int, default=20, help="identical submits in the double-submit test")
+    args = parser.parse_args()
+
+    prompts = sample_prompts(args.prompts)
+    print(f"matcher over {len(prompts)} prompts ({len(prompt_policy.DISALLOWED_KEYWORDS)} keywords)")
+    print(f"  per-keyword loop     {per_call_us(loop_matcher, prompts):7.2f} us/prompt")
+    print(f"  compiled regex       {per_call_us(prompt_policy.disallowed_keyword, prompts):7.2f} us/prompt")
+
+    # Designer Lambda: the rejection happens before any AWS client is created
+    import poster_designer
+    event = {"queryStringParameters": {"user_id": "bench@example.com", "prompt": "a spy thriller in Paris"}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        lambda_us = per_call_us(lambda _: poster_designer.lambda_handler(event, None), range(2000))
+    print(f"\ndesigner Lambda rejects a disallowed prompt in {lambda_us:.1f} us")
+
+    # Flask route: the upstream is a stand-in whose designer endpoint is never expected to be hit
+    server = local_aws.serve({}, latency=0.5)
+    app_module = local_aws.load_app(server)
+    released = threading.Event()
+    app_module.generation_jobs.runner = lambda job: released.wait(10)
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = "bench@example.com"
+    headers = {"Accept": "application/json"}
+
+    started = time.perf_counter()
+    for _ in range(500):
+        response = client.post("/generate", data={"prompt": "a spy thriller in Paris"}, headers=headers)
+        assert response.status_code == 400, response.status_code
+    route_us = (time.perf_counter() - started) / 500 * 1e6
+    print(f"Flask /generate rejects it in {route_us:.0f} us (upstream calls: {server.calls})")
+
+    # Double submits while the first job is still running
+    variants = ["A lighthouse at dawn", "a lighthouse  at dawn", "A LIGHTHOUSE at dawn "]
+    job_ids = {
+        client.post("/generate", data={"prompt": variants[i % len(variants)]}, headers=headers).get_json()["job_id"]
+        for i in range(args.submits)
+    }
+    released.set()
+    print(f"{args.submits} rapid submits of one prompt -> {len(job_ids)} generation job(s)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Generation admission control under concurrent load, for each limiter backend.
+
+One user hammers /generate from many threads while a group of normal users each submit a
+prompt every few seconds. Generations are replaced by a fixed sleep. The report shows how
+many requests each group got admitted, how fast the 429s came back, whether every 429
+carried Retry-After, and the peak number of generations in flight against the cap.
+
+Usage: python benchmarks/bench_rate_limit.py [--duration 5] [--hammer-threads 16] [--users 10]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import local_aws
+
+os.environ.setdefault("JOB_WORKERS", "64")  # the in-flight cap, not the worker pool, should bound generations
+
+
+def percentile_ms(samples, p):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * p / 100), len(samples) - 1)] * 1000 if samples else 0.0
+
+
+def run(app_module, limiter, args):
+    app_module.generation_limiter = limiter
+    running = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_generation(job):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(args.generate_seconds)
+        with lock:
+            running["now"] -= 1
+        return {"poster_url": "https://example.com/poster.png"}
+
+    app_module.generation_jobs.runner = fake_generation
+    results = {"hammer": [], "normal": []}  # (status, seconds, has Retry-After)
+    deadline = time.perf_counter() + args.duration
+    headers = {"Accept": "application/json"}
+
+    def submit(client, group, prompt):
+        started = time.perf_counter()
+        response = client.post("/generate", data={"prompt": prompt}, headers=headers)
+        elapsed = time.perf_counter() - started
+        with lock:
+            results[group].append((response.status_code, elapsed, "Retry-After" in response.headers))
+
+    def logged_in(user_id):
+        client = app_module.app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+        return client
+
+    def hammer(thread):
+        client = logged_in("hammer@example.com")
+        i = 0
+        while time.perf_counter() < deadline:
+            submit(client, "hammer", f"hammer prompt {thread}-{i}")
+            i += 1
+
+    def normal(user):
+        client = logged_in(f"user{user}@example.com")
+        i = 0
+        time.sleep(user * args.interval / args.users)  # spread the users out
+        while time.perf_counter() < deadline:
+            submit(client, "normal", f"normal prompt {user}-{i}")
+            i += 1
+            time.sleep(args.interval)
+
+    threads = [threading.Thread(target=hammer, args=(t,)) for t in range(args.hammer_threads)]
+    threads += [threading.Thread(target=normal, args=(u,)) for u in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, running["peak"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--hammer-threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=10, help="normal users")
+    parser.add_argument("--interval", type=float, default=4.0, help="seconds between a normal user's submits")
+    parser.add_argument("--generate-seconds", type=float, default=2.0)
+    parser.add_argument("--rate", type=float, default=60.0, help="generations per user per minute")
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args()
+
+    server = local_aws.serve({})
+    app_module = local_aws.load_app(server)
+    create_limiter = app_module.rate_limit.create_limiter
+    limits = dict(rate_per_minute=args.rate, burst=args.burst, max_in_flight=args.max_in_flight)
+    print(f"{args.duration:.0f} s, rate {args.rate:.0f}/min burst {args.burst}, cap {args.max_in_flight} in flight, "
+          f"{args.generate_seconds:.0f} s per generation")
+    print(f"{'backend':<8} {'group':<7} {'sent':>6} {'202':>5} {'429':>6} {'429 p50 ms':>11} {'429 p99 ms':>11} "
+          f"{'Retry-After':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "memory": create_limiter(**limits),
+            "sqlite": create_limiter(f"sqlite:///{os.path.join(tmp, 'limits.db')}", **limits),
+        }
+        for name, limiter in backends.items():
+            results, peak = run(app_module, limiter, args)
+            for group, samples in results.items():
+                rejected = [s for s in samples if s[0] == 429]
+                print(f"{name:<8} {group:<7} {len(samples):>6} {sum(1 for s in samples if s[0] == 202):>5} "
+                      f"{len(rejected):>6} {percentile_ms([s[1] for s in rejected], 50):>11.2f} "
+                      f"{percentile_ms([s[1] for s in rejected], 99):>11.2f} "
+                      f"{'all' if all(s[2] for s in rejected) else 'MISSING':>12}")
+            stats = limiter.stats()
+            print(f"{name:<8} peak in flight {peak} (cap {args.max_in_flight}); "
+                  f"limited {stats['limited']}, busy {stats['busy']}")
+            # Let this backend's generations finish before the next one starts
+            time.sleep(args.generate_seconds + 0.5)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Load test of the Flask routes (login, dashboard, generate, unlock) against local API stand-ins.
+
+The real Lambda handlers serve the User and Poster APIs over local HTTP on top of moto
+DynamoDB/S3, with a fake Bedrock returning a canned image. Each route is driven at the
+given concurrency; throughput and p50/p95/p99 are reported per route.
+
+Results can be saved as a JSON baseline and compared against on the next run:
+
+    python benchmarks/bench_routes.py --save benchmarks/baselines/routes.json
+    python benchmarks/bench_routes.py --compare benchmarks/baselines/routes.json
+
+Usage: python benchmarks/bench_routes.py [--requests 200] [--concurrency 8] [--api-latency 0.02]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+import local_aws
+
+ROUTES = ["login", "dashboard", "generate", "generate_done", "unlock"]
+
+
+def drive(clients, requests, fn):
+    """Calls fn(client, i) `requests` times spread over the clients; returns (latencies, errors, seconds)."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index, client):
+        for i in range(index, requests, len(clients)):
+            started = time.perf_counter()
+            try:
+                ok = fn(client, i)
+            except Exception as e:
+                ok = False
+                print(f"request failed: {e}", file=sys.stderr)
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(i, c)) for i, c in enumerate(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies, errors, seconds):
+    import metrics
+
+    window = metrics.LatencyWindow(size=max(len(latencies), 1))
+    for latency in latencies:
+        window.observe(latency)
+    return dict(
+        requests=len(latencies) + len(errors),
+        errors=len(errors),
+        rps=round((len(latencies) + len(errors)) / seconds, 1),
+        **window.percentiles(50, 95, 99),
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change against a saved baseline; returns the routes that regressed."""
+    regressed = []
+    print(f"\nvs baseline ({baseline['params']})")
+    print(f"{'route':<14} {'rps':>16} {'p95 ms':>18}")
+    for route, now in results["routes"].items():
+        before = baseline["routes"].get(route)
+        if not before:
+            continue
+        rps_change = (now["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0.0
+        p95_change = (now["p95"] - before["p95"]) / before["p95"] if before["p95"] else 0.0
+        flag = ""
+        if rps_change < -tolerance or p95_change > tolerance or now["errors"] > before["errors"]:
+            regressed.append(route)
+            flag = "  REGRESSION"
+        print(f"{route:<14} {before['rps']:>7} {rps_change:>+8.0%} {before['p95']:>8} {p95_change:>+8.0%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--history", type=int, default=50, help="seeded posters per user")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="simulated API Gateway hop, seconds")
+    parser.add_argument("--bedrock-latency", type=float, default=0.5, help="seconds per invoke_model call")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a JSON baseline; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed rps/p95 change before flagging")
+    args = parser.parse_args()
+
+    # Generations should reach the (fake) model rather than the generation cache
+    os.environ["GENERATION_CACHE"] = "off"
+    os.environ.setdefault("AUTH_TOKEN_SECRET", "bench-secret")
+    os.environ.setdefault("POSTER_DERIVATIVES", "off")
+    # Route latency, not admission control, is measured here
+    os.environ.setdefault("GENERATE_RATE_PER_MINUTE", "0")
+    os.environ.setdefault("GENERATE_MAX_IN_FLIGHT", "0")
+
+    mock = local_aws.start()
+    try:
+        credentials = local_aws.seed_users(args.users)
+        keys = local_aws.seed_history(args.users * args.history, users=args.users)
+        timestamps = {}
+        for user_id, timestamp in keys:
+            timestamps.setdefault(user_id, []).append(timestamp)
+
+        server = local_aws.serve({
+            ("GET", "/user"): "get_user",
+            ("POST", "/user"): "create_user",
+            ("POST", "/user/verify"): "verify_user",
+            ("GET", "/movie-poster-api-design"): "poster_designer",
+            ("POST", "/pay"): "payment",
+            ("GET", "/history"): "get_history",
+        }, latency=args.api_latency, serialize=False)
+        bedrock = local_aws.FakeBedrock(latency=args.bedrock_latency)
+        sys.modules["poster_designer"].bedrock = lambda: bedrock
+        app = local_aws.load_app(server)
+
+        # One logged-in browser per concurrent user
+        clients = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(args.concurrency):
+                client = app.app.test_client()
+                user_id, password = credentials[i % len(credentials)]
+                client.user_id = user_id
+                client.post("/login", data={"email": user_id, "password": password})
+                clients.append(client)
+
+        def login(client, i):
+            user_id, password = credentials[i % len(credentials)]
+            client = app.app.test_client()
+            return client.post("/login", data={"email": user_id, "password": password}).status_code == 302
+
+        def dashboard(client, i):
+            return client.get("/dashboard").status_code == 200
+
+        job_ids = []
+
+        def generate(client, i):
+            response = client.post("/generate", data={"prompt": f"benchmark poster {i}"},
+                                   headers={"Accept": "application/json"})
+            job_ids.append((client, response.get_json()["job_id"]))
+            return response.status_code == 202
+
+        def generate_done(client, i):
+            response = client.post("/generate", data={"prompt": f"benchmark poster done {i}"},
+                                   headers={"Accept": "application/json"})
+            status_url = response.get_json()["status_url"]
+            while True:
+                status = client.get(status_url).get_json()["status"]
+                if status in ("done", "failed"):
+                    return status == "done"
+                time.sleep(0.02)
+
+        def unlock(client, i):
+            user_timestamps = timestamps[client.user_id]
+            timestamp = user_timestamps[i % len(user_timestamps)]
+            return client.post("/unlock", data={"timestamp": timestamp}).status_code == 302
+
+        drivers = {"login": login, "dashboard": dashboard, "generate": generate,
+                   "generate_done": generate_done, "unlock": unlock}
+        results = {
+            "params": {k: v for k, v in vars(args).items() if k not in ("save", "compare", "tolerance")},
+            "python": platform.python_version(),
+            "routes": {},
+        }
+
+        print(f"{'route':<14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for route in ROUTES:
+            with contextlib.redirect_stdout(io.StringIO()):
+                summary = summarize(*drive(clients, args.requests, drivers[route]))
+            results["routes"][route] = summary
+            print(f"{route:<14} {summary['requests']:>9} {summary['errors']:>7} {summary['rps']:>8} "
+                  f"{summary['p50']:>8} {summary['p95']:>8} {summary['p99']:>8}")
+
+            if route == "generate":
+                # Let the queued jobs drain so they don't load the next route
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for client, job_id in job_ids:
+                        while client.get(f"/jobs/{job_id}").get_json()["status"] not in ("done", "failed"):
+                            time.sleep(0.05)
+
+        server.shutdown()
+    finally:
+        mock.stop()
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nsaved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Sessions across workers: does a login on one worker hold on the others?
+
+Starts --workers separate gunicorn processes (as separate nodes would be) against a
+stand-in User/Poster API, then logs users in and sends their dashboard requests
+round-robin across the workers. A request counts as lost when it is redirected to
+/login. Each session setup is run in turn:
+
+  random key    os.urandom per process (the old behaviour; expect nearly everything lost)
+  stable key    SECRET_KEY shared, session data in the signed cookie
+  sqlite store  SECRET_KEY shared, SESSION_STORE_URL=sqlite:///... on the same host
+
+After the load, each user logs out on one worker; with a server-side store the old session
+cookie must then be rejected by every worker ("revoked").
+
+Usage: python benchmarks/bench_sessions.py [--workers 3] [--users 20] [--requests 30]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import bench_async_dashboard
+from bench_async_dashboard import free_port, wait_for_port
+
+import local_aws
+
+
+def start_workers(count, upstream_url, env):
+    procs, urls = [], []
+    for _ in range(count):
+        port = free_port()
+        worker_env = dict(os.environ, USER_API_URL=f"{upstream_url}/user", POSTER_API_BASE=upstream_url,
+                          LOG_LEVEL="WARNING", **env)
+        cmd = [sys.executable, "-m", "gunicorn", "-w", "1", "-k", "gthread", "--threads", "8",
+               "-b", f"127.0.0.1:{port}", "app:app"]
+        procs.append(subprocess.Popen(cmd, cwd=local_aws.ROOT, env=worker_env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        urls.append(f"http://127.0.0.1:{port}")
+    for url in urls:
+        wait_for_port(int(url.rsplit(":", 1)[1]))
+    return procs, urls
+
+
+def run_users(urls, users, requests):
+    """Returns (ok, lost, revoked, seconds): dashboard results plus old cookies refused after logout."""
+    import httpx
+
+    counts = {"ok": 0, "lost": 0, "revoked": 0}
+    lock = threading.Lock()
+
+    def user(i):
+        # One browser: its cookie jar goes to whichever worker the "load balancer" picks
+        with httpx.Client(timeout=30, follow_redirects=False) as client:
+            client.post(f"{urls[i % len(urls)]}/login",
+                        data={"email": f"user{i}@example.com", "password": "pw"})
+            for n in range(requests):
+                response = client.get(f"{urls[(i + n + 1) % len(urls)]}/dashboard")
+                with lock:
+                    counts["ok" if response.status_code == 200 else "lost"] += 1
+
+            cookie = client.cookies.get("session")
+            client.get(f"{urls[i % len(urls)]}/logout")
+            # Replay the pre-logout cookie against every worker
+            refused = 0
+            for url in urls:
+                response = httpx.get(f"{url}/dashboard", cookies={"session": cookie} if cookie else None,
+                                     timeout=30)
+                refused += response.status_code != 200
+            with lock:
+                counts["revoked"] += refused == len(urls)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts["ok"], counts["lost"], counts["revoked"], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=30, help="dashboard requests per user")
+    parser.add_argument("--api-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = subprocess.Popen([sys.executable, bench_async_dashboard.__file__, "--upstream",
+                                 str(upstream_port), str(args.api_latency)])
+    try:
+        wait_for_port(upstream_port)
+        upstream_url = f"http://127.0.0.1:{upstream_port}"
+        with tempfile.TemporaryDirectory() as tmp:
+            setups = {
+                "random key": {},
+                "stable key": {"SECRET_KEY": "bench-secret"},
+                "sqlite store": {"SECRET_KEY": "bench-secret",
+                                 "SESSION_STORE_URL": f"sqlite:///{os.path.join(tmp, 'sessions.db')}"},
+            }
+            print(f"{args.workers} workers, {args.users} users x {args.requests} dashboard requests, round-robin")
+            print(f"{'setup':<13} {'ok':>6} {'lost':>6} {'req/s':>7} {'revoked on logout':>18}")
+            for name, env in setups.items():
+                procs, urls = start_workers(args.workers, upstream_url, env)
+                try:
+                    ok, lost, revoked, seconds = run_users(urls, args.users, args.requests)
+                finally:
+                    for proc in procs:
+                        proc.terminate()
+                        proc.wait()
+                print(f"{name:<13} {ok:>6} {lost:>6} {(ok + lost) / seconds:>7.1f} "
+                      f"{revoked:>12}/{args.users}")
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Bytes and requests for the stylesheet and background image, before and after the asset build.
+
+Simulates a browser loading /login through the Flask test client: it fetches the
+stylesheet linked by the page, then the background image the stylesheet picks. The
+modern browser takes the first image-set() entry; the "legacy" one takes the PNG
+fallback. A cold view has an empty cache. A warm view repeats the visit: files under
+no-cache are revalidated (304), and immutable files are reused without a request.
+
+Runs `assets.build()` first, into a temporary directory.
+
+Usage: python benchmarks/bench_static_assets.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+import local_aws
+
+sys.path.insert(0, local_aws.ROOT)
+
+import app as app_module  # noqa: E402
+import assets  # noqa: E402
+
+STYLESHEET = re.compile(r'<link rel="stylesheet" href="([^"]+)"')
+BACKGROUND = re.compile(r"background-image:\s*url\('([^']+)'\);")
+IMAGE_SET = re.compile(r"image-set\(url\('([^']+)'\)")
+
+
+def page_assets(client, browser):
+    html = client.get("/login").get_data(as_text=True)
+    css_url = STYLESHEET.search(html).group(1)
+    css = client.get(css_url).get_data(as_text=True)
+    match = IMAGE_SET.search(css) if browser == "modern" else None
+    image = (match or BACKGROUND.search(css)).group(1)
+    return [css_url, os.path.normpath(os.path.join(os.path.dirname(css_url), image))]
+
+
+def visit(client, urls, cache):
+    """Fetches `urls` like a browser with `cache` (url -> (etag, immutable)); returns (requests, bytes)."""
+    requests = transferred = 0
+    for url in urls:
+        etag, immutable = cache.get(url, (None, False))
+        if immutable:
+            continue
+        headers = {"Accept-Encoding": "gzip, br"}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = client.get(url, headers=headers)
+        requests += 1
+        transferred += len(response.data)
+        if response.status_code == 200:
+            cache[url] = (response.headers.get("ETag"), "immutable" in response.headers.get("Cache-Control", ""))
+    return requests, transferred
+
+
+def main():
+    client = app_module.app.test_client()
+    print(f"{'build':<8} {'browser':<8} {'view':<5} {'requests':>8} {'KB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for build in ("none", "hashed"):
+            if build == "hashed":
+                app_module.asset_manifest = assets.build(dist_dir=tmp)
+                assets.DIST_DIR = tmp
+            else:
+                app_module.asset_manifest = {}
+            for browser in ("legacy", "modern"):
+                urls = page_assets(client, browser)
+                cache = {}
+                for view in ("cold", "warm"):
+                    requests, transferred = visit(client, urls, cache)
+                    print(f"{build:<8} {browser:<8} {view:<5} {requests:>8} {transferred / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Peak RSS of the poster upload path: buffered decode vs streaming decode.
+
+Each mode runs in a fresh subprocess against a fixture Titan response on disk,
+with an S3 stub that consumes the upload the way boto3 does for small objects.
+
+Usage: python benchmarks/bench_stream_memory.py [--megabytes 4]
+"""
+import argparse
+import base64
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+# Deliberately not importing local_aws: moto's import would set the RSS high-water mark
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_functions"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+class DiscardingS3:
+    def head_object(self, **kwargs):
+        from botocore.exceptions import ClientError
+        raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+    def put_object(self, Body, **kwargs):
+        len(Body)
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        # s3transfer sends a seekable file in chunks rather than reading it whole
+        while fileobj.read(1024 * 1024):
+            pass
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, fixture):
+    designer = importlib.import_module("poster_designer")
+    s3 = DiscardingS3()
+    designer.s3 = lambda: s3
+    before = peak_rss_mb()
+    tracemalloc.start()
+
+    with open(fixture, "rb") as body:
+        if mode == "buffered":
+            # The previous pipeline: read all, json-decode, b64-decode, upload
+            image_b64 = json.loads(body.read())["images"][0]
+            designer.upload_image(image_b64)
+        else:
+            designer.upload_image_stream(designer.Base64ImageStream(body))
+
+    _, traced_peak = tracemalloc.get_traced_memory()
+    print(json.dumps({
+        "mode": mode,
+        "peak_rss_delta_mb": round(peak_rss_mb() - before, 1),
+        "peak_alloc_mb": round(traced_peak / 1024 / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=4, help="decoded image size")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(*args.child)
+
+    with tempfile.NamedTemporaryFile("wb", suffix=".json", delete=False) as fixture:
+        image = os.urandom(int(args.megabytes * 1024 * 1024))
+        fixture.write(json.dumps({"images": [base64.b64encode(image).decode()], "error": None}).encode())
+    try:
+        print(f"fixture: {args.megabytes} MB image, {os.path.getsize(fixture.name) / 1024 / 1024:.1f} MB response")
+        for mode in ("buffered", "streaming"):
+            out = subprocess.run([sys.executable, __file__, "--child", mode, fixture.name],
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{mode:<10} peak RSS +{result['peak_rss_delta_mb']} MB, "
+                  f"peak Python allocations {result['peak_alloc_mb']} MB")
+    finally:
+        os.unlink(fixture.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Unlock latency as UserPosterHistory grows: full-table scan vs keyed update.
+
+Usage: python benchmarks/bench_unlock.py [--sizes 1000 5000 20000] [--runs 20]
+"""
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+
+import local_aws
+
+
+def scan_unlock(table, user_id, prompt_used):
+    """The previous payment path: scan the whole table for the poster."""
+    response = table.scan(
+        FilterExpression="user_id = :user_id and prompt_used = :prompt_used",
+        ExpressionAttributeValues={":user_id": user_id, ":prompt_used": prompt_used},
+    )
+    poster = response["Items"][0]
+    table.update_item(
+        Key={"user_id": user_id, "timestamp": poster["timestamp"]},
+        UpdateExpression="SET paid = :paid",
+        ExpressionAttributeValues={":paid": True},
+    )
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'scan ms':>10} {'keyed ms':>10}")
+    for size in args.sizes:
+        mock = local_aws.start()
+        try:
+            keys = local_aws.seed_history(size, users=max(size // 50, 1))
+            payment = local_aws.load_handler("payment")
+            user_id, timestamp = keys[len(keys) // 2]
+            prompt = f"poster prompt {len(keys) // 2}"
+
+            scan_ms = timed(lambda: scan_unlock(payment.history_table(), user_id, prompt), args.runs)
+            event = {"body": json.dumps({"user_id": user_id, "timestamp": timestamp})}
+            keyed_ms = timed(lambda: payment.lambda_handler(event, None), args.runs)
+            print(f"{size:>8} {scan_ms:>10} {keyed_ms:>10}")
+        finally:
+            mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Local stand-ins for the AWS backend (moto DynamoDB/S3) shared by the benchmarks."""
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT, "lambda_functions")
+
+# moto never talks to AWS, but boto3 still wants a region and credentials
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+# Keep per-request log lines out of the benchmark output
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+import boto3
+from moto import mock_aws
+
+BUCKET_NAME = "movie-poster-design-caa900"
+
+TABLES = {
+    "UserLoginData": [("user_id", "HASH")],
+    "UserPosterHistory": [("user_id", "HASH"), ("timestamp", "RANGE")],
+    "PosterGenerationCache": [("cache_key", "HASH")],
+    "PosterObjectOwners": [("object_key", "HASH")],
+}
+
+
+def start():
+    """Starts moto and creates the tables and bucket the handlers expect."""
+    mock = mock_aws()
+    mock.start()
+
+    dynamodb = boto3.client("dynamodb")
+    for name, keys in TABLES.items():
+        dynamodb.create_table(
+            TableName=name,
+            KeySchema=[{"AttributeName": attr, "KeyType": kind} for attr, kind in keys],
+            AttributeDefinitions=[{"AttributeName": attr, "AttributeType": "S"} for attr, _ in keys],
+            BillingMode="PAY_PER_REQUEST",
+        )
+    boto3.client("s3").create_bucket(Bucket=BUCKET_NAME)
+    return mock
+
+
+def load_handler(name):
+    """Imports (or re-imports) a Lambda module so it picks up the mocked clients."""
+    if name in sys.modules:
+        return importlib.reload(sys.modules[name])
+    return importlib.import_module(name)
+
+
+def seed_history(count, users=1, prefix="user", paid=False):
+    """Writes `count` history rows spread over `users` users; returns the row keys."""
+    table = boto3.resource("dynamodb").Table("UserPosterHistory")
+    keys = []
+    with table.batch_writer() as batch:
+        for i in range(count):
+            user_id = f"{prefix}{i % users}@example.com"
+            timestamp = f"2024-01-01T00:00:00.{i:06d}"
+            batch.put_item(Item={
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "prompt_used": f"poster prompt {i}",
+                "paid": paid,
+                "poster_url": f"https://{BUCKET_NAME}.s3.amazonaws.com/poster-{i}.png",
+            })
+            keys.append((user_id, timestamp))
+    return keys
+
+
+def seed_users(count, prefix="user"):
+    """Writes `count` accounts to UserLoginData; user N logs in with password "pwN"."""
+    import hashlib
+
+    table = boto3.resource("dynamodb").Table("UserLoginData")
+    with table.batch_writer() as batch:
+        for i in range(count):
+            batch.put_item(Item={"user_id": f"{prefix}{i}@example.com",
+                                 "password": hashlib.sha256(f"pw{i}".encode()).hexdigest()})
+    return [(f"{prefix}{i}@example.com", f"pw{i}") for i in range(count)]
+
+
+def fake_png(seed=0, size=1024):
+    """A real PNG of the size Titan returns (noisy, so it compresses like a poster)."""
+    import random
+    import zlib
+    import struct
+
+    # Alternate noisy and flat rows: ~1.5 MB, about what Titan returns for 1024x1024
+    rng = random.Random(seed)
+    flat = bytes(size * 3)
+    raw = b"".join(b"\x00" + (rng.randbytes(size * 3) if y % 2 else flat) for y in range(size))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+class FakeBedrock:
+    """Stands in for bedrock-runtime: returns canned PNGs after a simulated delay.
+
+    Every call returns the same image unless `unique` is set, which makes a new one per call.
+    """
+
+    def __init__(self, latency=0.0, per_image_latency=0.0, unique=False):
+        import base64
+
+        self.latency = latency
+        self.per_image_latency = per_image_latency
+        self.unique = unique
+        self.calls = 0
+        self._image_b64 = base64.b64encode(fake_png()).decode()
+
+    def invoke_model(self, **kwargs):
+        import io
+        import json
+        import time
+
+        import base64
+
+        self.calls += 1
+        count = json.loads(kwargs["body"])["imageGenerationConfig"]["numberOfImages"]
+        time.sleep(self.latency + self.per_image_latency * count)
+        if self.unique:
+            images = [base64.b64encode(fake_png(seed=self.calls * 100 + i)).decode() for i in range(count)]
+        else:
+            images = [self._image_b64] * count
+        payload = json.dumps({"images": images, "error": None})
+        return {"body": io.BytesIO(payload.encode())}
+
+
+def serve(routes, latency=0.0, serialize=True):
+    """Serves Lambda handlers over HTTP the way the non-proxy API Gateway integrations do.
+
+    `routes` maps (method, path) to a handler module name. Query parameters and the JSON
+    body become the event; the handler's whole result is returned as a 200 JSON body.
+    `latency` adds a simulated API Gateway + Lambda hop per request; `serialize=False` lets
+    handlers run concurrently (slow fakes such as FakeBedrock would otherwise queue). Returns the server;
+    its base URL is `server.url` and handled requests are counted in `server.calls`.
+    """
+    import contextlib
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qsl, urlsplit
+
+    handlers = {key: load_handler(name) for key, name in routes.items()}
+    # moto's in-memory backends are not safe to call from many threads at once
+    backend_lock = threading.Lock() if serialize else contextlib.nullcontext()
+    count_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; with Nagle on, each response waits
+        # for the client's delayed ACK (~40 ms) and the stand-in dominates the timings
+        disable_nagle_algorithm = True
+
+        def _handle(self, method):
+            url = urlsplit(self.path)
+            module = handlers.get((method, url.path))
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode() if length else None
+            if module is None:
+                status, payload = 403, {"message": "Missing Authentication Token"}
+            else:
+                event = {"queryStringParameters": dict(parse_qsl(url.query)) or None, "body": body,
+                         "headers": dict(self.headers)}
+                time.sleep(latency)
+                with backend_lock:
+                    payload = module.lambda_handler(event, None)
+                with count_lock:
+                    server.calls += 1
+                status = 200
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024  # listen backlog; the default 5 resets bursts of new connections
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_app(server):
+    """Imports the Flask app pointed at a `serve()` stand-in for both the User and Poster APIs."""
+    os.environ["USER_API_URL"] = f"{server.url}/user"
+    os.environ["POSTER_API_BASE"] = server.url
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("app")
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        return self._lookup(key, count=True)
+
+    def peek(self, key):
+        """get without counting a hit or miss, for lookups that are not cached results."""
+        return self._lookup(key, count=False)
+
+    def _lookup(self, key, count):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += count
+                return None
+            self._data.move_to_end(key)
+            self.hits += count
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class RedisCache:
+    """Same interface as LRUCache, stored in a Redis-compatible server (values as JSON).
+
+    Shared by every worker process, so an invalidation in one worker is seen by all.
+    """
+
+    def __init__(self, url, ttl=60, prefix="cache:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a redis:// cache URL")
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        return self._lookup(key, count=True)
+
+    def peek(self, key):
+        """get without counting a hit or miss, for lookups that are not cached results."""
+        return self._lookup(key, count=False)
+
+    def _lookup(self, key, count):
+        raw = self._client.get(self.prefix + key)
+        with self._lock:
+            if raw is None:
+                self.misses += count
+                return None
+            self.hits += count
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, json.dumps(value), ex=int(ttl or self.ttl))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "redis",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one; the others wait for its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> (done event, result holder)
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = (threading.Event(), {})
+            else:
+                self.shared += 1
+
+        done, holder = call
+        if not leader:
+            done.wait()
+            if "error" in holder:
+                raise holder["error"]
+            return holder["value"]
+
+        try:
+            holder["value"] = fn()
+            return holder["value"]
+        except Exception as e:
+            holder["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            done.set()
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop."""
+
+    def __init__(self):
+        self._calls = {}  # key -> task
+        self.shared = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        # A waiter that is cancelled (client went away) must not cancel the shared call
+        return await asyncio.shield(task)
+
+
+def create_cache(url=None, maxsize=1024, ttl=60, prefix="cache:"):
+    """In-process LRU by default; a redis:// URL selects the shared Redis backend."""
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, ttl=ttl, prefix=prefix)
+    return LRUCache(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,175 @@
+"""In-process transport: calls the Lambda handlers directly instead of going through API Gateway.
+
+For deployments where the web app runs next to the handlers' AWS resources
+(BACKEND_TRANSPORT=embedded). EmbeddedClient has the same get/post/request/stats interface
+as backend_client.BackendClient. Each call becomes a synthesized event for the handler that
+API Gateway would have invoked, with no HTTP request and no JSON encoding of the request body.
+The handler's result is returned as the body of a 200 response, the way the non-proxy
+integrations return it.
+
+The handlers need the same AWS credentials, region and environment as in Lambda. Their
+boto3 clients are created once (lambda_functions/runtime.py) and reused by every call.
+"""
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+import instrumentation
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda_functions")
+
+# (method, resource path) -> handler module, as wired up in API Gateway (ARCHITECTURE_BUILD.md)
+ROUTES = {
+    ("GET", "/user"): "get_user",
+    ("POST", "/user"): "create_user",
+    ("POST", "/user/verify"): "verify_user",
+    ("DELETE", "/user"): "delete_user",
+    ("GET", "/movie-poster-api-design"): "poster_designer",
+    ("POST", "/pay"): "payment",
+    ("GET", "/history"): "get_history",
+}
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def handler(module_name):
+    """The module's lambda_handler, imported on first use (the handlers import siblings by bare name)."""
+    fn = _handlers.get(module_name)
+    if fn is None:
+        with _handlers_lock:
+            fn = _handlers.get(module_name)
+            if fn is None:
+                if LAMBDA_DIR not in sys.path:
+                    sys.path.append(LAMBDA_DIR)
+                fn = _handlers[module_name] = importlib.import_module(module_name).lambda_handler
+    return fn
+
+
+class EmbeddedResponse:
+    """The parts of requests.Response the app reads, around a handler's result.
+
+    api_responses.decode takes `result` as it is; `content`/`text` are only encoded if read.
+    """
+
+    def __init__(self, status_code, result):
+        self.status_code = status_code
+        self.result = result
+        self.headers = {"Content-Type": "application/json"}
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = json.dumps(self.result).encode()
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return self.result
+
+
+class EmbeddedClient:
+    """Drop-in for BackendClient that invokes the handlers behind `base_path` in-process.
+
+    HTTP-only settings (pool size, timeouts, retries) are accepted and ignored.
+    """
+
+    def __init__(self, name, base_path="", routes=None, **http_settings):
+        self.name = name
+        self.base_path = "/" + base_path.strip("/") if base_path.strip("/") else ""
+        self.routes = ROUTES if routes is None else routes
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def url(self, path=""):
+        if not path:
+            return self.base_path or "/"
+        return f"{self.base_path}/{path.lstrip('/')}"
+
+    def _invoke(self, method, path, params, json_body, headers):
+        module_name = self.routes.get((method, self.url(path)))
+        if module_name is None:
+            # What API Gateway answers for a resource/method that does not exist
+            return EmbeddedResponse(403, {"message": "Missing Authentication Token"})
+        event = {"queryStringParameters": dict(params) if params else None,
+                 "body": dict(json_body) if isinstance(json_body, dict) else json_body,
+                 "headers": headers}
+        try:
+            return EmbeddedResponse(200, handler(module_name)(event, None))
+        except Exception as e:
+            # An unhandled handler error reaches API Gateway clients as a 502
+            instrumentation.logger.exception("Embedded %s failed", module_name)
+            return EmbeddedResponse(502, {"errorMessage": str(e), "errorType": type(e).__name__})
+
+    def request(self, method, path="", timeout=None, params=None, json=None, **kwargs):
+        headers = dict(kwargs.get("headers") or {})
+        headers.setdefault("X-Request-ID", instrumentation.request_id())
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with instrumentation.span(f"upstream.{self.name}"):
+                response = self._invoke(method, path, params, json, headers)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            instrumentation.logger.info("upstream %s %s /%s %s %.1f ms (embedded)",
+                                        self.name, method, path.lstrip("/"), status, elapsed * 1000)
+            with self._lock:
+                self._requests += 1
+                self._errors += status == "error" or status >= 500
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+
+    def get(self, path="", **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path="", **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path="", **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            count = self._requests
+            return {
+                "requests": count,
+                "errors": self._errors,
+                "latency_avg_ms": round(self._total_seconds / count * 1000, 2) if count else 0.0,
+                "latency_max_ms": round(self._max_seconds * 1000, 2),
+                "connections_opened": 0,
+                "connections_reused": 0,
+            }
+
+
+class AsyncEmbeddedClient(EmbeddedClient):
+    """EmbeddedClient for the ASGI app; the blocking handlers run in worker threads."""
+
+    async def request(self, method, path="", **kwargs):
+        return await asyncio.to_thread(super().request, method, path, **kwargs)
+
+    async def get(self, path="", **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path="", **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def delete(self, path="", **kwargs):
+        return await self.request("DELETE", path, **kwargs)
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,142 @@
+import contextvars
+import datetime
+import io
+import json
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Poster images fetched ahead of the one being written to a ZIP export
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", "4"))
+
+# Metadata is spooled to disk past this size while the images are written
+METADATA_SPOOL_BYTES = 1024 * 1024
+
+
+def _submit(pool, fn, *args):
+    # Workers run in the caller's context so spans and request IDs follow the work
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def iter_posters(fetch_page):
+    """Yields every poster of a user's history, in the order the API pages through it.
+
+    `fetch_page(token)` returns {"posters": [...], "next_token": ...} or None on failure.
+    The next page is requested as soon as its token is known, so it loads while the
+    caller is still busy with the current one. Raises RuntimeError if a page fails.
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-page") as pool:
+        pending = _submit(pool, fetch_page, None)
+        while pending is not None:
+            page = pending.result()
+            if page is None:
+                raise RuntimeError("Could not fetch history")
+            token = page.get("next_token")
+            pending = _submit(pool, fetch_page, token) if token else None
+            yield from page["posters"]
+
+
+def ndjson_lines(posters):
+    """NDJSON export: one line per poster; a failure mid-stream ends it with an error line."""
+    try:
+        for poster in posters:
+            yield json.dumps(poster, separators=(",", ":")) + "\n"
+    except Exception as e:
+        yield json.dumps({"export_error": str(e)}) + "\n"
+
+
+def object_path(poster):
+    """Bucket path of a paid poster's image (older rows have only the URL)."""
+    return poster.get("s3_key") or urlsplit(poster.get("poster_url") or "").path.lstrip("/")
+
+
+def archive_name(poster):
+    """File name inside the ZIP: the poster's timestamp plus the image's extension."""
+    stem = str(poster.get("timestamp") or "poster").replace(":", "-")
+    ext = os.path.splitext(object_path(poster))[1] or ".png"
+    return f"posters/{stem}{ext}"
+
+
+def _zip_time(poster):
+    try:
+        return datetime.datetime.fromisoformat(poster["timestamp"]).timetuple()[:6]
+    except (KeyError, TypeError, ValueError):
+        return datetime.datetime.utcnow().timetuple()[:6]
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file collecting what ZipFile writes so a generator can pass it on."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_chunks(posters, fetch_image, prefetch=None):
+    """ZIP export of the paid posters' images plus history.ndjson with every poster.
+
+    Produced as it goes: at most `prefetch` images are in memory (fetched in parallel,
+    written in history order), and the metadata waits in a spooled temp file until the
+    images are done. `fetch_image(poster)` returns the image bytes.
+    """
+    prefetch = prefetch or EXPORT_PREFETCH
+    sink = _ChunkSink()
+    with tempfile.SpooledTemporaryFile(max_size=METADATA_SPOOL_BYTES, mode="w+b") as metadata, \
+            ThreadPoolExecutor(max_workers=max(prefetch, 1), thread_name_prefix="export-image") as pool, \
+            zipfile.ZipFile(sink, "w") as archive:
+        in_flight = deque()
+
+        def write_next():
+            poster, future = in_flight.popleft()
+            line = dict(poster)
+            try:
+                data = future.result()
+            except Exception as e:
+                line["export_error"] = str(e)
+            else:
+                info = zipfile.ZipInfo(archive_name(poster), date_time=_zip_time(poster))
+                # PNG/WebP are already compressed
+                archive.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+                line["file"] = info.filename
+            metadata.write((json.dumps(line, separators=(",", ":")) + "\n").encode())
+
+        try:
+            for poster in posters:
+                if poster.get("paid") and object_path(poster):
+                    in_flight.append((poster, _submit(pool, fetch_image, poster)))
+                    if len(in_flight) > prefetch:
+                        write_next()
+                        yield sink.take()
+                else:
+                    metadata.write((json.dumps(poster, separators=(",", ":")) + "\n").encode())
+        except Exception as e:
+            metadata.write((json.dumps({"export_error": str(e)}) + "\n").encode())
+
+        while in_flight:
+            write_next()
+            yield sink.take()
+
+        metadata.seek(0)
+        with archive.open("history.ndjson", "w") as out:
+            while True:
+                chunk = metadata.read(64 * 1024)
+                if not chunk:
+                    break
+                out.write(chunk)
+                yield sink.take()
+    # Closing the archive writes the central directory
+    yield sink.take()
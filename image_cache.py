@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import caching
+
+# Poster objects the image route may serve
+IMAGE_TYPES = {".png": "image/png", ".webp": "image/webp", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+# Poster keys never change content (content-addressed, or unique legacy names), so an image
+# and its ETag can be kept by the browser for good; private because the route needs a login
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def valid_key(key):
+    """True for bucket keys of poster images; anything else is not served."""
+    parts = key.split("/")
+    return (not key.startswith("/") and ".." not in parts and "" not in parts
+            and os.path.splitext(key)[1].lower() in IMAGE_TYPES)
+
+
+def access_token(secret, user_id, key):
+    """Per-user signature of an image key, carried in the /posters link.
+
+    Only links rendered for the user's own paid posters carry it, so the route can serve a key
+    without looking it up. It is deterministic, so the browser cache still sees one URL per image.
+    """
+    if isinstance(secret, str):
+        secret = secret.encode()
+    digest = hmac.new(secret, f"{user_id}:{key}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
+
+
+def valid_token(secret, user_id, key, token):
+    return bool(token) and hmac.compare_digest(access_token(secret, user_id, key), token)
+
+
+class DiskLRUCache:
+    """Poster images on local disk, least recently used evicted beyond `max_bytes`.
+
+    Each file is named after its key's hash and its ETag (a SHA-256 prefix of the content), so
+    the index is rebuilt from the directory after a restart, oldest files first. The size bound and the recency
+    order are per process; workers sharing a directory may evict each other's files, which
+    only costs a refetch.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key hash -> (file name, size, etag)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._fills = caching.SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.origin_bytes = 0
+        self.served_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            digest, _, etag = name.partition(".")
+            path = os.path.join(directory, name)
+            if etag and not name.endswith(".tmp") and os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, digest, name, stat.st_size, etag))
+        for _, digest, name, size, etag in sorted(files):
+            self._entries[digest] = (name, size, etag)
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        """(path, etag) of a cached image, or None."""
+        return self._lookup(key, count=True)
+
+    def _lookup(self, key, count):
+        digest = self._digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                path = os.path.join(self.directory, entry[0])
+                if os.path.exists(path):
+                    self._entries.move_to_end(digest)
+                    self.hits += count
+                    return path, entry[2]
+                # Removed by another worker sharing the directory
+                del self._entries[digest]
+                self._size -= entry[1]
+            self.misses += count
+        return None
+
+    def put(self, key, chunks):
+        """Stores the image streamed as `chunks`; returns (path, etag)."""
+        digest = self._digest(key)
+        content_hash = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    content_hash.update(chunk)
+                    size += len(chunk)
+            etag = content_hash.hexdigest()[:32]
+            name = f"{digest}.{etag}"
+            os.replace(tmp, os.path.join(self.directory, name))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        with self._lock:
+            self.origin_bytes += size
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self._size -= old[1]
+                if old[0] != name:
+                    self._remove(old[0])
+            self._entries[digest] = (name, size, etag)
+            self._size += size
+            self._evict(keep=digest)
+        return os.path.join(self.directory, name), etag
+
+    def fetch(self, key, load):
+        """(path, etag) from the cache, filling it with `load()` chunks on a miss.
+
+        Concurrent misses for the same key wait for one origin fetch.
+        """
+        return self.get(key) or self._fills.do(key, lambda: self._lookup(key, False) or self.put(key, load()))
+
+    def served(self, size):
+        with self._lock:
+            self.served_bytes += size
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep=None):
+        # Oldest first; the file just stored stays even if it alone exceeds the bound
+        while self._size > self.max_bytes and self._entries:
+            digest, (name, size, _) = next(iter(self._entries.items()))
+            if digest == keep:
+                break
+            del self._entries[digest]
+            self._size -= size
+            self.evictions += 1
+            self._remove(name)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "origin_bytes": self.origin_bytes,
+                "served_bytes": self.served_bytes,
+            }
+
+
+class Presigner:
+    """Short-lived presigned GET URLs for the poster bucket, so it can stay private."""
+
+    def __init__(self, bucket, expires_in=60, endpoint_url=None):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("The boto3 package is required for IMAGE_ORIGIN=presigned")
+        self.bucket = bucket
+        self.expires_in = expires_in
+        config = Config(signature_version="s3v4", s3={"addressing_style": "path" if endpoint_url else "virtual"})
+        self._s3 = boto3.client("s3", endpoint_url=endpoint_url, config=config)
+
+    def url(self, key):
+        # Signing is local; no request is sent to S3
+        return self._s3.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key},
+                                               ExpiresIn=self.expires_in)
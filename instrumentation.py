@@ -0,0 +1,138 @@
+import contextlib
+import contextvars
+import logging
+import os
+import re
+import time
+import uuid
+
+import metrics
+
+# INFO logs one line per request and upstream call; DEBUG adds response payloads
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Longest payload excerpt written at DEBUG level
+LOG_PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", "2000"))
+
+logger = logging.getLogger("poster_app")
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+# Caller-supplied IDs are logged, echoed and forwarded, so only short plain tokens are kept
+_VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+_spans = contextvars.ContextVar("spans", default=None)
+
+HTTP_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "poster_http_requests_total", "Requests handled by the Flask app.", ("route", "method", "status")))
+HTTP_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "poster_http_request_duration_seconds", "Time to handle a request.", ("route",)))
+SPAN_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "poster_span_duration_seconds", "Time spent in upstream calls and other spans.", ("span",)))
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+def configure_logging():
+    """Sends the app's logs to stderr with the request ID on every line."""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.addFilter(_RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def request_id():
+    return _request_id.get()
+
+
+def bind_request_id(value=None):
+    """Starts a new unit of work (request or background job) with its own ID and span list.
+
+    `value` (e.g. the caller's X-Request-ID) is used only if it is a plain token of up to
+    64 characters; otherwise a fresh ID is generated.
+    """
+    if not value or not _VALID_REQUEST_ID.fullmatch(value):
+        value = uuid.uuid4().hex
+    _request_id.set(value)
+    _spans.set([])
+    return _request_id.get()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Times a block, recording it in the span histogram and the current request's spans."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.observe(elapsed, span=name)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+        logger.debug("span %s %.1f ms", name, elapsed * 1000)
+
+
+def log_payload(label, text):
+    """Logs (a prefix of) a response body, only when DEBUG is enabled."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %s", label, text[:LOG_PAYLOAD_LIMIT])
+
+
+def server_timing():
+    """Server-Timing header value summing the current request's spans by name."""
+    totals = {}
+    for name, elapsed in _spans.get() or ():
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name.replace('.', '_')};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def _finish(request, response, started):
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    HTTP_SECONDS.observe(elapsed, route=route)
+
+    response.headers["X-Request-ID"] = request_id()
+    timing = server_timing()
+    response.headers["Server-Timing"] = f"{timing}, total;dur={elapsed * 1000:.1f}" if timing \
+        else f"total;dur={elapsed * 1000:.1f}"
+    logger.info("%s %s %s %.1f ms", request.method, request.path, response.status_code, elapsed * 1000)
+    return response
+
+
+def init_app(app):
+    """Adds request IDs, per-request timing and access logging to a Flask app."""
+    from flask import g, request
+
+    configure_logging()
+
+    @app.before_request
+    def _start_request():
+        bind_request_id(request.headers.get("X-Request-ID"))
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request(response):
+        return _finish(request, response, g.get("request_started", time.perf_counter()))
+
+
+def init_asgi_app(app):
+    """init_app for the Quart (ASGI) app; the hooks are coroutines so they share the request's context."""
+    from quart import g, request
+
+    configure_logging()
+
+    @app.before_request
+    async def _start_request():
+        bind_request_id(request.headers.get("X-Request-ID"))
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    async def _finish_request(response):
+        return _finish(request, response, g.get("request_started", time.perf_counter()))
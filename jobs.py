@@ -0,0 +1,337 @@
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import logger
+
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+# A running SQLite job whose worker has not renewed its claim for this long is failed;
+# workers renew every third of it while the job runs
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+def _new_job(user_id, prompt, options=None, dedup_key=None):
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "prompt": prompt,
+        "options": options or {},
+        "dedup_key": dedup_key,
+        "status": QUEUED,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def _from_row(row):
+    job = dict(row)
+    job["options"] = json.loads(job["options"] or "{}")
+    if job["result"] is not None:
+        job["result"] = json.loads(job["result"])
+    return job
+
+
+class InProcessJobQueue:
+    """Runs jobs on a thread pool inside this process; state lives in memory.
+
+    `runner(job)` does the actual work and returns a JSON-serialisable result,
+    raising on failure. `on_finish(job)`, if given, is called once the job is stored as done
+    or failed. `submit` returns (job_id, created): a submit whose `dedup_key` matches one of
+    the user's queued or running jobs returns that job's ID instead of adding another.
+    """
+
+    def __init__(self, runner, workers=2, on_finish=None):
+        self.runner = runner
+        self.on_finish = on_finish
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-worker")
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, prompt, options=None, dedup_key=None):
+        job_id, created = self._add(_new_job(user_id, prompt, options, dedup_key))
+        if created:
+            self._executor.submit(self._run, job_id)
+        return job_id, created
+
+    def _add(self, job):
+        """Stores a new job unless an active duplicate exists; returns (job_id, created)."""
+        key = (job["user_id"], job["dedup_key"])
+        with self._lock:
+            self._prune()
+            if job["dedup_key"] is not None:
+                existing = self._jobs.get(self._active.get(key))
+                if existing and existing["status"] in (QUEUED, RUNNING):
+                    return existing["id"], False
+                self._active[key] = job["id"]
+            self._jobs[job["id"]] = job
+        return job["id"], True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def _run(self, job_id):
+        self._update(job_id, status=RUNNING)
+        try:
+            result = self.runner(self.get(job_id))
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e))
+        else:
+            self._update(job_id, status=DONE, result=result)
+        if self.on_finish is not None:
+            try:
+                self.on_finish(self.get(job_id))
+            except Exception:
+                logger.exception("Finishing job %s failed", job_id)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j["id"] for j in self._jobs.values()
+                       if j["status"] in (DONE, FAILED) and j["updated_at"] < cutoff]:
+            del self._jobs[job_id]
+        for key in [k for k, job_id in self._active.items() if job_id not in self._jobs]:
+            del self._active[key]
+
+
+class AsyncJobQueue(InProcessJobQueue):
+    """In-process queue for coroutine runners: jobs run as tasks on the serving event loop.
+
+    `submit` must be called from that loop; at most `workers` jobs run at once. `on_finish`
+    is a coroutine function here too.
+    """
+
+    def __init__(self, runner, workers=2, on_finish=None):
+        self.runner = runner
+        self.on_finish = on_finish
+        self.workers = workers
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._limit = None
+        self._tasks = set()
+
+    def submit(self, user_id, prompt, options=None, dedup_key=None):
+        job_id, created = self._add(_new_job(user_id, prompt, options, dedup_key))
+        if created:
+            # Keep a reference so the task is not garbage collected mid-run
+            task = asyncio.get_running_loop().create_task(self._run(job_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return job_id, created
+
+    async def _run(self, job_id):
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.workers)
+        async with self._limit:
+            self._update(job_id, status=RUNNING)
+            try:
+                result = await self.runner(self.get(job_id))
+            except Exception as e:
+                self._update(job_id, status=FAILED, error=str(e))
+            else:
+                self._update(job_id, status=DONE, result=result)
+            if self.on_finish is not None:
+                try:
+                    await self.on_finish(self.get(job_id))
+                except Exception:
+                    logger.exception("Finishing job %s failed", job_id)
+
+
+class SQLiteJobQueue:
+    """Job queue persisted in SQLite so every worker process shares one queue.
+
+    Each process runs its own worker threads; a job is claimed atomically with
+    BEGIN IMMEDIATE so it only ever runs once. A claim is a lease: the worker renews
+    claimed_at while the job runs, and a job whose worker died is marked failed once the
+    lease lapses. It is not rerun, since the generation may already have happened, and the
+    user can submit the prompt again.
+    """
+
+    def __init__(self, runner, path, workers=2, poll_interval=0.5, lease_seconds=JOB_LEASE_SECONDS,
+                 on_finish=None):
+        self.runner = runner
+        self.on_finish = on_finish
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, user_id TEXT, prompt TEXT, options TEXT, status TEXT,"
+                " result TEXT, error TEXT, created_at REAL, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            # Added after the first release; older databases get the column here
+            for column in ("dedup_key TEXT", "claimed_at REAL"):
+                try:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    pass
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (user_id, dedup_key, status)")
+
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Connection for one transaction: committed (or rolled back) and closed afterwards."""
+        # sqlite3's own context manager only commits; closing() releases the file handle
+        with contextlib.closing(self._connect()) as conn, conn:
+            yield conn
+
+    def submit(self, user_id, prompt, options=None, dedup_key=None):
+        job = _new_job(user_id, prompt, options, dedup_key)
+        conn = self._connect()
+        try:
+            # The duplicate check and the insert share one write lock across processes
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - JOB_RETENTION_SECONDS),
+            )
+            # A dead worker's job must not absorb resubmissions of the same prompt
+            self._expire_claims(conn)
+            existing = None
+            if dedup_key is not None:
+                existing = conn.execute(
+                    "SELECT id FROM jobs WHERE user_id = ? AND dedup_key = ? AND status IN (?, ?) LIMIT 1",
+                    (user_id, dedup_key, QUEUED, RUNNING),
+                ).fetchone()
+            if existing is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, user_id, prompt, options, status, created_at, updated_at, dedup_key)"
+                    " VALUES (:id, :user_id, :prompt, :options, :status, :created_at, :updated_at, :dedup_key)",
+                    dict(job, options=json.dumps(job["options"])),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if existing is not None:
+            return existing[0], False
+        self._wakeup.set()
+        return job["id"], True
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return _from_row(row)
+
+    def _expire_claims(self, conn):
+        """Fails running jobs whose lease has lapsed (rows from before claimed_at use updated_at)."""
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ?"
+            " WHERE status = ? AND COALESCE(claimed_at, updated_at) < ?",
+            (FAILED, "The worker running this job stopped; please try again.", now, RUNNING,
+             now - self.lease_seconds),
+        )
+
+    def _claim(self):
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_claims(conn)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, claimed_at = ? WHERE id = ?",
+                    (RUNNING, now, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+            return _from_row(row) if row is not None else None
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def _renew(self, job_id, stop):
+        """Keeps a running job's claim fresh until `stop` is set."""
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                with self._transaction() as conn:
+                    conn.execute("UPDATE jobs SET claimed_at = ? WHERE id = ? AND status = ?",
+                                 (time.time(), job_id, RUNNING))
+            except sqlite3.OperationalError:
+                pass  # the next renewal tries again
+
+    def _worker(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError:
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            stop = threading.Event()
+            threading.Thread(target=self._renew, args=(job["id"], stop), daemon=True).start()
+            try:
+                result = self.runner(job)
+            except Exception as e:
+                self._finish(job["id"], FAILED, error=str(e))
+            else:
+                self._finish(job["id"], DONE, result=result)
+            finally:
+                stop.set()
+            if self.on_finish is not None:
+                try:
+                    self.on_finish(job)
+                except Exception:
+                    logger.exception("Finishing job %s failed", job["id"])
+
+
+def create_queue(runner, on_finish=None):
+    """Builds the queue selected by JOB_QUEUE_BACKEND (memory or sqlite)."""
+    backend = os.getenv("JOB_QUEUE_BACKEND", "memory")
+    workers = int(os.getenv("JOB_WORKERS", "4"))
+    if backend == "sqlite":
+        return SQLiteJobQueue(runner, os.getenv("JOB_DB_PATH", "jobs.db"), workers=workers, on_finish=on_finish)
+    if backend == "memory":
+        return InProcessJobQueue(runner, workers=workers, on_finish=on_finish)
+    raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
@@ -1,38 +1,22 @@
-import json
-import boto3
-import hashlib
+from runtime import event_params, instrumented, respond, table
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table("UserLoginData")
+TABLE_NAME = "UserLoginData"
 
+@instrumented
 def lambda_handler(event, context):
 
-    raw_body = event.get("body", {})
-
     # Accept both dict and string bodies
-    if isinstance(raw_body, dict):
-        body = raw_body
-    else:
-        try:
-            body = json.loads(raw_body)
-        except:
-            body = {}
+    body = event_params(event)
 
     user_id = body.get("user_id")
     password = body.get("password")
 
     if not user_id or not password:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"error": "user_id and password are required"})
-        }
+        return respond(400, {"error": "user_id and password are required"})
 
     # CHANGE THIS LINE
-    table.put_item(
+    table(TABLE_NAME).put_item(
         Item={"user_id": user_id, "password": password}
     )
 
-    return {
-        "statusCode": 200,
-        "body": json.dumps({"message": "User created"})
-    }
\ No newline at end of file
+    return respond(200, {"message": "User created"})
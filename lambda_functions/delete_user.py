@@ -1,18 +1,113 @@
-import json
-import boto3
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table("UserLoginData")
+from boto3.dynamodb.conditions import Key
+from runtime import client, event_params, instrumented, logger, respond, span, table
+from poster_objects import BUCKET_NAME, DERIVATIVE_NAMES, derivative_key, forget, poster_key, release
 
+TABLE_NAME = "UserLoginData"
+HISTORY_TABLE_NAME = "UserPosterHistory"
+
+# History rows read per query; their rows and objects are deleted before the next page
+PAGE_SIZE = 1000
+BATCH_WRITE_CHUNK = 25      # DynamoDB batch_write_item limit
+DELETE_OBJECTS_CHUNK = 1000  # S3 delete_objects limit
+BATCH_RETRIES = 5
+DELETE_WORKERS = int(os.environ.get("DELETE_WORKERS", "8"))
+
+# A call stops between pages once less than this much Lambda time is left; calling again
+# picks up where it stopped (the rows already deleted are simply gone)
+TIME_RESERVE_MS = int(os.environ.get("DELETE_TIME_RESERVE_MS", "30000"))
+
+
+def query_page(user_id):
+    with span("dynamodb.query"):
+        return table(HISTORY_TABLE_NAME).query(
+            KeyConditionExpression=Key("user_id").eq(user_id),
+            ProjectionExpression="#ts, s3_key, poster_url",
+            ExpressionAttributeNames={"#ts": "timestamp"},
+            Limit=PAGE_SIZE,
+            # Rows deleted by the previous page must not come back
+            ConsistentRead=True,
+        )["Items"]
+
+
+def delete_rows(user_id, rows):
+    """Deletes one chunk of history rows with batch_write_item, retrying unprocessed items."""
+    pending = {HISTORY_TABLE_NAME: [
+        {"DeleteRequest": {"Key": {"user_id": {"S": user_id}, "timestamp": {"S": row["timestamp"]}}}}
+        for row in rows
+    ]}
+    for attempt in range(BATCH_RETRIES):
+        with span("dynamodb.batch_delete"):
+            pending = client("dynamodb").batch_write_item(RequestItems=pending).get("UnprocessedItems")
+        if not pending:
+            return len(rows)
+        time.sleep(0.05 * 2 ** attempt)
+    raise RuntimeError("Could not delete all history rows")
+
+
+def delete_objects(keys):
+    """Deletes one chunk of S3 keys, retrying the keys S3 reports as failed."""
+    pending = list(keys)
+    for attempt in range(BATCH_RETRIES):
+        with span("s3.delete_objects"):
+            errors = client("s3").delete_objects(
+                Bucket=BUCKET_NAME,
+                Delete={"Objects": [{"Key": key} for key in pending], "Quiet": True},
+            ).get("Errors", [])
+        if not errors:
+            return len(keys)
+        pending = [error["Key"] for error in errors]
+        time.sleep(0.05 * 2 ** attempt)
+    raise RuntimeError(f"Could not delete {len(pending)} objects")
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def delete_page(user_id, rows, pool, progress):
+    """Removes one page of history: unowned objects first, then the rows that point at them."""
+    keys = sorted({key for key in map(poster_key, rows) if key})
+    released = [key for key, free in zip(keys, pool.map(lambda k: release(user_id, k), keys)) if free]
+    objects = released + [derivative_key(key, name) for key in released for name in DERIVATIVE_NAMES]
+
+    progress["deleted_objects"] += sum(pool.map(delete_objects, chunks(objects, DELETE_OBJECTS_CHUNK)))
+    list(pool.map(forget, released))
+    progress["kept_objects"] += len(keys) - len(released)
+    progress["deleted_posters"] += sum(pool.map(lambda chunk: delete_rows(user_id, chunk),
+                                                chunks(rows, BATCH_WRITE_CHUNK)))
+
+
+@instrumented
 def lambda_handler(event, context):
-    user_id = event.get("queryStringParameters", {}).get("user_id")
+    user_id = event_params(event).get("user_id")
 
     if not user_id:
-        return {"statusCode": 400, "body": json.dumps({"error": "user_id required"})}
+        return respond(400, {"error": "user_id required"})
+
+    # The account goes first, so the user can no longer log in while the history is removed
+    table(TABLE_NAME).delete_item(Key={"user_id": user_id})
 
-    table.delete_item(Key={"user_id": user_id})
+    progress = {"deleted_posters": 0, "deleted_objects": 0, "kept_objects": 0}
+    try:
+        with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+            while True:
+                rows = query_page(user_id)
+                if not rows:
+                    break
+                delete_page(user_id, rows, pool, progress)
+                logger.info("Deleting %s: %d posters, %d objects removed, %d shared objects kept",
+                            user_id, progress["deleted_posters"], progress["deleted_objects"],
+                            progress["kept_objects"])
+                if context is not None and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+                    return respond(202, dict(progress, done=False,
+                                             message="Deletion in progress; call again to continue"))
+    except Exception:
+        logger.exception("Deleting history of %s failed", user_id)
+        return respond(500, dict(progress, done=False,
+                                 error="Deletion failed part way; call again to continue"))
 
-    return {
-        "statusCode": 200,
-        "body": json.dumps({"message": "User deleted successfully"})
-    }
+    return respond(200, dict(progress, done=True, message="User deleted successfully"))
@@ -1,58 +1,88 @@
 import json
-import boto3
-import logging
+import base64
 from boto3.dynamodb.conditions import Key
+from runtime import event_params, instrumented, logger, respond, span, table
 
-# Set up DynamoDB resource
-dynamodb = boto3.resource("dynamodb")
-history_table = dynamodb.Table("UserPosterHistory")
-user_table = dynamodb.Table("UserLoginData")
+# DynamoDB tables (handles are created lazily by runtime)
+HISTORY_TABLE_NAME = "UserPosterHistory"
+USER_TABLE_NAME = "UserLoginData"
 
-# Set up logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
 
+# Only the fields the dashboard and exports use ("timestamp" is a reserved word)
+PROJECTION = "#ts, prompt_used, paid, poster_url, thumbnail_url, preview_url, s3_key"
+
+# Scaled-down copies written next to the full-size poster by poster_designer,
+# and the poster's object key; like poster_url, only returned once it is paid for
+PAID_ONLY_FIELDS = ("thumbnail_url", "preview_url", "s3_key")
+
+def encode_token(last_key):
+    """Opaque cursor for DynamoDB's LastEvaluatedKey."""
+    return base64.urlsafe_b64encode(json.dumps(last_key).encode()).decode()
+
+def decode_token(token, user_id):
+    last_key = json.loads(base64.urlsafe_b64decode(token.encode()))
+    # A cursor must point into the caller's own partition
+    if not isinstance(last_key, dict) or last_key.get("user_id") != user_id:
+        raise ValueError("cursor does not belong to this user")
+    return last_key
+
+@instrumented
 def lambda_handler(event, context):
 
-    # Extract user_id from event
-    user_id = event.get("user_id", "")
+    # Extract user_id and paging parameters from event
+    params = event_params(event)
+    user_id = params.get("user_id") or ""
+    next_token = params.get("next_token")
+
+    try:
+        limit = min(max(int(params.get("limit") or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return respond(400, {"error": "limit must be an integer."})
 
     # 1. Validate user_id
     if not user_id:
         logger.error("No user_id provided in the request.")
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"error": "User ID is required."})
-        }
+        return respond(400, {"error": "User ID is required."})
 
     try:
         # -------------------------------------------------------------
         # 2. CHECK IF USER EXISTS IN UserLoginData
         # -------------------------------------------------------------
-        user_check = user_table.get_item(
-            Key={"user_id": user_id}
-        )
+        with span("dynamodb.get"):
+            user_check = table(USER_TABLE_NAME).get_item(
+                Key={"user_id": user_id}
+            )
 
         if "Item" not in user_check:
-            logger.warning(f"Unauthorized attempt: user {user_id} not found.")
-            return {
-                "statusCode": 403,
-                "body": json.dumps({"error": "User does not exist. Access denied."})
-            }
+            logger.warning("Unauthorized attempt: user %s not found.", user_id)
+            return respond(403, {"error": "User does not exist. Access denied."})
 
         # -------------------------------------------------------------
-        # 3. Fetch poster history
+        # 3. Fetch one page of poster history, newest first
         # -------------------------------------------------------------
-        resp = history_table.query(
-            KeyConditionExpression=Key('user_id').eq(user_id)
-        )
+        query_args = {
+            "KeyConditionExpression": Key('user_id').eq(user_id),
+            "ScanIndexForward": False,
+            "Limit": limit,
+            "ProjectionExpression": PROJECTION,
+            "ExpressionAttributeNames": {"#ts": "timestamp"}
+        }
+        if next_token:
+            try:
+                query_args["ExclusiveStartKey"] = decode_token(next_token, user_id)
+            except ValueError:
+                return respond(400, {"error": "Invalid next_token."})
+
+        with span("dynamodb.query"):
+            resp = table(HISTORY_TABLE_NAME).query(**query_args)
+        last_key = resp.get("LastEvaluatedKey")
+        page_token = encode_token(last_key) if last_key else None
 
         if "Items" not in resp or not resp["Items"]:
-            logger.info(f"No posters found for user {user_id}.")
-            return {
-                "statusCode": 200,
-                "body": json.dumps([])
-            }
+            logger.debug("No posters found for user %s.", user_id)
+            return respond(200, {"posters": [], "next_token": None})
 
         posters = []
         for poster in resp["Items"]:
@@ -61,23 +91,21 @@ def lambda_handler(event, context):
             if poster.get("paid", False):
                 poster["locked"] = False
                 poster["poster_url"] = poster.get("poster_url", "")
+                for field in PAID_ONLY_FIELDS:
+                    poster[field] = poster.get(field)
 
             # Unpaid poster → locked
             else:
                 poster["locked"] = True
                 poster["poster_url"] = None
+                for field in PAID_ONLY_FIELDS:
+                    poster[field] = None
 
             posters.append(poster)
 
-        logger.info(f"Found {len(posters)} posters for user {user_id}.")
-        return {
-            "statusCode": 200,
-            "body": json.dumps(posters)
-        }
+        logger.debug("Found %d posters for user %s.", len(posters), user_id)
+        return respond(200, {"posters": posters, "next_token": page_token})
 
-    except Exception as e:
-        logger.error(f"Error while processing request for {user_id}: {str(e)}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"error": "Internal server error. Please try again later."})
-        }
+    except Exception:
+        logger.exception("Error while processing request for %s", user_id)
+        return respond(500, {"error": "Internal server error. Please try again later."})
@@ -1,25 +1,21 @@
-import json
-import boto3
+from runtime import event_params, instrumented, respond, table
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table("UserLoginData")
+TABLE_NAME = "UserLoginData"
 
+@instrumented
 def lambda_handler(event, context):
-    user_id = event.get("queryStringParameters", {}).get("user_id")
+    user_id = event_params(event).get("user_id")
 
     if not user_id:
-        return {"statusCode": 400, "body": json.dumps({"error": "user_id required"})}
+        return respond(400, {"error": "user_id required"})
 
-    resp = table.get_item(Key={"user_id": user_id})
+    resp = table(TABLE_NAME).get_item(Key={"user_id": user_id})
 
     if "Item" not in resp:
-        return {"statusCode": 404, "body": json.dumps({"error": "User not found"})}
+        return respond(404, {"error": "User not found"})
 
     # FIX: Return password hash so the frontend/backend can verify it
-    return {
-        "statusCode": 200,
-        "body": json.dumps({
-            "user_id": resp["Item"]["user_id"],
-            "password": resp["Item"]["password"]
-        })
-    }
+    return respond(200, {
+        "user_id": resp["Item"]["user_id"],
+        "password": resp["Item"]["password"]
+    })
@@ -1,77 +1,172 @@
-import json
-import boto3
-import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
-history_table = dynamodb.Table('UserPosterHistory')
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from runtime import client, event_params, instrumented, logger, resource, respond, span, table
 
-def lambda_handler(event, context):
-    print("Received event:", json.dumps(event)) # Debug log
+# DynamoDB table (the handle is created lazily by runtime)
+HISTORY_TABLE_NAME = 'UserPosterHistory'
+
+def history_table():
+    return table(HISTORY_TABLE_NAME)
+
+# Poster fields revealed once a poster is paid for
+UNLOCKED_FIELDS = ("timestamp", "poster_url", "thumbnail_url", "preview_url")
+
+# Batch checkout: posters per request, and per TransactWriteItems / BatchGetItem call
+MAX_UNLOCK_BATCH = 500
+TRANSACTION_CHUNK = 100
+BATCH_GET_CHUNK = 100
+BATCH_GET_RETRIES = 5
+
+def find_poster_by_prompt(user_id, prompt_used):
+    """Finds a poster in the user's own partition, following every result page."""
+    query_args = {
+        "KeyConditionExpression": Key('user_id').eq(user_id),
+        "FilterExpression": Attr('prompt_used').eq(prompt_used),
+        "ProjectionExpression": "user_id, #ts",
+        "ExpressionAttributeNames": {"#ts": "timestamp"}
+    }
+    while True:
+        with span("dynamodb.query"):
+            response = history_table().query(**query_args)
+        if response.get("Items"):
+            return response["Items"][0]
+        if "LastEvaluatedKey" not in response:
+            return None
+        query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
-    # FIX: Handle both stringified body (Proxy/Mapping) and direct dict (Test console)
-    raw_body = event.get("body", "{}")
-    
-    if isinstance(raw_body, str):
+def unlock_chunk(user_id, timestamps):
+    """Marks up to TRANSACTION_CHUNK posters paid in one transaction; returns the timestamps not found.
+
+    A missing poster cancels the whole transaction, so it is retried without the posters
+    DynamoDB reported as failing their condition.
+    """
+    missing = []
+    pending = list(timestamps)
+    while pending:
         try:
-            body = json.loads(raw_body)
-        except:
-            body = {}
-    elif isinstance(raw_body, dict):
-        body = raw_body
-    else:
-        body = {}
+            with span("dynamodb.transact_write"):
+                client("dynamodb").transact_write_items(TransactItems=[{"Update": {
+                    "TableName": HISTORY_TABLE_NAME,
+                    "Key": {"user_id": {"S": user_id}, "timestamp": {"S": timestamp}},
+                    "UpdateExpression": "SET paid = :paid",
+                    "ConditionExpression": "attribute_exists(user_id)",
+                    "ExpressionAttributeValues": {":paid": {"BOOL": True}},
+                }} for timestamp in pending])
+            return missing
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            reasons = e.response.get("CancellationReasons") or []
+            failed = {timestamp for timestamp, reason in zip(pending, reasons)
+                      if reason.get("Code") == "ConditionalCheckFailed"}
+            if not failed:
+                raise
+            missing += [timestamp for timestamp in pending if timestamp in failed]
+            pending = [timestamp for timestamp in pending if timestamp not in failed]
+    return missing
+
+def unlocked_posters(user_id, timestamps):
+    """Reads the revealed fields of up to BATCH_GET_CHUNK posters with BatchGetItem."""
+    pending = {HISTORY_TABLE_NAME: {
+        "Keys": [{"user_id": user_id, "timestamp": timestamp} for timestamp in timestamps],
+        "ProjectionExpression": ", ".join("#" + field for field in UNLOCKED_FIELDS),
+        "ExpressionAttributeNames": {"#" + field: field for field in UNLOCKED_FIELDS},
+    }}
+    posters = []
+    for attempt in range(BATCH_GET_RETRIES):
+        with span("dynamodb.batch_get"):
+            response = resource("dynamodb").batch_get_item(RequestItems=pending)
+        posters += [{field: item.get(field) for field in UNLOCKED_FIELDS}
+                    for item in response["Responses"].get(HISTORY_TABLE_NAME, [])]
+        pending = response.get("UnprocessedKeys")
+        if not pending:
+            return posters
+        time.sleep(0.05 * 2 ** attempt)
+    raise RuntimeError("Could not read all unlocked posters")
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def unlock_batch(user_id, timestamps):
+    """Handles {"user_id": ..., "timestamps": [...]}: one transaction per 100 posters, run in parallel."""
+    timestamps = list(dict.fromkeys(t for t in timestamps if isinstance(t, str) and t))
+    if not timestamps:
+        return respond(400, {"error": "timestamps must be a non-empty list of poster timestamps."})
+    if len(timestamps) > MAX_UNLOCK_BATCH:
+        return respond(400, {"error": f"At most {MAX_UNLOCK_BATCH} posters per request."})
+
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            missing = [timestamp for found in pool.map(lambda chunk: unlock_chunk(user_id, chunk),
+                                                       chunks(timestamps, TRANSACTION_CHUNK))
+                       for timestamp in found]
+            not_found = set(missing)
+            paid = [timestamp for timestamp in timestamps if timestamp not in not_found]
+            posters = [poster for read in pool.map(lambda chunk: unlocked_posters(user_id, chunk),
+                                                   chunks(paid, BATCH_GET_CHUNK))
+                       for poster in read]
+    except Exception as e:
+        logger.exception("Batch payment update failed")
+        return respond(500, {"error": f"Failed to mark payment: {str(e)}"})
+
+    if not posters:
+        return respond(404, {"error": "None of the posters were found for this user.", "not_found": missing})
+    return respond(200, {"message": f"Payment marked successful for {len(posters)} posters.",
+                         "posters": posters, "not_found": missing})
+
+@instrumented
+def lambda_handler(event, context):
+    # Handles both stringified body (Proxy/Mapping) and direct dict (Test console)
+    body = event_params(event)
 
     user_id = body.get("user_id", "")
+    timestamp = body.get("timestamp", "")
     prompt_used = body.get("prompt_used", "")
 
-    if not user_id or not prompt_used:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"error": "User ID and prompt are required."})
-        }
+    # Multi-poster checkout: all of the user's posters in one request
+    if user_id and isinstance(body.get("timestamps"), list):
+        return unlock_batch(user_id, body["timestamps"])
+
+    if not user_id or not (timestamp or prompt_used):
+        return respond(400, {"error": "User ID and poster timestamp (or prompt) are required."})
 
     try:
-        # Query for the specific poster using user_id and prompt_used as an attribute filter
-        response = history_table.scan(
-            FilterExpression="user_id = :user_id and prompt_used = :prompt_used",
-            ExpressionAttributeValues={
-                ":user_id": user_id,
-                ":prompt_used": prompt_used
-            }
-        )
-
-        # Check if the poster exists
-        if "Items" not in response or not response["Items"]:
-            return {
-                "statusCode": 404,
-                "body": json.dumps({"error": "Poster not found for this user with the given prompt."})
-            }
-
-        # Update the payment status for the specific poster
-        poster = response["Items"][0]  # Getting the first match
-
-        # Update the 'paid' status of the matched poster
-        update_response = history_table.update_item(
-            Key={
-                'user_id': user_id,
-                'timestamp': poster['timestamp']  # Use the timestamp from the found item
-            },
-            UpdateExpression="SET paid = :paid",
-            ExpressionAttributeValues={
-                ":paid": True
-            },
-            ReturnValues="UPDATED_NEW"
-        )
-
-        return {
-            "statusCode": 200,
-            "body": json.dumps({"message": "Payment marked successful for the specific poster."})
-        }
+        # Older clients only send the prompt; resolve it to the poster's sort key
+        if not timestamp:
+            poster = find_poster_by_prompt(user_id, prompt_used)
+            if poster is None:
+                return respond(404, {"error": "Poster not found for this user with the given prompt."})
+            timestamp = poster["timestamp"]
+
+        # Update the 'paid' status by primary key; the condition stops us creating a new row
+        with span("dynamodb.update"):
+            updated = history_table().update_item(
+                Key={
+                    'user_id': user_id,
+                    'timestamp': timestamp
+                },
+                UpdateExpression="SET paid = :paid",
+                ConditionExpression="attribute_exists(user_id)",
+                ExpressionAttributeValues={
+                    ":paid": True
+                },
+                ReturnValues="ALL_NEW"
+            )["Attributes"]
+
+        # Return the now-unlocked URLs so callers can update cached history without a refetch
+        poster = {field: updated.get(field) for field in UNLOCKED_FIELDS}
+
+        return respond(200, {"message": "Payment marked successful for the specific poster.", "poster": poster})
+
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return respond(404, {"error": "Poster not found for this user."})
+        logger.exception("Payment update failed")
+        return respond(500, {"error": f"Failed to mark payment: {str(e)}"})
 
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"error": f"Failed to mark payment: {str(e)}"})
-        }
+        logger.exception("Payment update failed")
+        return respond(500, {"error": f"Failed to mark payment: {str(e)}"})
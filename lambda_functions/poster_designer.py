@@ -1,126 +1,636 @@
 import json
-import boto3
 import base64
+import contextlib
 import datetime
+import hashlib
+import io
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from runtime import client, event_params, instrumented, logger, respond, span
+from prompt_policy import MAX_PROMPT_LEN, check_prompt, normalize_prompt
+from poster_objects import BUCKET_NAME, claim, derivative_key
 
-# Clients
-bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
-s3 = boto3.client("s3")
-dynamodb = boto3.client("dynamodb")
+# Pillow is optional (Lambda layer); without it no thumbnails/previews are made
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Clients are created on first use (and reused while the container is warm),
+# so a cache hit never pays for the Bedrock or S3 client setup
+def bedrock():
+    return client("bedrock-runtime", region_name="us-east-1")
+
+def s3():
+    return client("s3")
+
+def dynamodb():
+    return client("dynamodb")
 
-BUCKET_NAME = "movie-poster-design-caa900"
 TABLE_NAME = "UserPosterHistory"
-MAX_PROMPT_LEN = 512  # Titan v2 hard limit
+# Images are stored under the SHA-256 of their bytes: <prefix>/ab/cd/abcd....png. The leading
+# hash characters spread keys (and S3 request load) evenly; identical images share one object
+POSTER_KEY_PREFIX = "posters"
+
+GENERATION_CONFIG = {
+    "numberOfImages": 1,
+    "height": 1024,
+    "width": 1024,
+    "cfgScale": 8
+}
+
+# Batch mode limits
+MAX_VARIATIONS = 5        # Titan v2 returns at most 5 images per call
+MAX_BATCH_PROMPTS = 5
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "8"))
+BATCH_WRITE_CHUNK = 25    # DynamoDB batch_write_item limit
+BATCH_WRITE_RETRIES = 5
+
+# Single-image responses are decoded and uploaded as they stream in
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                                        multipart_chunksize=8 * 1024 * 1024,
+                                        max_concurrency=4)
+# public-read lets browsers load the poster URLs directly. With the web app's image proxy
+# reading through presigned URLs (IMAGE_ORIGIN=presigned), set POSTER_OBJECT_ACL=private.
+POSTER_OBJECT_ACL = os.environ.get("POSTER_OBJECT_ACL", "public-read")
+ACL_ARGS = {"ACL": POSTER_OBJECT_ACL} if POSTER_OBJECT_ACL != "private" else {}
 
-def save_history(user_id, prompt, poster_url):
+# Content-addressed objects never change, so browsers and CDNs may cache them for good
+IMAGE_EXTRA_ARGS = {"ContentType": "image/png", "CacheControl": "public, max-age=31536000, immutable",
+                    **ACL_ARGS}
+
+# Smaller copies stored next to each poster for the dashboard grid: name -> (max side, quality)
+DERIVATIVES = {
+    "thumbnail": (256, 70),
+    "preview": (640, 80),
+}
+DERIVATIVES_ENABLED = Image is not None and os.environ.get("POSTER_DERIVATIVES", "on") != "off"
+
+# Generation cache: identical (normalized prompt, config, seed) requests reuse the stored image
+CACHE_ENABLED = os.environ.get("GENERATION_CACHE", "on") != "off"
+CACHE_TABLE_NAME = os.environ.get("CACHE_TABLE_NAME", "PosterGenerationCache")
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "256"))  # per warm container
+
+# Optional per-user limit on generation requests: a token bucket per user in DynamoDB
+# (shared by every container). Unset RATE_LIMIT_TABLE_NAME turns it off.
+RATE_LIMIT_TABLE_NAME = os.environ.get("RATE_LIMIT_TABLE_NAME")
+RATE_LIMIT_PER_WINDOW = int(os.environ.get("RATE_LIMIT_PER_WINDOW", "10"))
+RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+# Warm-container LRU in front of the DynamoDB cache table: cache_key -> entry
+local_cache = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0, "local_hits": 0}
+
+def history_item(user_id, timestamp, prompt, poster):
+    item = {
+        "user_id": {"S": user_id},
+        "timestamp": {"S": timestamp},
+        "prompt_used": {"S": prompt},
+        "paid": {"BOOL": False},
+        "poster_url": {"S": poster["poster_url"]},
+        "s3_key": {"S": poster["s3_key"]}
+    }
+    for name in DERIVATIVES:
+        if poster.get(f"{name}_url"):
+            item[f"{name}_url"] = {"S": poster[f"{name}_url"]}
+    return item
+
+def claim_objects(user_id, posters):
+    """Records the user as an owner of the posters' objects, before the rows point at them.
+
+    A failed claim only means the object will be kept when the account is deleted.
+    """
+    for key in {poster["s3_key"] for poster in posters}:
+        try:
+            claim(user_id, key)
+        except Exception as e:
+            logger.warning("Could not record owner of %s: %s", key, e)
+
+def save_history(user_id, prompt, poster):
     """Stores poster info in DynamoDB."""
     timestamp = datetime.datetime.utcnow().isoformat()
+    claim_objects(user_id, [poster])
+
+    with span("dynamodb.write"):
+        dynamodb().put_item(
+            TableName=TABLE_NAME,
+            Item=history_item(user_id, timestamp, prompt, poster)
+        )
+
+def save_history_batch(user_id, posters):
+    """Stores many (prompt, poster) rows with batch_write_item, retrying unprocessed items."""
+    claim_objects(user_id, [poster for _, poster in posters])
+    # timestamp is the sort key, so every row in the batch needs its own
+    now = datetime.datetime.utcnow()
+    requests = [
+        {"PutRequest": {"Item": history_item(
+            user_id, (now + datetime.timedelta(microseconds=i)).isoformat(timespec="microseconds"), prompt, poster
+        )}}
+        for i, (prompt, poster) in enumerate(posters)
+    ]
+
+    for start in range(0, len(requests), BATCH_WRITE_CHUNK):
+        pending = {TABLE_NAME: requests[start:start + BATCH_WRITE_CHUNK]}
+        for attempt in range(BATCH_WRITE_RETRIES):
+            with span("dynamodb.write"):
+                pending = dynamodb().batch_write_item(RequestItems=pending).get("UnprocessedItems")
+            if not pending:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError("Could not save all history rows")
+
+def generation_cache_key(prompt, generation_config, seed=None):
+    """Content address of a generation request: normalized prompt + config + seed."""
+    material = json.dumps(
+        {"prompt": normalize_prompt(prompt), "config": generation_config, "seed": seed},
+        sort_keys=True
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+def _remember(key, entry):
+    local_cache[key] = entry
+    local_cache.move_to_end(key)
+    while len(local_cache) > CACHE_MAX_ENTRIES:
+        local_cache.popitem(last=False)
+
+def cache_get(key):
+    """Returns the cached entry for a key, or None on a miss or expired entry."""
+    now = int(time.time())
 
-    dynamodb.put_item(
-        TableName=TABLE_NAME,
+    entry = local_cache.get(key)
+    if entry and entry["expires_at"] > now:
+        local_cache.move_to_end(key)
+        cache_stats["hits"] += 1
+        cache_stats["local_hits"] += 1
+        return entry
+
+    # DynamoDB TTL deletes lazily, so the expiry is checked here as well
+    item = dynamodb().get_item(TableName=CACHE_TABLE_NAME, Key={"cache_key": {"S": key}}).get("Item")
+    if item and int(item["expires_at"]["N"]) > now:
+        if "posters" in item:
+            posters = json.loads(item["posters"]["S"])
+        elif "poster_urls" in item:
+            posters = [{"poster_url": url["S"], "s3_key": k["S"]}
+                       for url, k in zip(item["poster_urls"]["L"], item["s3_keys"]["L"])]
+        else:
+            posters = [{"poster_url": item["poster_url"]["S"], "s3_key": item["s3_key"]["S"]}]
+        entry = {"posters": posters, "expires_at": int(item["expires_at"]["N"])}
+        _remember(key, entry)
+        cache_stats["hits"] += 1
+        return entry
+
+    local_cache.pop(key, None)
+    cache_stats["misses"] += 1
+    return None
+
+def cache_put(key, posters):
+    entry = {"posters": posters, "expires_at": int(time.time()) + CACHE_TTL_SECONDS}
+    dynamodb().put_item(
+        TableName=CACHE_TABLE_NAME,
         Item={
-            "user_id": {"S": user_id},
-            "timestamp": {"S": timestamp},
-            "prompt_used": {"S": prompt},
-            "paid": {"BOOL": False},
-            "poster_url": {"S": poster_url}
+            "cache_key": {"S": key},
+            "posters": {"S": json.dumps(posters)},
+            "expires_at": {"N": str(entry["expires_at"])}
         }
     )
+    _remember(key, entry)
 
-def lambda_handler(event, context):
-    print("Received event:", json.dumps(event)) # Debug log
+def log_cache_metrics(hit):
+    """Emits hit/miss counts in CloudWatch embedded metric format."""
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "PosterDesigner",
+                "Dimensions": [[]],
+                "Metrics": [{"Name": "GenerationCacheHit", "Unit": "Count"},
+                            {"Name": "GenerationCacheMiss", "Unit": "Count"}]
+            }]
+        },
+        "GenerationCacheHit": int(hit),
+        "GenerationCacheMiss": int(not hit),
+        "container_hits": cache_stats["hits"],
+        "container_misses": cache_stats["misses"],
+        "container_local_hits": cache_stats["local_hits"]
+    }))
 
-    prompt = event.get("prompt")
-    user_id = event.get("user_id")
+class Base64ImageStream(io.RawIOBase):
+    """File-like view of the first image in a streaming Titan response body.
 
-    if not prompt:
-        qs = event.get("queryStringParameters")
-        if qs:
-            prompt = qs.get("prompt")
-            user_id = qs.get("user_id")
+    The response is {"images": ["<base64>", ...], "error": null}. Instead of
+    reading it whole and json-decoding it, this scans for the start of the first
+    image and base64-decodes it chunk by chunk as the caller reads, so neither the
+    JSON text nor the base64 string is ever held in memory in full.
+    """
 
-    # 3. If not found, try body (Proxy Integration POST)
-    if not prompt:
-        body = event.get("body")
-        if body:
-            try:
-                if isinstance(body, str):
-                    body = json.loads(body)
-                if isinstance(body, dict):
-                    prompt = body.get("prompt")
-                    user_id = body.get("user_id")
-            except:
-                pass
-    
-    # Default user_id if missing
-    if not user_id:
-        user_id = "anonymous_user"
+    def __init__(self, body, chunk_size=STREAM_CHUNK_SIZE):
+        self.body = body
+        self.chunk_size = chunk_size
+        self._encoded = b""   # base64 text not yet decoded (always < 4 bytes after a decode)
+        self._decoded = bytearray()   # decoded bytes not yet handed to the caller
+        self._finished = False
+        self._seek_image_start()
 
-    if not prompt:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"error": "Prompt is required. Event received: " + str(event)})
-        }
+    def readable(self):
+        return True
 
-    # Titan v2 max limit = 512 characters
-    prompt = prompt[:MAX_PROMPT_LEN]
+    def _seek_image_start(self):
+        header = b""
+        while True:
+            chunk = self.body.read(self.chunk_size)
+            if not chunk:
+                break
+            header += chunk
+            marker = header.find(b'"images"')
+            bracket = header.find(b"[", marker) if marker != -1 else -1
+            if bracket != -1:
+                rest = header[bracket + 1:].lstrip()
+                if rest.startswith(b'"'):
+                    self._feed(rest[1:])
+                    return
+                if rest:
+                    break  # empty (or non-string) images array
+            if len(header) > 1024 * 1024:
+                break
+        # No image in the response: surface the model's error message if there is one
+        try:
+            error = json.loads(header + self.body.read()).get("error")
+        except ValueError:
+            error = None
+        raise RuntimeError(f"No image in model response: {error or 'unexpected response'}")
 
-    # Build Titan v2 request body
+    def _feed(self, chunk):
+        end = chunk.find(b'"')
+        if end != -1:
+            chunk = chunk[:end]
+            self._finished = True
+        # JSON may escape "/" as "\/"; base64 itself never contains a backslash
+        self._encoded += chunk.replace(b"\\", b"")
+        usable = len(self._encoded) - len(self._encoded) % 4
+        if self._finished:
+            usable = len(self._encoded)
+        self._decoded.extend(base64.b64decode(self._encoded[:usable]))
+        self._encoded = self._encoded[usable:]
+
+    def readinto(self, buffer):
+        while len(self._decoded) < len(buffer) and not self._finished:
+            chunk = self.body.read(self.chunk_size)
+            if not chunk:
+                raise RuntimeError("Model response ended inside the image data")
+            self._feed(chunk)
+        size = min(len(buffer), len(self._decoded))
+        buffer[:size] = self._decoded[:size]
+        del self._decoded[:size]
+        return size
+
+def invoke_model_stream(prompt, generation_config):
+    """Calls Titan v2 once and returns the unread response body stream."""
     body = {
         "taskType": "TEXT_IMAGE",
         "textToImageParams": {
             "text": prompt
         },
-        "imageGenerationConfig": {
-            "numberOfImages": 1,
-            "height": 1024,
-            "width": 1024,
-            "cfgScale": 8
-        }
+        "imageGenerationConfig": generation_config
     }
 
-    try:
-        # Call Bedrock Titan v2
-        response = bedrock.invoke_model(
+    with span("bedrock.invoke"):
+        response = bedrock().invoke_model(
             modelId="amazon.titan-image-generator-v2:0",
             contentType="application/json",
             accept="application/json",
             body=json.dumps(body)
         )
+    return response["body"]
+
+def invoke_model(prompt, generation_config):
+    """Calls Titan v2 once and returns the base64 images."""
+    body = invoke_model_stream(prompt, generation_config)
+    with span("bedrock.read"):
+        result = json.loads(body.read())
+    return result["images"]
+
+def public_url(key):
+    # Construct permanent public URL
+    # Note: Bucket must have public read access or object ACL must be public-read
+    # (with POSTER_OBJECT_ACL=private only the web app's /posters route can read it)
+    return f"https://{BUCKET_NAME}.s3.amazonaws.com/{key}"
+
+def content_key(digest, suffix=".png"):
+    """S3 key for an object whose bytes hash to `digest` (hex SHA-256)."""
+    return f"{POSTER_KEY_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+def object_exists(key):
+    """True if the key is already stored. Unexpected errors count as missing (the PUT is repeated)."""
+    try:
+        with span("s3.head"):
+            s3().head_object(Bucket=BUCKET_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+            logger.warning("HEAD %s failed, uploading anyway: %s", key, e)
+        return False
+
+# Keys being stored by this container: key -> [lock, users]. Identical images (e.g. in one
+# batch) are then checked and uploaded one after another, and only the first one is PUT
+_storing = {}
+_storing_lock = threading.Lock()
+
+@contextlib.contextmanager
+def storing(key):
+    with _storing_lock:
+        entry = _storing.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _storing_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _storing[key]
+
+def spool(stream, sink):
+    """Copies a file-like stream into `sink` in chunks; returns the SHA-256 hex digest of the bytes."""
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+        sink.write(chunk)
+
+def make_derivatives(image_file):
+    """Returns {name: WebP bytes} scaled-down copies of a poster image."""
+    derivatives = {}
+    with Image.open(image_file) as image:
+        image = image.convert("RGB")
+        for name, (max_side, quality) in DERIVATIVES.items():
+            scaled = image.copy()
+            scaled.thumbnail((max_side, max_side))
+            out = io.BytesIO()
+            scaled.save(out, "WEBP", quality=quality, method=4)
+            derivatives[name] = out.getvalue()
+    return derivatives
+
+def upload_derivatives(key, image_file, stored=False):
+    """Uploads thumbnail/preview copies next to the original; returns their URLs.
+
+    For an image that was already `stored`, existing copies are reused and Pillow only
+    runs if one of them is missing.
+    """
+    urls = {f"{name}_url": public_url(derivative_key(key, name)) for name in DERIVATIVES}
+    if stored and all(object_exists(derivative_key(key, name)) for name in DERIVATIVES):
+        return urls
+
+    try:
+        derivatives = make_derivatives(image_file)
+    except Exception as e:
+        # The full-size poster is already stored; the dashboard falls back to it
+        logger.warning("Derivative generation failed for %s: %s", key, e)
+        return {}
+
+    for name, data in derivatives.items():
+        with span("s3.put"):
+            s3().put_object(
+                Bucket=BUCKET_NAME,
+                Key=derivative_key(key, name),
+                Body=data,
+                ContentType="image/webp",
+                CacheControl="public, max-age=31536000, immutable",
+                **ACL_ARGS
+            )
+    return urls
+
+def upload_image_stream(stream):
+    """Stores a file-like image under its content key; returns the poster record.
+
+    The image is spooled to /tmp while it is hashed (the key is only known at the end),
+    so memory use stays flat; the PUT is skipped when the same image is already stored.
+    """
+    with tempfile.TemporaryFile() as copy:
+        # Covers reading the response and base64 decoding, which overlap
+        with span("bedrock.read"):
+            key = content_key(spool(stream, copy))
+        poster = {"poster_url": public_url(key), "s3_key": key}
+
+        with storing(key):
+            stored = object_exists(key)
+            # Derivatives first: the upload closes the file it is given
+            if DERIVATIVES_ENABLED:
+                copy.seek(0)
+                with span("derivatives"):
+                    poster.update(upload_derivatives(key, copy, stored=stored))
 
-        # Parse image
-        result = json.loads(response["body"].read())
-        image_b64 = result["images"][0]
+            if not stored:
+                copy.seek(0)
+                with span("s3.upload_stream"):
+                    s3().upload_fileobj(copy, BUCKET_NAME, key, ExtraArgs=IMAGE_EXTRA_ARGS,
+                                        Config=STREAM_TRANSFER_CONFIG)
+    return poster
+
+def upload_image(image_b64):
+    """Decodes one base64 image and stores it under its content key; returns the poster record."""
+    with span("base64.decode"):
         image_bytes = base64.b64decode(image_b64)
+    key = content_key(hashlib.sha256(image_bytes).hexdigest())
+    poster = {"poster_url": public_url(key), "s3_key": key}
 
-        # Create file name
-        filename = f"poster-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
+    with storing(key):
+        stored = object_exists(key)
+        if not stored:
+            with span("s3.put"):
+                s3().put_object(Bucket=BUCKET_NAME, Key=key, Body=image_bytes, **IMAGE_EXTRA_ARGS)
 
-        # Upload to S3
-        s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=filename,
-            Body=image_bytes,
-            ContentType="image/png",
-            ACL='public-read'
-        )
+        if DERIVATIVES_ENABLED:
+            with span("derivatives"):
+                poster.update(upload_derivatives(key, io.BytesIO(image_bytes), stored=stored))
+    return poster
 
-        # Construct permanent public URL
-        # Note: Bucket must have public read access or object ACL must be public-read
-        presigned_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{filename}"
+def generate_posters(prompt, generation_config, pool):
+    """Runs one prompt through cache lookup, Bedrock and S3; returns its poster records."""
+    # Reuse an identical earlier generation: new history rows, no model call
+    key = None
+    if CACHE_ENABLED:
+        key = generation_cache_key(prompt, generation_config, generation_config.get("seed"))
+        try:
+            with span("cache.lookup"):
+                cached = cache_get(key)
+        except Exception as e:
+            logger.warning("Generation cache lookup failed: %s", e)
+            cached = None
+        # Deleting the last owner's account removes the objects a cached entry points at
+        if cached and not all(object_exists(poster["s3_key"]) for poster in cached["posters"]):
+            local_cache.pop(key, None)
+            cached = None
+        log_cache_metrics(cached is not None)
 
-        # Save record in DynamoDB
-        save_history(user_id, prompt, presigned_url)
+        if cached:
+            return cached["posters"], True
 
-        # Return the URL
-        return {
-            "statusCode": 200,
-            "body": json.dumps({"poster_url": presigned_url})
-        }
+    if generation_config["numberOfImages"] == 1:
+        # One image: decode straight from the response stream
+        stream = Base64ImageStream(invoke_model_stream(prompt, generation_config))
+        posters = [upload_image_stream(stream)]
+    else:
+        # Several images: decode and upload every image concurrently
+        images = invoke_model(prompt, generation_config)
+        posters = list(pool.map(upload_image, images))
+
+    if key:
+        try:
+            with span("cache.store"):
+                cache_put(key, posters)
+        except Exception as e:
+            logger.warning("Generation cache store failed: %s", e)
+
+    return posters, False
+
+def admit(user_id, now=None):
+    """Takes a token from the user's bucket; returns the seconds to wait, 0 if admitted.
 
+    The bucket holds RATE_LIMIT_PER_WINDOW tokens and refills at that many per
+    RATE_LIMIT_WINDOW_SECONDS, so no burst exceeds the limit (a fixed window let twice the
+    limit through around its boundary). Concurrent requests write it conditionally on the
+    `updated` they read, and retry on conflict.
+    """
+    rate = RATE_LIMIT_PER_WINDOW / RATE_LIMIT_WINDOW_SECONDS
+    key = {"limit_key": {"S": user_id}}
+    try:
+        for _ in range(5):
+            current = now or time.time()
+            with span("dynamodb.rate_limit"):
+                item = dynamodb().get_item(TableName=RATE_LIMIT_TABLE_NAME, Key=key, ConsistentRead=True).get("Item")
+            if item:
+                updated = item["updated"]["N"]
+                tokens = min(RATE_LIMIT_PER_WINDOW,
+                             float(item["tokens"]["N"]) + max(current - float(updated), 0.0) * rate)
+            else:
+                updated, tokens = None, float(RATE_LIMIT_PER_WINDOW)
+            if tokens < 1:
+                return max(math.ceil((1 - tokens) / rate), 1)
+
+            values = {
+                ":tokens": {"N": repr(tokens - 1)},
+                ":now": {"N": repr(current)},
+                # DynamoDB TTL: by then the bucket is full again, the same as no item
+                ":expires": {"N": str(int(current + RATE_LIMIT_WINDOW_SECONDS) + 1)},
+            }
+            if updated is None:
+                condition = "attribute_not_exists(updated)"
+            else:
+                condition = "updated = :updated"
+                values[":updated"] = {"N": updated}
+            try:
+                with span("dynamodb.rate_limit"):
+                    dynamodb().update_item(
+                        TableName=RATE_LIMIT_TABLE_NAME,
+                        Key=key,
+                        UpdateExpression="SET tokens = :tokens, updated = :now, expires_at = :expires",
+                        ConditionExpression=condition,
+                        ExpressionAttributeValues=values,
+                    )
+                return 0
+            except dynamodb().exceptions.ConditionalCheckFailedException:
+                continue  # another request took a token first; read the bucket again
+        logger.warning("Rate limit bucket for %s kept changing, admitting", user_id)
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"error": str(e)})
-        }
+        # The limiter must not take generation down with it
+        logger.warning("Rate limit check failed, admitting: %s", e)
+    return 0
+
+@instrumented
+def lambda_handler(event, context):
+    params = event_params(event)
+
+    user_id = params.get("user_id")
+    seed = params.get("seed")
+
+    # Batch mode: a list of prompts and/or several variations per prompt
+    prompts = params.get("prompts") or []
+    if isinstance(prompts, str):
+        prompts = [prompts]
+    if params.get("prompt"):
+        prompts = [params["prompt"]] + list(prompts)
+    prompts = [p for p in prompts if isinstance(p, str) and p.strip()]
+    
+    # Default user_id if missing
+    if not user_id:
+        user_id = "anonymous_user"
+
+    if not prompts:
+        return respond(400, {"error": "Prompt is required. Event received: " + str(event)})
+
+    if len(prompts) > MAX_BATCH_PROMPTS:
+        return respond(400, {"error": f"At most {MAX_BATCH_PROMPTS} prompts per request"})
+
+    # Disallowed prompts are rejected before any Bedrock, S3 or DynamoDB call
+    for prompt in prompts:
+        error_msg = check_prompt(prompt)
+        if error_msg:
+            logger.info("Rejected prompt for %s: %s", user_id, error_msg)
+            return respond(400, {"error": error_msg})
+
+    if RATE_LIMIT_TABLE_NAME:
+        retry_after = admit(user_id)
+        if retry_after:
+            return respond(429, {"error": f"Too many generation requests. Please try again in {retry_after} s.",
+                                 "retry_after": retry_after})
+
+    # Titan v2 max limit = 512 characters
+    prompts = [p[:MAX_PROMPT_LEN] for p in prompts]
+
+    generation_config = dict(GENERATION_CONFIG)
+    try:
+        variations = int(params.get("variations") or 1)
+        if seed is not None and str(seed).strip() != "":
+            generation_config["seed"] = int(seed)
+    except (TypeError, ValueError):
+        return respond(400, {"error": "seed and variations must be integers"})
+    if not 1 <= variations <= MAX_VARIATIONS:
+        return respond(400, {"error": f"variations must be between 1 and {MAX_VARIATIONS}"})
+    generation_config["numberOfImages"] = variations
+
+    try:
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as upload_pool, \
+                ThreadPoolExecutor(max_workers=len(prompts)) as prompt_pool:
+            results = list(prompt_pool.map(
+                lambda p: generate_posters(p, generation_config, upload_pool), prompts
+            ))
+
+        posters = [
+            dict(poster, prompt=prompt, cached=cached)
+            for prompt, (records, cached) in zip(prompts, results)
+            for poster in records
+        ]
+
+        # Save record(s) in DynamoDB
+        if len(posters) == 1:
+            save_history(user_id, prompts[0], posters[0])
+        else:
+            save_history_batch(user_id, [(p["prompt"], p) for p in posters])
+
+        # Return the URL(s); poster_url stays for single-poster clients
+        response_body = {"poster_url": posters[0]["poster_url"]}
+        for name in DERIVATIVES:
+            if posters[0].get(f"{name}_url"):
+                response_body[f"{name}_url"] = posters[0][f"{name}_url"]
+        if len(posters) > 1:
+            response_body["posters"] = posters
+        elif posters[0]["cached"]:
+            response_body["cached"] = True
+
+        return respond(200, response_body)
+
+    except Exception as e:
+        logger.exception("Poster generation failed")
+        return respond(500, {"error": str(e)})
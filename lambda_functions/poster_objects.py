@@ -0,0 +1,73 @@
+import os
+from urllib.parse import urlsplit
+
+from runtime import client, span
+
+BUCKET_NAME = "movie-poster-design-caa900"
+
+# Content-addressed objects can be shared by many users' history rows (identical images,
+# generation cache hits). Each object's owners are kept as a string set, so an account
+# deletion only removes objects nobody else owns. Adding or removing an owner twice is
+# harmless, which keeps an interrupted deletion safe to run again.
+OWNERS_TABLE_NAME = os.environ.get("OBJECT_OWNERS_TABLE_NAME", "PosterObjectOwners")
+
+# Scaled-down copies poster_designer stores next to each poster
+DERIVATIVE_NAMES = ("thumbnail", "preview")
+
+
+def derivative_key(key, name):
+    return f"{key.rsplit('.', 1)[0]}-{name}.webp"
+
+
+def poster_key(poster):
+    """S3 key of a history row's image; rows from before s3_key was stored only have the URL."""
+    if poster.get("s3_key"):
+        return poster["s3_key"]
+    return urlsplit(poster.get("poster_url") or "").path.lstrip("/") or None
+
+
+def claim(user_id, key):
+    """Records `user_id` as an owner of the object at `key`."""
+    with span("dynamodb.claim"):
+        client("dynamodb").update_item(
+            TableName=OWNERS_TABLE_NAME,
+            Key={"object_key": {"S": key}},
+            UpdateExpression="ADD owners :user",
+            ExpressionAttributeValues={":user": {"SS": [user_id]}},
+        )
+
+
+def release(user_id, key):
+    """Removes `user_id` from the object's owners.
+
+    Returns True if nobody owns it any more (the object may be deleted), False if others
+    still do or if ownership was never recorded (objects stored before owners were tracked).
+    """
+    dynamodb = client("dynamodb")
+    try:
+        with span("dynamodb.release"):
+            item = dynamodb.update_item(
+                TableName=OWNERS_TABLE_NAME,
+                Key={"object_key": {"S": key}},
+                UpdateExpression="DELETE owners :user",
+                ConditionExpression="attribute_exists(object_key)",
+                ExpressionAttributeValues={":user": {"SS": [user_id]}},
+                ReturnValues="ALL_NEW",
+            )["Attributes"]
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    return not item.get("owners", {}).get("SS")
+
+
+def forget(key):
+    """Drops the ownership record of a deleted object, unless someone claimed it meanwhile."""
+    dynamodb = client("dynamodb")
+    try:
+        with span("dynamodb.forget"):
+            dynamodb.delete_item(
+                TableName=OWNERS_TABLE_NAME,
+                Key={"object_key": {"S": key}},
+                ConditionExpression="attribute_not_exists(owners)",
+            )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        pass
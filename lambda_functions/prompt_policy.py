@@ -0,0 +1,65 @@
+"""Prompt rules checked before any generation call.
+
+Shared by the poster designer Lambda (deployed next to the handler, like runtime.py)
+and the Flask/ASGI apps, which reject disallowed prompts before queueing a job.
+Standard library only.
+"""
+import re
+
+MAX_PROMPT_LEN = 512  # Titan v2 hard limit
+
+DISALLOWED_KEYWORDS = [
+    "gun", "pistol", "rifle", "sniper", "weapon", "weapons",
+    "kill", "murder", "blood", "gore", "dead", "death",
+    "bomb", "explosion", "explode", "grenade",
+    "terrorist", "hostage", "suicide", "massacre",
+    "war", "soldier", "military", "combat",
+    "spy", "secret agent", "agent", "assassin", "hitman"
+]
+
+
+def _trie_pattern(node):
+    """Regex for a character trie: shared prefixes are matched once, so the engine
+    tries at most one branch per character (Aho-Corasick-like, in a single search)."""
+    branches = [(r"\s+" if char == " " else re.escape(char)) + _trie_pattern(child)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{pattern})?" if "" in node else pattern
+
+
+def _compile(keywords):
+    # Whole words only, plural "s" included; multi-word keywords match across any whitespace
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in " ".join(keyword.lower().split()):
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return re.compile(rf"\b{_trie_pattern(trie)}s?\b")
+
+
+_DISALLOWED = _compile(DISALLOWED_KEYWORDS)
+
+
+def normalize_prompt(prompt):
+    """Case- and whitespace-insensitive form of a prompt, used for cache and dedup keys."""
+    return " ".join(prompt.lower().split())
+
+
+def disallowed_keyword(prompt):
+    """The first disallowed keyword in the part of the prompt that would be sent, or None."""
+    # Lowercasing first is much cheaper than a case-insensitive pattern
+    match = _DISALLOWED.search(prompt[:MAX_PROMPT_LEN].lower())
+    return " ".join(match.group(0).split()) if match else None
+
+
+def check_prompt(prompt):
+    """Error message for a prompt that must not be generated, or None when it is fine."""
+    if not isinstance(prompt, str) or not prompt.strip():
+        return "Prompt is required"
+    keyword = disallowed_keyword(prompt)
+    if keyword:
+        return f"Prompt contains disallowed content ({keyword!r})"
+    return None
@@ -0,0 +1,179 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+# Opt-in for non-proxy API Gateway integrations: return the payload itself instead of
+# {"statusCode": ..., "body": "<json text>"}, so clients decode JSON once instead of twice.
+PLAIN_JSON_RESPONSES = os.environ.get("PLAIN_JSON_RESPONSES", "off") == "on"
+
+# One tuned botocore config for every client: pooled keep-alive connections,
+# standard retry mode and timeouts well inside the Lambda/API Gateway limits.
+BOTO_CONFIG = Config(
+    connect_timeout=float(os.environ.get("AWS_CONNECT_TIMEOUT", "2")),
+    read_timeout=float(os.environ.get("AWS_READ_TIMEOUT", "10")),
+    retries={"mode": "standard", "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", "3"))},
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32")),
+    tcp_keepalive=True,
+)
+
+# Image generation routinely takes tens of seconds, and a retried call is billed again
+SERVICE_CONFIGS = {
+    "bedrock-runtime": BOTO_CONFIG.merge(Config(read_timeout=120, retries={"mode": "standard", "max_attempts": 2})),
+}
+
+# INFO emits one timing line per invocation; DEBUG adds the incoming event
+logger = logging.getLogger("poster")
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+# Clients are created on first use and reused for the life of the container
+_clients = {}
+_lock = threading.Lock()
+
+
+def client(service, region_name=None):
+    """Cached low-level boto3 client for a service."""
+    key = ("client", service, region_name)
+    if key not in _clients:
+        # boto3's default session is not thread-safe while it creates clients
+        with _lock:
+            if key not in _clients:
+                config = SERVICE_CONFIGS.get(service, BOTO_CONFIG)
+                _clients[key] = boto3.client(service, region_name=region_name, config=config)
+    return _clients[key]
+
+
+def resource(service):
+    """Cached boto3 resource for a service."""
+    key = ("resource", service, None)
+    if key not in _clients:
+        with _lock:
+            if key not in _clients:
+                _clients[key] = boto3.resource(service, config=SERVICE_CONFIGS.get(service, BOTO_CONFIG))
+    return _clients[key]
+
+
+def table(name):
+    """DynamoDB Table handle on the cached resource."""
+    return resource("dynamodb").Table(name)
+
+
+def parse_body(event):
+    """Handles cases where event['body'] is dict or JSON string."""
+    body = event.get("body")
+
+    # Case 1: body is already a dict
+    if isinstance(body, dict):
+        return body
+
+    # Case 2: body is a JSON string
+    if isinstance(body, str) and body.strip() != "":
+        try:
+            parsed = json.loads(body)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            pass
+
+    # Fallback: empty dict
+    return {}
+
+
+# API Gateway proxy envelope keys that are never request parameters
+ENVELOPE_KEYS = frozenset([
+    "body", "queryStringParameters", "multiValueQueryStringParameters", "headers", "multiValueHeaders",
+    "requestContext", "pathParameters", "stageVariables", "isBase64Encoded", "resource", "path", "httpMethod",
+])
+
+
+def event_params(event):
+    """Merges request parameters from every place API Gateway can put them.
+
+    Precedence: top-level keys (non-proxy mapping templates and direct invokes),
+    then the query string, then the JSON body.
+    """
+    params = dict(parse_body(event))
+    params.update(event.get("queryStringParameters") or {})
+    params.update({k: v for k, v in event.items() if k not in ENVELOPE_KEYS})
+    return params
+
+
+def respond(status_code, payload):
+    """Builds a handler result in the configured response format."""
+    if PLAIN_JSON_RESPONSES:
+        return payload
+    return {"statusCode": status_code, "body": json.dumps(payload)}
+
+
+# Span timings for the current invocation: name -> [total ms, count].
+# A container runs one invocation at a time, but spans may come from worker threads.
+_invocation = {"request_id": None, "spans": {}}
+_span_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Times a block (Bedrock invoke, S3 put, DynamoDB write, ...) for the invocation summary."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _span_lock:
+            totals = _invocation["spans"].setdefault(name, [0.0, 0])
+            totals[0] += elapsed_ms
+            totals[1] += 1
+
+
+def _caller_request_id(event):
+    headers = event.get("headers") or {}
+    return event.get("request_id") or headers.get("X-Request-ID") or headers.get("x-request-id")
+
+
+def instrumented(handler):
+    """Wraps a lambda_handler: logs the event at DEBUG and emits one timing summary per call.
+
+    The summary is a CloudWatch embedded-metric-format line, so every span also becomes a
+    metric (namespace PosterApp, dimension Function) without extra API calls.
+    """
+    function = handler.__module__
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        with _span_lock:
+            _invocation["request_id"] = _caller_request_id(event) if isinstance(event, dict) else None
+            _invocation["spans"] = {}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received event: %s", json.dumps(event, default=str))
+
+        started = time.perf_counter()
+        try:
+            return handler(event, context)
+        finally:
+            if logger.isEnabledFor(logging.INFO):
+                with _span_lock:
+                    spans = {name: round(total, 2) for name, (total, _) in _invocation["spans"].items()}
+                    request_id = _invocation["request_id"]
+                print(json.dumps({
+                    "_aws": {
+                        "Timestamp": int(time.time() * 1000),
+                        "CloudWatchMetrics": [{
+                            "Namespace": "PosterApp",
+                            "Dimensions": [["Function"]],
+                            "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in ["duration", *spans]],
+                        }],
+                    },
+                    "Function": function,
+                    "request_id": request_id,
+                    "aws_request_id": getattr(context, "aws_request_id", None),
+                    "duration": round((time.perf_counter() - started) * 1000, 2),
+                    **spans,
+                }))
+
+    return wrapper
@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from runtime import event_params, instrumented, respond, span, table
+
+TABLE_NAME = "UserLoginData"
+
+# Shared with the Flask app, which checks the signature on the returned token
+TOKEN_SECRET = os.environ.get("AUTH_TOKEN_SECRET", "")
+TOKEN_TTL_SECONDS = int(os.environ.get("AUTH_TOKEN_TTL_SECONDS", "3600"))
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def sign_token(user_id, now=None):
+    """Session token: base64url(JSON claims) + "." + base64url(HMAC-SHA256 of the claims)."""
+    claims = {"sub": user_id, "exp": int((now or time.time()) + TOKEN_TTL_SECONDS)}
+    payload = _b64(json.dumps(claims, separators=(",", ":")).encode())
+    signature = hmac.new(TOKEN_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+    return f"{payload}.{_b64(signature)}", claims["exp"]
+
+
+@instrumented
+def lambda_handler(event, context):
+    params = event_params(event)
+    user_id = params.get("user_id")
+    password = params.get("password")
+
+    if not user_id or not password:
+        return respond(400, {"error": "user_id and password are required"})
+    if not TOKEN_SECRET:
+        return respond(500, {"error": "AUTH_TOKEN_SECRET is not configured"})
+
+    # Only the hash is read, and it never leaves the function
+    with span("dynamodb.get"):
+        resp = table(TABLE_NAME).get_item(
+            Key={"user_id": user_id},
+            ProjectionExpression="password",
+        )
+    if "Item" not in resp:
+        return respond(404, {"error": "User not found"})
+
+    if not hmac.compare_digest(str(resp["Item"].get("password", "")), str(password)):
+        return respond(401, {"error": "Invalid password"})
+
+    token, expires_at = sign_token(user_id)
+    return respond(200, {"user_id": user_id, "token": token, "expires_at": expires_at})
@@ -0,0 +1,136 @@
+import threading
+from collections import deque
+
+
+class LatencyWindow:
+    """Keeps the most recent latency samples and reports percentiles over them."""
+
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentiles(self, *points):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {f"p{p}": 0.0 for p in points}
+        return {
+            f"p{p}": round(samples[min(int(len(samples) * p / 100), len(samples) - 1)] * 1000, 2)
+            for p in points
+        }
+
+    def stats(self):
+        return dict(self.percentiles(50, 95), count=self.count)
+
+
+# Latency buckets in seconds, from cache hits up to image generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels, exported in Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels, exported in Prometheus text format."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += 1
+            values[-1] += seconds
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(v) for key, v in self._values.items()}
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", dict(labels, le=repr(bound)), count
+            yield f"{self.name}_bucket", dict(labels, le="+Inf"), counts[-2]
+            yield f"{self.name}_count", labels, counts[-2]
+            yield f"{self.name}_sum", labels, round(counts[-1], 6)
+
+
+class Registry:
+    """Metrics plus collector callbacks, rendered together for a /metrics endpoint.
+
+    A collector returns (name, kind, help, [(labels, value), ...]) tuples, for values
+    that already live elsewhere (e.g. connection pool or cache counters).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{_format_labels(labels)} {value}" for name, labels, value in metric.samples())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
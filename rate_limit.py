@@ -0,0 +1,177 @@
+import contextlib
+import math
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Result of an admission check. retry_after is in seconds; reason is "ok", "rate" (the
+# user's bucket is empty) or "busy" (too many generations in flight)
+Admission = namedtuple("Admission", "allowed retry_after reason")
+
+# Suggested wait when the in-flight cap is reached (how long a slot takes to free is unknown)
+BUSY_RETRY_AFTER = 5
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(now - updated, 0.0) * rate)
+
+
+class _Counters:
+    def __init__(self):
+        self._counts = {"ok": 0, "duplicate": 0, "rate": 0, "busy": 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, admission):
+        with self._counts_lock:
+            self._counts[admission.reason] += 1
+        return admission
+
+    def _stats(self, backend, in_flight):
+        with self._counts_lock:
+            return dict(backend=backend, in_flight=in_flight, rate=self.rate * 60, burst=self.burst,
+                        max_in_flight=self.max_in_flight, admitted=self._counts["ok"],
+                        duplicates=self._counts["duplicate"], limited=self._counts["rate"],
+                        busy=self._counts["busy"])
+
+
+class MemoryRateLimiter(_Counters):
+    """Token bucket per user plus a cap on leases (generations in flight), in this process.
+
+    `acquire(user_id, lease)` admits a request and holds `lease` until `release(lease)`
+    or until it expires after `lease_seconds`. Acquiring a lease that is already held
+    is a duplicate of an admitted request: it is allowed and costs nothing. A rate of 0
+    turns off the per-user buckets; a max_in_flight of 0 turns off the cap.
+    """
+
+    def __init__(self, rate_per_minute=6, burst=3, max_in_flight=32, lease_seconds=900):
+        super().__init__()
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.lease_seconds = lease_seconds
+        self._buckets = {}  # user_id -> (tokens, updated)
+        self._leases = {}  # lease -> expires_at
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id, lease):
+        with self._lock:
+            # Read the clock only once the lock is held, so buckets never move back in time
+            now = time.monotonic()
+            for key in [k for k, expires in self._leases.items() if expires <= now]:
+                del self._leases[key]
+            if lease in self._leases:
+                return self._count(Admission(True, 0, "duplicate"))
+            if self.max_in_flight and len(self._leases) >= self.max_in_flight:
+                return self._count(Admission(False, BUSY_RETRY_AFTER, "busy"))
+
+            if self.rate > 0:
+                tokens, updated = self._buckets.get(user_id, (self.burst, now))
+                tokens = _refill(tokens, updated, now, self.rate, self.burst)
+                if tokens < 1:
+                    self._buckets[user_id] = (tokens, now)
+                    return self._count(Admission(False, math.ceil((1 - tokens) / self.rate), "rate"))
+                self._buckets[user_id] = (tokens - 1, now)
+                if len(self._buckets) > 10000:
+                    self._prune(now)
+
+            self._leases[lease] = now + self.lease_seconds
+        return self._count(Admission(True, 0, "ok"))
+
+    def release(self, lease):
+        with self._lock:
+            self._leases.pop(lease, None)
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        full = self.burst / self.rate
+        for user_id in [u for u, (_, updated) in self._buckets.items() if now - updated >= full]:
+            del self._buckets[user_id]
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._leases)
+        return self._stats("memory", in_flight)
+
+
+class SQLiteRateLimiter(_Counters):
+    """MemoryRateLimiter's rules kept in a SQLite file, so every worker process on the host
+    shares the buckets and the in-flight cap. Each check is one BEGIN IMMEDIATE transaction."""
+
+    def __init__(self, path, rate_per_minute=6, burst=3, max_in_flight=32, lease_seconds=900):
+        super().__init__()
+        self.path = path
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.lease_seconds = lease_seconds
+
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_buckets (user_id TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_leases (lease TEXT PRIMARY KEY, user_id TEXT, expires REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Connection for one transaction: committed (or rolled back) and closed afterwards."""
+        # sqlite3's own context manager only commits; closing() releases the file handle
+        with contextlib.closing(self._connect()) as conn, conn:
+            yield conn
+
+    def acquire(self, user_id, lease):
+        conn = self._connect()
+        try:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                admission = self._acquire(conn, user_id, lease, time.time())
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return self._count(admission)
+
+    def _acquire(self, conn, user_id, lease, now):
+        conn.execute("DELETE FROM rate_leases WHERE expires <= ?", (now,))
+        if conn.execute("SELECT 1 FROM rate_leases WHERE lease = ?", (lease,)).fetchone():
+            return Admission(True, 0, "duplicate")
+        if self.max_in_flight:
+            (in_flight,) = conn.execute("SELECT COUNT(*) FROM rate_leases").fetchone()
+            if in_flight >= self.max_in_flight:
+                return Admission(False, BUSY_RETRY_AFTER, "busy")
+
+        if self.rate > 0:
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE user_id = ?", (user_id,)).fetchone()
+            tokens = _refill(*(row or (self.burst, now)), now, self.rate, self.burst)
+            if tokens < 1:
+                conn.execute("REPLACE INTO rate_buckets VALUES (?, ?, ?)", (user_id, tokens, now))
+                return Admission(False, math.ceil((1 - tokens) / self.rate), "rate")
+            conn.execute("REPLACE INTO rate_buckets VALUES (?, ?, ?)", (user_id, tokens - 1, now))
+
+        conn.execute("INSERT INTO rate_leases VALUES (?, ?, ?)", (lease, user_id, now + self.lease_seconds))
+        return Admission(True, 0, "ok")
+
+    def release(self, lease):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM rate_leases WHERE lease = ?", (lease,))
+
+    def stats(self):
+        with self._transaction() as conn:
+            (in_flight,) = conn.execute("SELECT COUNT(*) FROM rate_leases WHERE expires > ?", (time.time(),)).fetchone()
+        return self._stats("sqlite", in_flight)
+
+
+def create_limiter(url=None, rate_per_minute=6, burst=3, max_in_flight=32, lease_seconds=900):
+    """In-process limiter by default; sqlite:///path/to/file.db shares it between worker processes."""
+    kwargs = dict(rate_per_minute=rate_per_minute, burst=burst, max_in_flight=max_in_flight,
+                  lease_seconds=lease_seconds)
+    if url and url.startswith("sqlite:///"):
+        return SQLiteRateLimiter(url[len("sqlite:///"):], **kwargs)
+    if url:
+        raise ValueError(f"Unsupported RATE_LIMIT_URL: {url}")
+    return MemoryRateLimiter(**kwargs)
@@ -0,0 +1,204 @@
+import contextlib
+import json
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+# A session's expiry is pushed back at most this often (seconds) instead of on every request
+TOUCH_INTERVAL = 60
+
+
+class SQLiteSessionStore:
+    """Session data in a SQLite file shared by every worker process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT, expires REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Connection for one transaction: committed (or rolled back) and closed afterwards."""
+        # sqlite3's own context manager only commits; closing() releases the file handle
+        with contextlib.closing(self._connect()) as conn, conn:
+            yield conn
+
+    def get(self, sid):
+        """Returns (data, expires_at) or None if the session is unknown or has expired."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?",
+                               (sid, time.time())).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, sid, data, ttl):
+        with self._transaction() as conn:
+            conn.execute("REPLACE INTO sessions VALUES (?, ?, ?)", (sid, json.dumps(data), time.time() + ttl))
+            self._prune(conn)
+
+    def touch(self, sid, ttl):
+        with self._transaction() as conn:
+            conn.execute("UPDATE sessions SET expires = ? WHERE sid = ?", (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def _prune(self, conn):
+        # Expired rows are never read again; clear them out every so many writes
+        with self._lock:
+            self._writes += 1
+            due = self._writes % 1000 == 0
+        if due:
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+
+
+class RedisSessionStore:
+    """Session data in a Redis-compatible server; expiry is left to the server."""
+
+    def __init__(self, url, prefix="session:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a redis:// session store URL")
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        pipe = self._client.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.ttl(self.prefix + sid)
+        raw, ttl = pipe.execute()
+        if raw is None:
+            return None
+        return json.loads(raw), time.time() + max(ttl, 0)
+
+    def set(self, sid, data, ttl):
+        self._client.set(self.prefix + sid, json.dumps(data), ex=int(ttl))
+
+    def touch(self, sid, ttl):
+        self._client.expire(self.prefix + sid, int(ttl))
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+
+def create_store(url=None):
+    """None for the default signed-cookie sessions; sqlite:///path or redis://... for a shared store."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    raise ValueError(f"Unsupported SESSION_STORE_URL: {url}")
+
+
+def _signer(app):
+    return Signer(app.secret_key, salt="session-id")
+
+
+def open_stored_session(interface, app, request, store):
+    """Loads the session named by the request's cookie, or starts an empty one with a new ID.
+
+    Shared by the Flask and Quart interfaces; `interface` supplies the cookie settings and
+    session class.
+    """
+    sid = record = None
+    cookie = request.cookies.get(interface.get_cookie_name(app))
+    if cookie:
+        try:
+            sid = _signer(app).unsign(cookie).decode()
+        except BadSignature:
+            sid = None
+    if sid:
+        record = store.get(sid)
+    if record is None:
+        session = interface.session_class()
+        session.sid, session.expires = secrets.token_urlsafe(32), None
+    else:
+        session = interface.session_class(record[0])
+        session.sid, session.expires = sid, record[1]
+    return session
+
+
+def rotate_session(session):
+    """Moves a stored session to a new ID; call on login and logout against session fixation.
+
+    The row under the old ID is deleted when the session is saved. Cookie sessions carry
+    their data in the signed cookie and have no ID, so nothing changes for them.
+    """
+    if getattr(session, "sid", None) is None:
+        return
+    if getattr(session, "previous_sid", None) is None:
+        session.previous_sid = session.sid
+    session.sid = secrets.token_urlsafe(32)
+    session.expires = None
+    session.modified = True
+
+
+def save_stored_session(interface, app, session, response, store):
+    """Writes a changed session to the store and (re)sets its cookie; clearing it deletes both."""
+    if getattr(session, "previous_sid", None) is not None:
+        store.delete(session.previous_sid)
+        session.previous_sid = None
+    name = interface.get_cookie_name(app)
+    cookie_args = dict(domain=interface.get_cookie_domain(app), path=interface.get_cookie_path(app),
+                       secure=interface.get_cookie_secure(app), samesite=interface.get_cookie_samesite(app),
+                       httponly=interface.get_cookie_httponly(app))
+    if session.accessed:
+        response.vary.add("Cookie")
+
+    if not session:
+        if session.modified:
+            store.delete(session.sid)
+            response.delete_cookie(name, **cookie_args)
+            response.vary.add("Cookie")
+        return
+
+    ttl = app.permanent_session_lifetime.total_seconds()
+    if session.modified:
+        store.set(session.sid, dict(session), ttl)
+    elif (interface.should_set_cookie(app, session)
+          and (session.expires is None or session.expires - time.time() < ttl - TOUCH_INTERVAL)):
+        store.touch(session.sid, ttl)
+    else:
+        return
+
+    response.set_cookie(name, _signer(app).sign(session.sid).decode(),
+                        expires=interface.get_expiration_time(app, session), **cookie_args)
+    response.vary.add("Cookie")
+
+
+class StoredSession(SecureCookieSession):
+    """Flask session whose data lives in a store; the cookie only carries its signed ID."""
+
+
+class StoreSessionInterface(SessionInterface):
+    """Flask session interface backed by a SQLiteSessionStore or RedisSessionStore.
+
+    Every worker and node pointed at the same store (and configured with the same
+    SECRET_KEY) sees the same sessions, and logging out removes the session everywhere.
+    Stored sessions expire after `permanent_session_lifetime`.
+    """
+
+    session_class = StoredSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        return open_stored_session(self, app, request, self.store)
+
+    def save_session(self, app, session, response):
+        save_stored_session(self, app, session, response, self.store)